@@ -0,0 +1,236 @@
+import argparse
+import datetime
+import json
+import os
+from pathlib import Path
+import time
+from multiprocessing.dummy import Pool as ThreadPool
+
+import yaml
+
+from lib.lazy import lazy_import
+from lib.lib import write_gdf
+from lib.db import Postgres
+from lib.search import attrib_arg_lut, get_footprints_cached
+from lib.logging_utils import create_logger
+from lib.transport import report_metrics
+
+# Imported on first use, so e.g. --help is quick
+gpd = lazy_import('geopandas')
+pd = lazy_import('pandas')
+
+logger = create_logger(__name__, 'sh', 'INFO')
+
+# Keys in job file
+k_defaults = 'defaults'
+k_jobs = 'jobs'
+k_name = 'name'
+k_aoi = 'aoi'
+k_attrib_args = 'attrib_args'
+k_load_filter = 'load_filter'
+# Column that footprints are tagged with the name of their job in
+tag_field = 'job'
+# Keys in job results
+k_count = 'count'
+k_seconds = 'seconds'
+k_status = 'status'
+k_footprints = 'footprints'
+
+
+def read_jobs(jobs_file):
+    """
+    Read a YAML or JSON file of search jobs. Each job has the parameters
+    of lib.search.create_search, e.g.:
+        defaults:
+          item_types: [PSScene4Band]
+          asset_filters: [basic_analytic]
+          attrib_args: {max_cc: 0.2, instrument: [PS2]}
+        jobs:
+          - name: site_a_summer
+            aoi: aois/site_a.shp
+            attrib_args: {min_date: 2019-06-01, max_date: 2019-08-31}
+          - name: site_b_winter
+            aoi: aois/site_b.shp
+            months: ['12', '01']
+    Parameters in defaults apply to all jobs, with attrib_args merged.
+    Relative paths are relative to the job file. The file can also be a
+    list of jobs, without defaults.
+
+    Returns
+    -------
+    list : dict of parameters for each job
+    """
+    jobs_file = Path(jobs_file)
+    with open(jobs_file, 'r') as src:
+        if jobs_file.suffix == '.json':
+            contents = json.load(src)
+        else:
+            contents = yaml.safe_load(src)
+    if isinstance(contents, list):
+        contents = {k_jobs: contents}
+    defaults = contents.get(k_defaults, {})
+
+    jobs = []
+    for job_params in contents[k_jobs]:
+        job = dict(defaults)
+        job.update(job_params)
+        # Unspecified attributes are None, as from search4footprints.py
+        attrib_args = {k: None for k in attrib_arg_lut}
+        attrib_args.update(defaults.get(k_attrib_args, {}))
+        attrib_args.update(job_params.get(k_attrib_args, {}))
+        # YAML reads unquoted dates as dates
+        job[k_attrib_args] = {k: v.strftime('%Y-%m-%d')
+                              if isinstance(v, datetime.date) else v
+                              for k, v in attrib_args.items()}
+        for path_key in (k_aoi, k_load_filter):
+            if job.get(path_key):
+                job[path_key] = str(jobs_file.parent / job[path_key])
+        jobs.append(job)
+
+    names = [j[k_name] for j in jobs]
+    if len(set(names)) != len(names):
+        logger.error('Job names must be unique.')
+        raise ValueError('Duplicate job names in: {}'.format(jobs_file))
+
+    return jobs
+
+
+def run_job(job, out_dir=None, cache_ttl=None, overwrite_saved=True,
+            dryrun=False):
+    """Run a search job, capturing any error so other jobs continue."""
+    name = job[k_name]
+    start = time.time()
+    result = {k_name: name, k_count: None, k_status: 'ok',
+              k_footprints: None}
+    try:
+        footprints = get_footprints_cached(out_dir=out_dir,
+                                           cache_ttl=cache_ttl,
+                                           overwrite_saved=overwrite_saved,
+                                           dryrun=dryrun, **job)
+        result[k_count] = len(footprints)
+        result[k_footprints] = footprints
+    except Exception as e:
+        logger.error('Job "{}" failed: {}'.format(name, repr(e)))
+        result[k_status] = 'error: {}'.format(repr(e))
+    result[k_seconds] = time.time() - start
+    logger.info('Job "{}" finished in {:.1f}s: {}'.format(
+        name, result[k_seconds], result[k_status]))
+
+    return result
+
+
+def combine_results(results, tag=True):
+    """Combine footprints from all jobs, optionally tagged with the job
+    name."""
+    footprints = []
+    for r in results:
+        if r[k_footprints] is None or len(r[k_footprints]) == 0:
+            continue
+        fps = r[k_footprints]
+        if tag:
+            fps = fps.copy()
+            fps[tag_field] = r[k_name]
+        footprints.append(fps)
+    if not footprints:
+        return gpd.GeoDataFrame()
+
+    return gpd.GeoDataFrame(pd.concat(footprints), geometry='geometry',
+                            crs='epsg:4326')
+
+
+def log_summary(results, elapsed):
+    name_width = max([len(r[k_name]) for r in results] + [4])
+    lines = ['{:<{w}}  {:>10}  {:>8}  {}'.format('Job', 'Footprints',
+                                                 'Seconds', 'Status',
+                                                 w=name_width)]
+    for r in results:
+        count = '{:,}'.format(r[k_count]) if r[k_count] is not None else '-'
+        lines.append('{:<{w}}  {:>10}  {:>8.1f}  {}'.format(
+            r[k_name], count, r[k_seconds], r[k_status], w=name_width))
+    total = sum([r[k_count] for r in results if r[k_count]])
+    failed = len([r for r in results if r[k_status] != 'ok'])
+    lines.append('{:,} jobs ({:,} failed), {:,} footprints in '
+                 '{:.1f}s'.format(len(results), failed, total, elapsed))
+    logger.info('Summary:\n{}'.format('\n'.join(lines)))
+
+
+def batch_search(jobs_file, threads=4, out_dir=None, out_path=None,
+                 to_tbl=None, tag=True, cache_ttl=None,
+                 overwrite_saved=True, dryrun=False):
+    jobs = read_jobs(jobs_file)
+    logger.info('Running {:,} search jobs with {} threads...'.format(
+        len(jobs), threads))
+    start = time.time()
+    pool = ThreadPool(threads)
+    results = pool.map(lambda job: run_job(job, out_dir=out_dir,
+                                           cache_ttl=cache_ttl,
+                                           overwrite_saved=overwrite_saved,
+                                           dryrun=dryrun),
+                       jobs)
+    pool.close()
+    pool.join()
+
+    if out_path or to_tbl:
+        footprints = combine_results(results, tag=tag)
+        logger.info('Combined footprints: {:,}'.format(len(footprints)))
+        if len(footprints) != 0:
+            if out_path:
+                logger.info('Writing combined footprints to: '
+                            '{}'.format(out_path))
+                write_gdf(footprints, out_path)
+            if to_tbl:
+                with Postgres() as db:
+                    db.insert_new_records(footprints, table=to_tbl,
+                                          dryrun=dryrun)
+    log_summary(results, time.time() - start)
+    report_metrics()
+
+    return results
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(
+        description="Run a number of searches for footprints, defined in a "
+        "YAML or JSON job file, concurrently. All searches share one "
+        "rate-limited connection pool to the Planet API. Each job's "
+        "footprints can be written to --out_dir, and/or all footprints "
+        "combined, tagged with the job name in a '{}' field, written to "
+        "--out_path and/or --to_tbl. See batch_search.read_jobs for the job "
+        "file format.".format(tag_field),
+        formatter_class=argparse.RawTextHelpFormatter,
+    )
+    parser.add_argument('jobs_file', type=os.path.abspath,
+                        help='YAML or JSON file of search jobs.')
+    parser.add_argument('-t', '--threads', type=int, default=4,
+                        help='Number of jobs to run concurrently.')
+    parser.add_argument('-od', '--out_dir', type=os.path.abspath,
+                        help='Directory to write each job\'s footprints '
+                             'to, named by job.')
+    parser.add_argument('-op', '--out_path', type=os.path.abspath,
+                        help='Path to write all footprints to.')
+    parser.add_argument('--to_tbl', type=str,
+                        help='Insert all footprints into this table.')
+    parser.add_argument('--no_tag', action='store_true',
+                        help='Do not add the "{}" field to combined '
+                             'footprints, e.g. to insert into the scenes '
+                             'table.'.format(tag_field))
+    parser.add_argument('--cache_ttl', type=float,
+                        help='Hours that locally cached results for an '
+                             'identical search are reused.')
+    parser.add_argument('--no_overwrite_saved', action='store_true',
+                        help='Fail jobs whose name matches an existing '
+                             'saved search rather than replacing it.')
+    parser.add_argument('-d', '--dryrun', action='store_true',
+                        help='Do not write to --to_tbl.')
+
+    args = parser.parse_args()
+
+    batch_search(jobs_file=args.jobs_file,
+                 threads=args.threads,
+                 out_dir=args.out_dir,
+                 out_path=args.out_path,
+                 to_tbl=args.to_tbl,
+                 tag=not args.no_tag,
+                 cache_ttl=args.cache_ttl,
+                 overwrite_saved=not args.no_overwrite_saved,
+                 dryrun=args.dryrun)
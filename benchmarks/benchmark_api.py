@@ -0,0 +1,112 @@
+"""
+Benchmark searching and ordering against the local mock Planet API
+(mock_planet_server.py), reporting features/sec and requests/sec for
+lib.search.create_search, lib.search.get_features and
+lib.order.submit_order. Run from the repository root:
+
+    python benchmarks/benchmark_api.py --features 10000 --latency 0.05
+"""
+import argparse
+import os
+from pathlib import Path
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, str(Path(__file__).parent.parent))
+sys.path.insert(0, str(Path(__file__).parent))
+
+from mock_planet_server import MockPlanetServer
+
+
+def timed(server, fxn, *args, **kwargs):
+    """Run fxn, returning its result, the seconds taken and the count of
+    requests the server received."""
+    start_requests = server.state.request_count
+    start = time.perf_counter()
+    result = fxn(*args, **kwargs)
+    elapsed = time.perf_counter() - start
+
+    return result, elapsed, server.state.request_count - start_requests
+
+
+def report(name, elapsed, requests, items=None, item_name='features'):
+    line = '{:<14} {:>8.2f}s {:>7,} requests {:>9.1f} requests/s'.format(
+        name, elapsed, requests, requests / elapsed)
+    if items is not None:
+        line += ' {:>9,} {} {:>10.1f} {}/s'.format(items, item_name,
+                                                    items / elapsed,
+                                                    item_name)
+    print(line)
+
+
+def run_benchmarks(server, repeat=1, order_ids=1000, tmp_dir=None):
+    from lib import search
+    from lib.search_registry import SearchRegistry
+    # Keep saved searches for the mock API separate from any real ones
+    search.registry = SearchRegistry(
+        search.get_session(), search.SEARCH_URL,
+        cache_path=Path(tmp_dir) / 'saved_searches.json')
+
+    attrib_args = {'min_date': '2020-01-01', 'max_cc': 0.5}
+    for i in range(repeat):
+        (ss_id, count), elapsed, requests = timed(
+            server, search.create_search, name='benchmark',
+            item_types=['PSScene4Band'], attrib_args=attrib_args,
+            overwrite_saved=True)
+        report('create_search', elapsed, requests)
+
+        footprints, elapsed, requests = timed(
+            server, search.get_features, saved_search_id=ss_id,
+            total_count=count, resume=False)
+        report('get_features', elapsed, requests, items=len(footprints))
+        search.SearchCheckpoint(ss_id).clear()
+
+    if not order_ids:
+        return
+    from lib import order
+    ids_path = Path(tmp_dir) / 'ids.txt'
+    with open(ids_path, 'w') as dst:
+        dst.write('\n'.join(['id_{}'.format(i) for i in range(order_ids)]))
+    for i in range(repeat):
+        submitted, elapsed, requests = timed(
+            server, order.submit_order, name='benchmark', ids_path=ids_path,
+            selection_path=None, product_bundle='basic_analytic',
+            remove_onhand=False,
+            journal_path=Path(tmp_dir) / 'journal_{}.jsonl'.format(i))
+        report('submit_order', elapsed, requests, items=len(submitted),
+               item_name='orders')
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__,
+                                     formatter_class=argparse.RawTextHelpFormatter)
+    parser.add_argument('--features', type=int, default=5000,
+                        help='Features returned by the search.')
+    parser.add_argument('--page_size', type=int, default=250,
+                        help='Max features per page of results.')
+    parser.add_argument('--latency', type=float, default=0.0,
+                        help='Seconds added to each response.')
+    parser.add_argument('--rate_429', type=float, default=0.0,
+                        help='Fraction of requests answered with 429.')
+    parser.add_argument('--order_ids', type=int, default=1000,
+                        help='IDs to order (500 per order), 0 to skip '
+                             'ordering.')
+    parser.add_argument('--repeat', type=int, default=1)
+    args = parser.parse_args()
+
+    with MockPlanetServer(feature_count=args.features,
+                          page_size=args.page_size,
+                          latency=args.latency,
+                          rate_429=args.rate_429) as server, \
+            tempfile.TemporaryDirectory() as tmp_dir:
+        # Must be set before lib.search / lib.order are imported
+        os.environ['PL_API_URL'] = server.url
+        os.environ.setdefault('PL_API_KEY', 'benchmark')
+        print('Mock Planet API at: {}'.format(server.url))
+        run_benchmarks(server, repeat=args.repeat, order_ids=args.order_ids,
+                       tmp_dir=tmp_dir)
+        print('Requests throttled (429): {:,}'.format(
+            server.state.throttled_count))
+        from lib.transport import report_metrics
+        report_metrics()
@@ -0,0 +1,81 @@
+"""
+Benchmark the startup time of each command line tool, running
+"<tool> --help" in a new interpreter, which measures importing the tool
+and the lib modules it uses. Requests to the Planet API are pointed at a
+closed local port, so tools that contact the API on import fail, as
+they would offline. Run from the repository root:
+
+    python benchmarks/benchmark_startup.py --repeat 5
+    python benchmarks/benchmark_startup.py manage_searches.py --modules 10
+"""
+import argparse
+import os
+from pathlib import Path
+import re
+import statistics
+import subprocess
+import sys
+import time
+
+repo_dir = Path(__file__).parent.parent
+# Entry points, scripts at the top level of the repository
+default_tools = sorted([p.name for p in repo_dir.glob('*.py')])
+# Nothing listens here, so any API request is refused
+offline_url = 'http://127.0.0.1:9'
+
+
+def run_tool(tool, importtime=False):
+    """Run tool --help, returning (seconds, return code, stderr)."""
+    cmd = [sys.executable]
+    if importtime:
+        cmd += ['-X', 'importtime']
+    cmd += [str(repo_dir / tool), '--help']
+    env = dict(os.environ, PL_API_URL=offline_url)
+    start = time.perf_counter()
+    proc = subprocess.run(cmd, cwd=str(repo_dir), env=env,
+                          stdout=subprocess.DEVNULL, stderr=subprocess.PIPE,
+                          universal_newlines=True)
+
+    return time.perf_counter() - start, proc.returncode, proc.stderr
+
+
+def slowest_imports(stderr, n):
+    """Parse -X importtime output for the n imports with the largest
+    cumulative time, in seconds."""
+    imports = []
+    for line in stderr.splitlines():
+        m = re.match(r'import time:\s+(\d+) \|\s+(\d+) \|(\s*)(\S+)', line)
+        if m:
+            # Only top-level imports, nested ones are included in these
+            if len(m.group(3)) <= 1:
+                imports.append((int(m.group(2)) / 1e6, m.group(4)))
+
+    return sorted(imports, reverse=True)[:n]
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__,
+                                     formatter_class=argparse.RawTextHelpFormatter)
+    parser.add_argument('tools', nargs='*', default=default_tools,
+                        help='Tools to benchmark, default all.')
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--modules', type=int, default=0,
+                        help='Also list this many of the slowest imports '
+                             'of each tool.')
+    args = parser.parse_args()
+
+    print('{:<26} {:>8} {:>8} {}'.format('Tool', 'Median', 'Min',
+                                         'Status'))
+    for tool in args.tools:
+        times = []
+        for i in range(args.repeat):
+            seconds, returncode, stderr = run_tool(tool)
+            times.append(seconds)
+        status = 'ok' if returncode == 0 else 'failed ({}): {}'.format(
+            returncode, (stderr.strip().splitlines() or [''])[-1][:60])
+        print('{:<26} {:>7.2f}s {:>7.2f}s {}'.format(
+            tool, statistics.median(times), min(times), status))
+        if args.modules:
+            _seconds, _returncode, stderr = run_tool(tool, importtime=True)
+            for seconds, module in slowest_imports(stderr, args.modules):
+                print('    {:>7.2f}s {}'.format(seconds, module))
@@ -0,0 +1,318 @@
+"""
+Local stand-in for the parts of the Planet Data and Orders APIs used by
+lib.search and lib.order, for benchmarking and testing without using
+quota. Point the library at it by setting PL_API_URL before importing:
+
+    python benchmarks/mock_planet_server.py --port 8765
+    PL_API_URL=http://localhost:8765 python search4footprints.py ...
+
+Every saved search returns the same synthetic footprints.
+"""
+import argparse
+import datetime
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import json
+import random
+import threading
+import time
+from urllib.parse import parse_qs, urlparse
+import uuid
+
+DATA_PATH = '/data/v1'
+SEARCHES_PATH = '{}/searches'.format(DATA_PATH)
+STATS_PATH = '{}/stats'.format(DATA_PATH)
+ORDERS_PATH = '/compute/ops/orders/v2'
+ORDERS_STATS_PATH = '/compute/ops/stats/orders/v2'
+
+# Seconds after being placed that an order is reported as running,
+# then as success
+order_running_after = 1
+order_success_after = 3
+# Orders per page of the orders list
+orders_page_size = 20
+
+
+def synthetic_feature(i, item_type='PSScene4Band'):
+    """Footprint of a ~25 x 12 km scene, at a position and date derived
+    from i."""
+    acquired = (datetime.datetime(2020, 1, 1) +
+                datetime.timedelta(minutes=17 * i))
+    x = -180 + (i * 0.37) % 360
+    y = -60 + (i * 0.13) % 120
+    coords = [[x, y], [x + 0.25, y], [x + 0.25, y + 0.12], [x, y + 0.12],
+              [x, y]]
+    ts = acquired.strftime('%Y-%m-%dT%H:%M:%S.%fZ')
+
+    return {
+        'type': 'Feature',
+        'id': '{}_{:04d}_{:04x}'.format(acquired.strftime('%Y%m%d_%H%M%S'),
+                                        i % 10000, i % 65536),
+        'geometry': {'type': 'Polygon', 'coordinates': [coords]},
+        'properties': {
+            'acquired': ts, 'published': ts, 'updated': ts,
+            'item_type': item_type, 'cloud_cover': (i % 100) / 100,
+            'instrument': 'PS2', 'provider': 'planetscope',
+            'satellite_id': '{:04x}'.format(i % 256), 'strip_id': str(i),
+            'quality_category': 'standard', 'ground_control': True,
+            'gsd': 3.9, 'pixel_resolution': 3, 'epsg_code': 32601,
+            'origin_x': x, 'origin_y': y, 'rows': 4000, 'columns': 8000,
+            'sun_azimuth': 150.0, 'sun_elevation': 30.0,
+            'view_angle': 2.5, 'anomalous_pixels': 0,
+        }
+    }
+
+
+class MockPlanetState:
+    def __init__(self, feature_count=1000, page_size=250, latency=0.0,
+                 rate_429=0.0, seed=0):
+        """
+        Parameters
+        ----------
+        feature_count : int
+            Features returned by every search.
+        page_size : int
+            Max features per page of results, regardless of the
+            _page_size requested.
+        latency : float
+            Seconds added to every response.
+        rate_429 : float
+            Fraction of requests answered with 429 Too Many Requests.
+        seed : int
+            Seed for 429 injection.
+        """
+        self.feature_count = feature_count
+        self.page_size = page_size
+        self.latency = latency
+        self.rate_429 = rate_429
+        self.random = random.Random(seed)
+        self.searches = {}
+        self.orders = {}
+        self.request_count = 0
+        self.throttled_count = 0
+        self.lock = threading.Lock()
+
+    def order_state(self, order):
+        age = time.time() - order['_placed']
+        if age > order_success_after:
+            return 'success'
+        if age > order_running_after:
+            return 'running'
+        return 'queued'
+
+    def order_response(self, order):
+        state = self.order_state(order)
+        changed = {'queued': 0, 'running': order_running_after,
+                   'success': order_success_after}[state]
+        last_modified = datetime.datetime.utcfromtimestamp(
+            order['_placed'] + changed)
+        return dict(order, state=state,
+                    last_modified=last_modified.isoformat() + 'Z')
+
+
+class MockPlanetHandler(BaseHTTPRequestHandler):
+    state = None
+
+    def log_message(self, format, *args):
+        pass
+
+    def _send(self, status, body=None):
+        data = json.dumps(body).encode() if body is not None else b''
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def _read_json(self):
+        length = int(self.headers.get('Content-Length', 0))
+        if not length:
+            return {}
+        return json.loads(self.rfile.read(length))
+
+    def _url(self, path):
+        return 'http://{}:{}{}'.format(*self.server.server_address[:2], path)
+
+    def _throttle(self):
+        """Count request, apply latency, return True if request should
+        be answered with a 429."""
+        state = self.state
+        with state.lock:
+            state.request_count += 1
+            throttle = state.random.random() < state.rate_429
+            if throttle:
+                state.throttled_count += 1
+        if state.latency:
+            time.sleep(state.latency)
+        if throttle:
+            self._send(429, {'message': 'Too Many Requests'})
+        return throttle
+
+    def do_GET(self):
+        if self._throttle():
+            return
+        url = urlparse(self.path)
+        path = url.path.rstrip('/')
+        query = parse_qs(url.query)
+        parts = path.split('/')
+        state = self.state
+
+        if path == DATA_PATH:
+            self._send(200, {'_links': {}})
+        elif path == SEARCHES_PATH:
+            self._send(200, {'searches': list(state.searches.values()),
+                             '_links': {}})
+        elif path.startswith(SEARCHES_PATH) and parts[-1] == 'results':
+            search_id = parts[-2]
+            if search_id not in state.searches:
+                self._send(404, {'message': 'Search not found'})
+                return
+            page = int(query.get('_page', [0])[0])
+            page_size = min(int(query.get('_page_size', [250])[0]),
+                            state.page_size)
+            start = page * page_size
+            end = min(start + page_size, state.feature_count)
+            features = [synthetic_feature(i) for i in range(start, end)]
+            links = {}
+            if end < state.feature_count:
+                links['_next'] = self._url(
+                    '{}/{}/results?_page={}&_page_size={}'.format(
+                        SEARCHES_PATH, search_id, page + 1, page_size))
+            self._send(200, {'type': 'FeatureCollection',
+                             'features': features, '_links': links})
+        elif path.startswith(SEARCHES_PATH):
+            search = state.searches.get(parts[-1])
+            if search:
+                self._send(200, search)
+            else:
+                self._send(404, {'message': 'Search not found'})
+        elif path == ORDERS_STATS_PATH:
+            states = [state.order_state(o) for o in state.orders.values()]
+            self._send(200, {'user': {
+                'queued_orders': states.count('queued'),
+                'running_orders': states.count('running')}})
+        elif path == ORDERS_PATH:
+            # Newest first
+            orders = sorted(state.orders.values(),
+                            key=lambda o: o['_placed'], reverse=True)
+            page = int(query.get('_page', [0])[0])
+            start = page * orders_page_size
+            links = {}
+            if start + orders_page_size < len(orders):
+                links['next'] = self._url('{}?_page={}'.format(ORDERS_PATH,
+                                                               page + 1))
+            self._send(200, {'orders': [
+                state.order_response(o)
+                for o in orders[start:start + orders_page_size]],
+                '_links': links})
+        elif path.startswith(ORDERS_PATH):
+            order = state.orders.get(parts[-1])
+            if order:
+                self._send(200, state.order_response(order))
+            else:
+                self._send(404, {'message': 'Order not found'})
+        else:
+            self._send(404, {'message': 'Not found'})
+
+    def do_POST(self):
+        if self._throttle():
+            return
+        path = urlparse(self.path).path.rstrip('/')
+        body = self._read_json()
+        state = self.state
+
+        if path == STATS_PATH:
+            self._send(200, {'buckets': [{'count': state.feature_count}]})
+        elif path == SEARCHES_PATH:
+            search_id = uuid.uuid4().hex
+            search = {'id': search_id, 'name': body.get('name'),
+                      'filter': body.get('filter'),
+                      'item_types': body.get('item_types'),
+                      'created': datetime.datetime.utcnow().isoformat(),
+                      '_links': {'_results': self._url(
+                          '{}/{}/results'.format(SEARCHES_PATH, search_id))}}
+            with state.lock:
+                state.searches[search_id] = search
+            self._send(200, search)
+        elif path == ORDERS_PATH:
+            order_id = str(uuid.uuid4())
+            placed = time.time()
+            order = {'id': order_id, 'name': body.get('name'),
+                     'products': body.get('products'),
+                     'created_on': datetime.datetime.utcfromtimestamp(
+                         placed).isoformat() + 'Z',
+                     '_placed': placed}
+            with state.lock:
+                state.orders[order_id] = order
+            self._send(202, state.order_response(order))
+        else:
+            self._send(404, {'message': 'Not found'})
+
+    def do_PUT(self):
+        self.do_DELETE()
+
+    def do_DELETE(self):
+        if self._throttle():
+            return
+        parts = urlparse(self.path).path.rstrip('/').split('/')
+        state = self.state
+        with state.lock:
+            removed = (state.searches.pop(parts[-1], None) or
+                       state.orders.pop(parts[-1], None))
+        self._send(204 if removed else 404)
+
+
+class MockPlanetServer:
+    def __init__(self, host='localhost', port=0, **kwargs):
+        """Mock Planet API server, run in a background thread. Port 0
+        picks a free port. kwargs are passed to MockPlanetState."""
+        self.state = MockPlanetState(**kwargs)
+        handler = type('Handler', (MockPlanetHandler,), {'state': self.state})
+        self.httpd = ThreadingHTTPServer((host, port), handler)
+        self.thread = None
+
+    @property
+    def url(self):
+        return 'http://{}:{}'.format(*self.httpd.server_address[:2])
+
+    def start(self):
+        self.thread = threading.Thread(target=self.httpd.serve_forever,
+                                       daemon=True)
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.stop()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__,
+                                     formatter_class=argparse.RawTextHelpFormatter)
+    parser.add_argument('--host', type=str, default='localhost')
+    parser.add_argument('--port', type=int, default=8765)
+    parser.add_argument('--features', type=int, default=1000,
+                        help='Features returned by each search.')
+    parser.add_argument('--page_size', type=int, default=250,
+                        help='Max features per page of results.')
+    parser.add_argument('--latency', type=float, default=0.0,
+                        help='Seconds added to each response.')
+    parser.add_argument('--rate_429', type=float, default=0.0,
+                        help='Fraction of requests answered with 429.')
+    args = parser.parse_args()
+
+    server = MockPlanetServer(host=args.host, port=args.port,
+                              feature_count=args.features,
+                              page_size=args.page_size,
+                              latency=args.latency,
+                              rate_429=args.rate_429)
+    print('Mock Planet API at: {}'.format(server.url))
+    try:
+        server.httpd.serve_forever()
+    except KeyboardInterrupt:
+        server.httpd.server_close()
@@ -1,15 +1,16 @@
 import argparse
 import os
-import requests
-from retrying import retry
-import time
-
-import geopandas as gpd
 
+from lib.lazy import lazy_import
 from lib.logging_utils import create_logger
 from lib.db import Postgres
-from lib.search import get_stereo_pairs, pairs_to_list, \
-    create_order_request, place_order
+from lib.order import get_stereo_pairs, pairs_to_list, \
+    create_order_requests, get_order_registry, place_order
+from lib.order_scheduler import OrderJournal, OrderScheduler, \
+    default_journal_path, default_threads
+
+# Imported on first use, so e.g. --help is quick
+gpd = lazy_import('geopandas')
 
 # TODO: Change view_angle diff to off-nadir diff, add all parameters of updated query
 logger = create_logger(__name__, 'sh', 'INFO')
@@ -19,32 +20,6 @@ scenes_onhand_tbl = 'scenes_onhand'
 scene_id = 'id'
 
 
-@retry(wait_exponential_multiplier=1000, wait_exponential_max=10000)
-def count_concurrent_orders():
-    # TODO: Move these to a config file
-    orders_url = 'https://api.planet.com/compute/ops/stats/orders/v2'
-    PLANET_API_KEY = os.getenv('PL_API_KEY')
-    if not PLANET_API_KEY:
-        logger.error('Error retrieving API key. Is PL_API_KEY env. variable set?')
-
-    with requests.Session() as s:
-        logger.error('Authorizing using Planet API key...')
-        s.auth = (PLANET_API_KEY, '')
-
-        res = s.get(orders_url)
-        if res.status_code == 200:
-            order_statuses = res.json()['user']
-            queued = order_statuses['queued_orders']
-            running = order_statuses['running_orders']
-            total = queued + running
-        else:
-            logger.error(res.status_code)
-            logger.error(res.reason)
-            raise Exception
-
-    return total
-
-
 def main(args):
     name = args.order_name
     # ids_path = args.ids
@@ -95,41 +70,23 @@ def main(args):
         stereo_ids = list(set(stereo_ids) - onhand)
         logger.info('IDs remaining: {:,}'.format(len(stereo_ids)))
 
-    # Limits are 500 ids per order, 80 concurrent orders
-    assets_per_order = 500
-    max_concur = 80
-    ids_chunks = [stereo_ids[i:i + assets_per_order]
-                  for i in range(0, len(stereo_ids), assets_per_order)]
-
-    for i, ids in enumerate(ids_chunks):
-        order_name = '{}_{}'.format(name, i)
-        order_request = create_order_request(order_name=order_name, ids=ids)
-        order_submitted = False
-        while order_submitted is False:
-            concurrent_orders = count_concurrent_orders()
-            logger.info('Concurrent orders: {}'.format(concurrent_orders))
-            if concurrent_orders < max_concur:
-                # Submit
-                if not dryrun:
-                    logger.info('Submitting order: {}'.format(order_name))
-                    order_id, order_url = place_order(order_request=order_request)
-                    logger.info('Order ID: {}'.format(order_id))
-                    logger.info('Order URL: {}'.format(order_url))
-                    # success = poll_for_success(order_id=order_id)
-                    # if success:
-                    #     logger.info("Order placed successfully.")
-                    # else:
-                    #     logger.warning("Order placement did not finish.")
-                    order_submitted = True
-                else:
-                    logger.info('(dryrun) Order submitted: {}'.format(order_name))
-                    order_submitted = True
-            else:
-                logger.info('Concurrent orders reached ({}) waiting...'.format(max_concur))
-                time.sleep(10)
-
-        # Avoid submitting too fast
-        time.sleep(1)
+    # Orders are placed concurrently, up to the limit of concurrent
+    # orders, and recorded so rerunning does not order IDs again
+    journal_path = default_journal_path(name)
+    logger.info('Recording submissions in: {}'.format(journal_path))
+    journal = OrderJournal(journal_path)
+    scheduler = OrderScheduler(journal, place_order, threads=args.threads,
+                               registry=get_order_registry())
+    if not dryrun:
+        scheduler.resolve_unresolved()
+    order_requests = create_order_requests(name, stereo_ids, journal=journal)
+    if dryrun:
+        for order_request in order_requests:
+            logger.info('(dryrun) Order submitted: {}'.format(
+                order_request['name']))
+        return
+
+    scheduler.submit_all(order_requests)
 
 
 if __name__ == '__main__':
@@ -155,6 +112,8 @@ if __name__ == '__main__':
                         help='Maximum overlap percent to include.')
     parser.add_argument('--do_not_remove_onhand', action='store_true',
                         help='On hand IDs are removed by default. Use this flag to not remove.')
+    parser.add_argument('--threads', type=int, default=default_threads,
+                        help='Number of orders to place at once.')
     parser.add_argument('--dryrun', action='store_true',
                         help='Create order request, but do not place.')
 
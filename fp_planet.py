@@ -2,12 +2,15 @@ import argparse
 import os
 from pathlib import Path
 
-import shapely
-import geopandas as gpd
-
+from lib.lazy import lazy_import
 from lib.logging_utils import create_logger
 from lib.lib import write_gdf, find_planet_scenes
 
+# Imported on first use, so e.g. --help is quick
+shapely = lazy_import('shapely')
+lazy_import('shapely.wkt')
+gpd = lazy_import('geopandas')
+
 logger = create_logger(__name__, 'sh', 'INFO')
 
 choices_format = ['shp', 'gpkg', 'geojson']
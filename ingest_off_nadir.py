@@ -1,27 +1,23 @@
 import argparse
-import numpy as np
 import os
 import sys
 
-import pandas as pd
 from tqdm import tqdm
 
+from lib.lazy import lazy_import
 from lib.db import Postgres, generate_sql
 from lib.lib import get_config
 from lib.logging_utils import create_logger, create_logfile_path
 
+# Imported on first use, so e.g. --help is quick
+np = lazy_import('numpy')
+pd = lazy_import('pandas')
+
 
 logger = create_logger(__name__, 'sh', 'INFO')
 
-db_config = get_config('db')
-# planet_db = 'sandwich-pool.planet'
-planet_db = db_config['db_config']['host']
 off_nadir_tbl = 'off_nadir'
-# off_nadir_tbl_id = 'scene_name'
-off_nadir_tbl_id = db_config['tables'][off_nadir_tbl]['unique_id'][0]
 scenes_tbl = 'scenes'
-# scenes_tbl_id = 'id'
-scenes_tbl_id = db_config['tables'][scenes_tbl]['unique_id']
 
 # Existing field names in csvs
 off_nadir = 'sat.off_nadir'
@@ -37,6 +33,14 @@ def ingest_off_nadir(export_dir, onhand_scenes_only=True, new_only=True,
                      ext='.csv',
                      dryrun=False):
     """Ingest off-nadir files to a database table"""
+    # Read from the config file when run, rather than on import
+    db_config = get_config('db')
+    # planet_db = 'sandwich-pool.planet'
+    planet_db = db_config['db_config']['host']
+    # off_nadir_tbl_id = 'scene_name'
+    off_nadir_tbl_id = db_config['tables'][off_nadir_tbl]['unique_id'][0]
+    # scenes_tbl_id = 'id'
+    scenes_tbl_id = db_config['tables'][scenes_tbl]['unique_id']
     logger.info("Reading off-nadir csvs...")
     with Postgres() as db:
         if off_nadir_tbl in db.list_db_tables():
@@ -0,0 +1,192 @@
+import json
+import math
+
+from lib.lazy import lazy_import
+from lib.logging_utils import create_logger
+
+# Imported on first use
+gpd = lazy_import('geopandas')
+shapely = lazy_import('shapely')
+lazy_import('shapely.geometry')
+lazy_import('shapely.ops')
+
+logger = create_logger(__name__, 'sh', 'INFO')
+
+# Coordinate system of geometries in search filters
+crs = 'epsg:4326'
+# Approximate width of a PlanetScope scene footprint (~25 km), in
+# degrees. Preparation tolerances are fractions / multiples of this, as
+# AOI detail finer than a scene has little effect on which scenes match.
+scene_size = 0.25
+# Simplification tolerance, as a fraction of scene size (~500 m)
+simplify_fraction = 0.02
+# Parts smaller than this fraction of a scene's area are merged with
+# nearby parts into their convex hull
+small_part_fraction = 1.0
+# Max area of the hull of a group of small parts, relative to the group
+# buffered, above which the buffered group is used instead, so e.g. a
+# ring of islands does not become one hull covering the whole ring
+max_hull_ratio = 2.0
+# Default size of tiles for large AOIs, in scenes
+tile_scenes = 10
+
+
+def geom2json(geom):
+    """Convert a shapely geometry to a GeoJSON geometry dict (with lists,
+    not tuples, so it compares equal to the same geometry read back from
+    the API)."""
+    return json.loads(json.dumps(shapely.geometry.mapping(geom)))
+
+
+def count_vertices(geom):
+    if isinstance(geom, shapely.geometry.Polygon):
+        return (len(geom.exterior.coords) +
+                sum([len(i.coords) for i in geom.interiors]))
+    elif hasattr(geom, 'geoms'):
+        return sum([count_vertices(g) for g in geom.geoms])
+    elif hasattr(geom, 'coords'):
+        return len(geom.coords)
+    return 0
+
+
+def payload_size(geoms):
+    """Size in bytes of the GeoJSON for geoms."""
+    return len(json.dumps([geom2json(g) for g in geoms]))
+
+
+def read_aoi(aoi):
+    """Read an AOI from a vector file, if not already a GeoDataFrame, in
+    the coordinate system of search filters."""
+    if not isinstance(aoi, gpd.GeoDataFrame):
+        aoi = gpd.read_file(aoi)
+    if aoi.crs is not None and aoi.crs != crs:
+        aoi = aoi.to_crs(crs)
+
+    return aoi
+
+
+def explode_polygons(geoms):
+    parts = []
+    for g in geoms:
+        if isinstance(g, shapely.geometry.MultiPolygon):
+            parts.extend(list(g.geoms))
+        elif isinstance(g, shapely.geometry.Polygon):
+            parts.append(g)
+
+    return parts
+
+
+def hull_small_parts(parts, min_area, distance, max_ratio=max_hull_ratio):
+    """Replace groups of parts smaller than min_area that are within
+    distance of each other with the convex hull of the group, or, where
+    the hull is more than max_ratio times the area of the group buffered
+    by distance / 2 (e.g. a long chain or ring of parts), with the
+    buffered group, which also covers the parts."""
+    large = [p for p in parts if p.area >= min_area]
+    small = [p for p in parts if p.area < min_area]
+    if len(small) < 2:
+        return parts
+    # Buffered, the small parts dissolve into one polygon per group
+    groups = shapely.ops.unary_union([p.buffer(distance / 2) for p in small])
+    groups = explode_polygons([groups])
+    hulls = []
+    capped = 0
+    for group in groups:
+        members = [p for p in small if group.intersects(p)]
+        hull = shapely.ops.unary_union(members).convex_hull
+        if hull.area > max_ratio * group.area:
+            hull = group
+            capped += 1
+        hulls.append(hull)
+    logger.debug('Merged {:,} small AOI parts into {:,} hulls ({:,} '
+                 'buffered groups, hull too large)'.format(
+                     len(small), len(hulls), capped))
+
+    return large + hulls
+
+
+def prepare_aoi(aoi, tolerance=None, merge_small=True):
+    """
+    Reduce the size of an AOI for use in a search filter. Each geometry
+    is buffered then simplified by the same tolerance, so the result
+    always covers the original AOI (no scenes are lost, at most a few
+    extra are matched at the edges). Small parts are merged with nearby
+    parts into their convex hull, and overlapping parts are dissolved.
+
+    Parameters
+    ----------
+    aoi : str, gpd.GeoDataFrame
+        Path to vector file or GeoDataFrame of AOI.
+    tolerance : float
+        Simplification tolerance in degrees. Defaults to a fraction of a
+        PlanetScope scene's width.
+    merge_small : bool
+        Merge parts smaller than a scene into convex hulls.
+
+    Returns
+    -------
+    gpd.GeoDataFrame : prepared AOI, one row per polygon
+    """
+    aoi = read_aoi(aoi)
+    if tolerance is None:
+        tolerance = scene_size * simplify_fraction
+    in_geoms = [g for g in aoi.geometry if g is not None]
+
+    parts = explode_polygons([g.buffer(tolerance) for g in in_geoms])
+    if merge_small:
+        parts = hull_small_parts(parts,
+                                 min_area=small_part_fraction * scene_size ** 2,
+                                 distance=scene_size)
+    parts = explode_polygons([shapely.ops.unary_union(parts)])
+    out_geoms = [p.simplify(tolerance, preserve_topology=True)
+                 for p in parts]
+
+    logger.info('Prepared AOI: {:,} -> {:,} polygons, {:,} -> {:,} vertices, '
+                'payload {:,} -> {:,} bytes'.format(
+                 len(in_geoms), len(out_geoms),
+                 sum([count_vertices(g) for g in in_geoms]),
+                 sum([count_vertices(g) for g in out_geoms]),
+                 payload_size(in_geoms), payload_size(out_geoms)))
+
+    return gpd.GeoDataFrame(geometry=out_geoms, crs=crs)
+
+
+def tile_aoi(aoi, tile_size=None):
+    """
+    Split an AOI into square tiles, so that each can be searched
+    separately (and in parallel). Scenes crossing tile edges are matched
+    by more than one tile, so results should be deduplicated.
+
+    Parameters
+    ----------
+    aoi : str, gpd.GeoDataFrame
+        Path to vector file or GeoDataFrame of AOI.
+    tile_size : float
+        Width of tiles in degrees, defaults to 10 scene widths.
+
+    Returns
+    -------
+    list : gpd.GeoDataFrame of AOI within each tile that intersects it
+    """
+    aoi = read_aoi(aoi)
+    if tile_size is None:
+        tile_size = scene_size * tile_scenes
+    aoi_geom = shapely.ops.unary_union([g for g in aoi.geometry
+                                        if g is not None])
+    minx, miny, maxx, maxy = aoi_geom.bounds
+    tiles = []
+    for i in range(max(math.ceil((maxx - minx) / tile_size), 1)):
+        for j in range(max(math.ceil((maxy - miny) / tile_size), 1)):
+            tile_box = shapely.geometry.box(minx + i * tile_size,
+                                            miny + j * tile_size,
+                                            minx + (i + 1) * tile_size,
+                                            miny + (j + 1) * tile_size)
+            if not tile_box.intersects(aoi_geom):
+                continue
+            tile_geoms = explode_polygons([tile_box.intersection(aoi_geom)])
+            if tile_geoms:
+                tiles.append(gpd.GeoDataFrame(geometry=tile_geoms, crs=crs))
+    logger.info('AOI split into {:,} tiles of {} degrees'.format(len(tiles),
+                                                                 tile_size))
+
+    return tiles
@@ -0,0 +1,333 @@
+import bisect
+import io
+import ntpath
+import os
+from pathlib import Path
+import threading
+import zipfile
+import zlib
+
+from retrying import retry
+
+from lib.digests import StreamHasher, k_md5, write_digests
+from lib.download_ledger import partial
+from lib.logging_utils import create_logger
+from lib.transfer import part_path, stream_chunk_size
+
+logger = create_logger(__name__, 'sh', 'INFO')
+
+MB = 1024 ** 2
+# Orders delivered as a single zip archive, see
+# lib.order.create_order_request
+archive_suffix = '.zip'
+archive_type = 'zip'
+archive_filename = '{{name}}_{{order_id}}.zip'
+# Bytes requested from S3 at a time when reading an archive, reads are
+# never extended past the end of the member being read
+default_block_size = 8 * MB
+# Separates the key of an archive and a member's name in the keys
+# recorded in the download ledger
+member_sep = '!'
+
+
+def is_archive(key):
+    return str(key).lower().endswith(archive_suffix)
+
+
+def member_key(key, name):
+    return '{}{}{}'.format(key, member_sep, name)
+
+
+def safe_member_path(name):
+    """
+    Get the path a member is extracted to, relative to the destination,
+    normalized as by zipfile.ZipFile.extract: any drive or root and '.'
+    or '..' parts are dropped, so that a member cannot be written outside
+    the destination.
+
+    Returns
+    -------
+    str : posix path, empty if nothing is left of the name
+    """
+    name = ntpath.splitdrive(name.replace('\\', '/'))[1]
+
+    return '/'.join([p for p in name.split('/')
+                     if p not in ('', os.curdir, os.pardir)])
+
+
+def is_within(parent, path):
+    """Check whether path resolves to a location under parent."""
+    parent = os.path.realpath(parent)
+    path = os.path.realpath(path)
+
+    return os.path.commonpath([parent, path]) == parent
+
+
+def is_transient(exception):
+    """Errors worth retrying, a corrupt member is not."""
+    return not isinstance(exception, zipfile.BadZipFile)
+
+
+def file_crc32(path):
+    crc = 0
+    with open(path, 'rb') as src:
+        for chunk in iter(lambda: src.read(stream_chunk_size), b''):
+            crc = zlib.crc32(chunk, crc)
+
+    return crc
+
+
+class S3ObjectFile(io.RawIOBase):
+    def __init__(self, client, bucket_name, key, size, etag=None,
+                 block_size=default_block_size, callback=None):
+        """
+        Read-only, seekable file over an S3 object, each read being a
+        ranged GET, so that e.g. zipfile can read the central directory
+        of an archive and then any of its members without downloading
+        the whole archive. Reads are buffered a block at a time, but not
+        past read_end, if set, so a small member does not pull in the
+        members after it.
+
+        Parameters
+        ----------
+        client : boto3 S3 client
+        bucket_name : str
+        key : str
+        size : int
+            Size of object in bytes.
+        etag : str
+            ETag of object, reads fail if the object changes.
+        block_size : int
+            Bytes requested at a time.
+        callback : function
+            Called with the number of bytes received with each request.
+        """
+        super().__init__()
+        self.client = client
+        self.bucket_name = bucket_name
+        self.key = key
+        self.size = size
+        self.etag = etag
+        self.block_size = block_size
+        self.callback = callback
+        self.read_end = None
+        self.pos = 0
+        self._buffer = b''
+        self._buffer_start = 0
+
+    def readable(self):
+        return True
+
+    def seekable(self):
+        return True
+
+    def tell(self):
+        return self.pos
+
+    def seek(self, offset, whence=io.SEEK_SET):
+        if whence == io.SEEK_SET:
+            self.pos = offset
+        elif whence == io.SEEK_CUR:
+            self.pos += offset
+        elif whence == io.SEEK_END:
+            self.pos = self.size + offset
+        else:
+            raise ValueError('Invalid whence: {}'.format(whence))
+        return self.pos
+
+    @retry(stop_max_attempt_number=3, wait_fixed=2000)
+    def _get_range(self, start, end):
+        kwargs = {'Range': 'bytes={}-{}'.format(start, end - 1)}
+        if self.etag:
+            kwargs['IfMatch'] = self.etag
+        data = self.client.get_object(Bucket=self.bucket_name, Key=self.key,
+                                      **kwargs)['Body'].read()
+        if self.callback:
+            self.callback(len(data))
+        return data
+
+    def readinto(self, b):
+        n = min(len(b), self.size - self.pos)
+        if n <= 0:
+            return 0
+        offset = self.pos - self._buffer_start
+        if not (0 <= offset and offset + n <= len(self._buffer)):
+            end = self.pos + max(n, self.block_size)
+            if self.read_end is not None and self.read_end >= self.pos + n:
+                end = min(end, self.read_end)
+            self._buffer = self._get_range(self.pos, min(end, self.size))
+            self._buffer_start = self.pos
+            offset = 0
+        b[:n] = self._buffer[offset:offset + n]
+        self.pos += n
+        return n
+
+
+class ArchiveMember:
+    def __init__(self, key, size, e_tag):
+        """Member of an archive, with the attributes of a boto3
+        ObjectSummary used when downloading, so members can be handled
+        like loose objects."""
+        self.key = key
+        self.size = size
+        self.e_tag = e_tag
+
+
+class ArchiveExtractor:
+    def __init__(self, downloader, key, size, etag):
+        """
+        Extracts members of a zip archive in S3 straight to their
+        destinations, reading only each member's bytes with ranged
+        requests (see S3ObjectFile), rather than downloading the archive
+        and extracting it. Members are extracted by the workers of a
+        S3Downloader, sharing its bandwidth limit, stats and ledger, and
+        have the same interface as it: is_current() and submit(), with
+        a member's name in place of a key.
+
+        The CRC32 of each member is computed as it is written and
+        checked against the archive's central directory, so a corrupt
+        member is never left in place. Members are written to a .part
+        file renamed once checked, and their digests recorded as for
+        downloads.
+
+        Parameters
+        ----------
+        downloader : lib.transfer.S3Downloader
+        key : str
+            Key of archive.
+        size : int
+            Size of archive in bytes.
+        etag : str
+            ETag of archive.
+        """
+        self.downloader = downloader
+        self.key = key
+        self.size = size
+        self.etag = etag
+        self.stats = downloader.stats
+        self.ledger = downloader.ledger
+        self.hash_digests = downloader.hash_digests
+        # Each worker reads the archive through its own file
+        self._local = threading.local()
+        self.infos = {i.filename: i for i in self._zipfile().infolist()
+                      if not i.is_dir()}
+        # Each member's data ends before the next header, or the central
+        # directory
+        offsets = sorted([i.header_offset for i in self.infos.values()])
+        self._offsets = offsets + [self._zipfile().start_dir]
+
+    def _zipfile(self):
+        zf = getattr(self._local, 'zipfile', None)
+        if zf is None:
+            self._local.fileobj = S3ObjectFile(
+                self.downloader.client, self.downloader.bucket.name,
+                self.key, self.size, etag=self.etag,
+                callback=self.downloader._progress)
+            zf = zipfile.ZipFile(self._local.fileobj)
+            self._local.zipfile = zf
+        return zf
+
+    def members(self):
+        """Get {path relative to destination: ArchiveMember} of the files
+        in the archive, in the order they are stored. Paths are member
+        names made safe to extract (see safe_member_path), each
+        ArchiveMember's key being the member's name in the archive.
+        Members with no safe path, or the same path as an earlier member,
+        are skipped."""
+        infos = sorted(self.infos.values(), key=lambda i: i.header_offset)
+        members = {}
+        for i in infos:
+            rel_path = safe_member_path(i.filename)
+            if not rel_path or rel_path in members:
+                logger.warning('Skipping member of {} with unsafe or '
+                               'duplicate name: {}'.format(self.key,
+                                                           i.filename))
+                continue
+            if rel_path != i.filename:
+                logger.warning('Member of {} extracted as {}: {}'.format(
+                    self.key, rel_path, i.filename))
+            members[rel_path] = ArchiveMember(i.filename, i.file_size,
+                                              self.etag)
+
+        return members
+
+    def read(self, name):
+        """Read a member into memory, e.g. the order manifest."""
+        return self._zipfile().read(name)
+
+    def is_current(self, name, dst_path, size=None, etag=None, md5=None):
+        """Check whether dst_path is a complete extraction of a member:
+        recorded in the ledger as extracted from this archive and
+        unmodified since, or, if not recorded, with the member's size and
+        CRC32, which is then recorded."""
+        info = self.infos[name]
+        try:
+            if os.path.getsize(dst_path) != info.file_size:
+                return False
+        except FileNotFoundError:
+            return False
+        if self.ledger.is_complete(dst_path, info.file_size, self.etag):
+            return True
+        if file_crc32(dst_path) != info.CRC:
+            return False
+        self.ledger.record(dst_path, member_key(self.key, name),
+                           info.file_size, self.etag, md5=md5)
+
+        return True
+
+    @retry(stop_max_attempt_number=3, wait_fixed=2000,
+           retry_on_exception=is_transient)
+    def _extract(self, name, dst_path):
+        info = self.infos[name]
+        zf = self._zipfile()
+        i = bisect.bisect_right(self._offsets, info.header_offset)
+        self._local.fileobj.read_end = self._offsets[i]
+        tmp_path = part_path(dst_path)
+        hasher = StreamHasher() if self.hash_digests else None
+        key = member_key(self.key, name)
+        self.ledger.record(dst_path, key, info.file_size, self.etag,
+                           state=partial)
+        crc = 0
+        try:
+            # zipfile also checks the CRC once the member is read
+            with zf.open(info) as src, open(tmp_path, 'wb') as dst:
+                for chunk in iter(lambda: src.read(stream_chunk_size), b''):
+                    dst.write(chunk)
+                    crc = zlib.crc32(chunk, crc)
+                    if hasher:
+                        hasher.update(chunk)
+            if crc != info.CRC:
+                raise zipfile.BadZipFile('Bad CRC-32 for member {} of '
+                                         '{}'.format(name, self.key))
+        except Exception:
+            # Members are extracted from the start on each attempt
+            if tmp_path.exists():
+                os.remove(tmp_path)
+            self.ledger.remove(dst_path)
+            raise
+        os.replace(tmp_path, dst_path)
+        md5 = None
+        if hasher:
+            digests = hasher.hexdigests()
+            if self.downloader.sidecars:
+                write_digests(dst_path, digests)
+            md5 = digests[k_md5]
+        self.ledger.record(dst_path, key, info.file_size, self.etag, md5=md5)
+
+    def _extract_member(self, name, dst_path):
+        try:
+            self._extract(name, dst_path)
+        except Exception as e:
+            logger.error('Error extracting {} from: {}'.format(name,
+                                                               self.key))
+            logger.error(e)
+            self.stats.add_file(error=True)
+            return False
+        self.stats.add_file()
+        return True
+
+    def submit(self, name, dst_path, size=None, etag=None):
+        """Queue a member for extraction to dst_path, returning a Future
+        whose result is True if extracted and its CRC matched."""
+        return self.downloader.executor.submit(self._extract_member, name,
+                                               Path(dst_path))
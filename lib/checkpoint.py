@@ -0,0 +1,119 @@
+import datetime
+import json
+import os
+from pathlib import Path
+import shutil
+
+from lib.lib import get_cache_dir
+from lib.logging_utils import create_logger
+
+logger = create_logger(__name__, 'sh', 'INFO')
+
+# Subdirectory of cache directory holding a directory for each saved
+# search ID that has been checkpointed
+checkpoint_subdir = 'search_checkpoints'
+checkpoint_file = 'checkpoint.json'
+page_file_template = 'page_{:06d}.json'
+
+# Keys in checkpoint file
+k_search_id = 'search_id'
+k_next_url = 'next_url'
+k_pages = 'pages'
+k_feature_count = 'feature_count'
+k_complete = 'complete'
+k_updated = 'updated'
+
+
+def write_json_atomic(data, path):
+    """Write data to a temporary file next to path, then rename, so that
+    an interrupted write never leaves a partial file at path."""
+    tmp_path = '{}.tmp'.format(path)
+    with open(tmp_path, 'w') as dst:
+        json.dump(data, dst)
+    os.replace(tmp_path, path)
+
+
+class SearchCheckpoint:
+    def __init__(self, search_id, checkpoint_dir=None):
+        """
+        On-disk record of the pages of a saved search's results that
+        have been processed. Each page's features are written to their
+        own file, and the checkpoint file records the pages written and
+        the '_next' URL to continue from.
+
+        Parameters
+        ----------
+        search_id : str
+            Saved search ID the checkpoint is for.
+        checkpoint_dir : str, pathlib.Path
+            Alternative parent directory for checkpoints, if not passed,
+            the 'search_checkpoints' subdirectory of the cache directory
+            is used.
+        """
+        self.search_id = search_id
+        if checkpoint_dir is None:
+            checkpoint_dir = get_cache_dir(checkpoint_subdir)
+        self.directory = Path(checkpoint_dir) / search_id
+        self.path = self.directory / checkpoint_file
+
+        self.next_url = None
+        self.pages = []
+        self.feature_count = 0
+        self.complete = False
+
+        if self.exists:
+            self._load()
+
+    @property
+    def exists(self):
+        return self.path.exists()
+
+    def _load(self):
+        with open(self.path, 'r') as src:
+            data = json.load(src)
+        self.next_url = data[k_next_url]
+        self.pages = data[k_pages]
+        self.feature_count = data[k_feature_count]
+        self.complete = data[k_complete]
+        logger.debug('Loaded checkpoint for search {}: {:,} pages, '
+                     '{:,} features'.format(self.search_id, len(self.pages),
+                                            self.feature_count))
+
+    def _save(self):
+        data = {k_search_id: self.search_id,
+                k_next_url: self.next_url,
+                k_pages: self.pages,
+                k_feature_count: self.feature_count,
+                k_complete: self.complete,
+                k_updated: datetime.datetime.now().isoformat()}
+        write_json_atomic(data, self.path)
+
+    def add_page(self, features, next_url):
+        """Persist the features from a page of results, and the URL of
+        the page to continue from (None if this was the last page)."""
+        os.makedirs(self.directory, exist_ok=True)
+        page_name = page_file_template.format(len(self.pages))
+        # Page is written before the checkpoint file references it
+        write_json_atomic(features, self.directory / page_name)
+        self.pages.append(page_name)
+        self.feature_count += len(features)
+        self.next_url = next_url
+        self.complete = next_url is None
+        self._save()
+
+    def iter_pages(self):
+        """Generator of the list of features on each persisted page."""
+        for page_name in self.pages:
+            with open(self.directory / page_name, 'r') as src:
+                yield json.load(src)
+
+    def clear(self):
+        """Remove the checkpoint and all persisted pages."""
+        if self.directory.exists():
+            logger.debug('Removing checkpoint for search: '
+                         '{}'.format(self.search_id))
+            shutil.rmtree(self.directory)
+        self.next_url = None
+        self.pages = []
+        self.feature_count = 0
+        self.complete = False
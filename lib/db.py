@@ -5,26 +5,24 @@ from pathlib import Path
 import sys
 import time
 
-from sqlalchemy import create_engine
 from tqdm import tqdm
-import psycopg2
-from psycopg2 import sql
-import pandas as pd
-import geopandas as gpd
 
+from .lazy import lazy_import
 from .lib import get_config, get_geometry_cols
 from .logging_utils import create_logger
 
-# Supress pandas SettingWithCopyWarning
-pd.set_option('mode.chained_assignment', None)
+# Imported on first use
+sqlalchemy = lazy_import('sqlalchemy')
+psycopg2 = lazy_import('psycopg2')
+sql = lazy_import('psycopg2.sql')
+extras = lazy_import('psycopg2.extras')
+pd = lazy_import('pandas')
+gpd = lazy_import('geopandas')
 
 logger = create_logger(__name__, 'sh', 'INFO')
 
-# Paths to config files for connecting to various DB's
-# Params
-db_params = get_config("db")
-db_config = db_params["db_config"]
-tables_config = db_params["tables"]
+# Key of database parameters in config file, read when first connecting
+db_key = "db"
 
 k_unique_id = "unique_id"  # key in config
 
@@ -227,6 +225,9 @@ class Postgres(object):
     _instance = None
 
     def __init__(self):
+        db_params = get_config(db_key)
+        db_config = db_params["db_config"]
+        self.tables_config = db_params["tables"]
         self.host = db_config['host']
         self.database = db_config['database']
         self.user = db_config['user']
@@ -381,9 +382,13 @@ class Postgres(object):
 
     def get_engine(self):
         """Create sqlalchemy.engine object."""
-        engine = create_engine('postgresql+psycopg2://'
-                               '{}:{}@{}/{}'.format(self.user, self.password,
-                                                    self.host, self.database))
+        # Supress pandas SettingWithCopyWarning
+        pd.set_option('mode.chained_assignment', None)
+        engine = sqlalchemy.create_engine(
+            'postgresql+psycopg2://{}:{}@{}/{}'.format(self.user,
+                                                       self.password,
+                                                       self.host,
+                                                       self.database))
 
         return engine
 
@@ -454,7 +459,7 @@ class Postgres(object):
         if table in self.list_db_tables():
             logger.info('Starting count for {}: '
                         '{:,}'.format(table, self.get_table_count(table)))
-            unique_on = tables_config[table][k_unique_id]
+            unique_on = self.tables_config[table][k_unique_id]
         else:
             logger.warning('Table "{}" not found in database "{}", '
                            'exiting.'.format(table, self.database))
@@ -575,3 +580,88 @@ class Postgres(object):
         logger.info('New count for {}.{}: '
                     '{:,}'.format(self.database, table,
                                   self.get_table_count(table)))
+
+    def upsert_records(self, records, table, unique_on=None, page_size=1000,
+                       dryrun=False):
+        """
+        Insert records into table in batches, updating any existing rows
+        with the same unique_on values (INSERT ... ON CONFLICT DO
+        UPDATE). Requires a unique constraint on the unique_on columns.
+        records : pd.DataFrame / gpd.GeoDataFrame
+            DataFrame containing rows to be upserted
+        table : str
+            Name of table to upsert into
+        unique_on : list
+            Columns of unique constraint, defaults to the table's
+            unique_id in the config file
+        page_size : int
+            Number of rows per INSERT statement
+        Returns
+        -------
+        list : values of unique_on columns for rows that were newly
+            inserted (not updated)
+        """
+        if len(records) == 0:
+            logger.warning('No records to be upserted.')
+            return []
+        if unique_on is None:
+            unique_on = self.tables_config[table][k_unique_id]
+        if isinstance(unique_on, str):
+            unique_on = [unique_on]
+
+        geom_cols = get_geometry_cols(records)
+        if geom_cols:
+            srid = records.crs.to_epsg()
+        else:
+            geom_cols = []
+        columns = [c for c in records.columns if c not in geom_cols]
+        columns.extend(geom_cols)
+
+        # Template for each row of values, geometries converted from WKT
+        template = sql.SQL('({})').format(sql.SQL(', ').join(
+            [sql.SQL('ST_GeomFromText(%s, {})').format(sql.Literal(srid))
+             if c in geom_cols else sql.SQL('%s') for c in columns]))
+        update_cols = [c for c in columns if c not in unique_on]
+        # xmax is 0 for newly inserted rows
+        upsert_statement = sql.SQL(
+            "INSERT INTO {table} ({columns}) VALUES %s "
+            "ON CONFLICT ({unique_on}) DO UPDATE SET {updates} "
+            "RETURNING {returning}, (xmax = 0) AS inserted").format(
+            table=sql.Identifier(table),
+            columns=sql.SQL(', ').join([sql.Identifier(c) for c in columns]),
+            unique_on=sql.SQL(', ').join([sql.Identifier(c)
+                                          for c in unique_on]),
+            updates=sql.SQL(', ').join(
+                [sql.SQL('{col} = EXCLUDED.{col}').format(
+                    col=sql.Identifier(c)) for c in update_cols]),
+            returning=sql.SQL(', ').join([sql.Identifier(c)
+                                          for c in unique_on]))
+
+        rows = [tuple(row[c] if c not in geom_cols else row[c].wkt
+                      for c in columns)
+                for _, row in records.iterrows()]
+        if dryrun:
+            logger.info('-dryrun- Records to upsert into {}: '
+                        '{:,}'.format(table, len(rows)))
+            return []
+
+        logger.info('Upserting {:,} records into {}.{}...'.format(
+            len(rows), self.database, table))
+        try:
+            results = extras.execute_values(
+                self.cursor, upsert_statement.as_string(self.cursor), rows,
+                template=template.as_string(self.cursor),
+                page_size=page_size, fetch=True)
+            self.connection.commit()
+        except psycopg2.Error as e:
+            logger.error('Error upserting records into {}'.format(table))
+            logger.error(e)
+            self.connection.rollback()
+            raise e
+
+        inserted = [r[:-1] if len(unique_on) > 1 else r[0]
+                    for r in results if r[-1]]
+        logger.info('Records inserted: {:,}, updated: {:,}'.format(
+            len(inserted), len(results) - len(inserted)))
+
+        return inserted
@@ -0,0 +1,379 @@
+from concurrent.futures import ThreadPoolExecutor, as_completed
+import datetime
+import hashlib
+import json
+import os
+from pathlib import Path
+import sqlite3
+import threading
+import time
+
+from tqdm import tqdm
+
+from lib.logging_utils import create_logger
+
+logger = create_logger(__name__, 'sh', 'INFO')
+
+# Digests computed for each file, named as in Planet manifests
+k_md5 = 'md5'
+k_sha256 = 'sha256'
+digest_algorithms = (k_md5, k_sha256)
+# Keys in sidecar, recording the file the digests were computed for
+k_digests = 'digests'
+k_size = 'size'
+k_mtime_ns = 'mtime_ns'
+# Digests for <file> are written to <file><sidecar_suffix>
+sidecar_suffix = '.digests.json'
+MB = 1024 ** 2
+# Bytes read at a time when hashing a file on disk, large reads being
+# much faster over NFS
+read_chunk_size = 8 * MB
+# Files hashed at once by hash_files. hashlib and file reads release the
+# GIL, so threads hash in parallel without the cost of processes
+default_hash_threads = 8
+
+create_cache_sql = """
+CREATE TABLE IF NOT EXISTS digests (
+    path TEXT PRIMARY KEY,
+    size INTEGER,
+    mtime_ns INTEGER,
+    inode INTEGER,
+    md5 TEXT,
+    sha256 TEXT,
+    updated TEXT
+);
+"""
+upsert_cache_sql = """
+INSERT INTO digests (path, size, mtime_ns, inode, md5, sha256, updated)
+VALUES (?, ?, ?, ?, ?, ?, ?)
+ON CONFLICT (path) DO UPDATE SET
+    size = excluded.size,
+    mtime_ns = excluded.mtime_ns,
+    inode = excluded.inode,
+    md5 = excluded.md5,
+    sha256 = excluded.sha256,
+    updated = excluded.updated
+"""
+
+
+class StreamHasher:
+    def __init__(self, algorithms=digest_algorithms):
+        """Compute several digests of a stream of bytes in one pass, as
+        the bytes are written or read."""
+        self.hashers = {a: hashlib.new(a) for a in algorithms}
+
+    def update(self, data):
+        for h in self.hashers.values():
+            h.update(data)
+
+    def hexdigests(self):
+        return {a: h.hexdigest() for a, h in self.hashers.items()}
+
+
+def sidecar_path(path):
+    return Path('{}{}'.format(path, sidecar_suffix))
+
+
+def is_sidecar(path):
+    return str(path).endswith(sidecar_suffix)
+
+
+def write_digests(path, digests):
+    """Record digests of the file at path, which must be complete and
+    closed, along with its size and modification time, so that the
+    record is only trusted while the file is unchanged."""
+    stat = os.stat(path)
+    record = {k_digests: digests, k_size: stat.st_size,
+              k_mtime_ns: stat.st_mtime_ns}
+    dst_path = sidecar_path(path)
+    tmp_path = '{}.tmp'.format(dst_path)
+    with open(tmp_path, 'w') as dst:
+        json.dump(record, dst)
+    os.replace(tmp_path, dst_path)
+
+
+def read_digests(path):
+    """Get the recorded digests of the file at path, or None if there
+    is no record or the file's size or modification time has changed
+    since the record was written."""
+    src_path = sidecar_path(path)
+    if not src_path.exists():
+        return None
+    try:
+        with open(src_path, 'r') as src:
+            record = json.load(src)
+        stat = os.stat(path)
+    except (OSError, ValueError) as e:
+        logger.debug('Could not read digests for {}: {}'.format(path, e))
+        return None
+    if (record.get(k_size) != stat.st_size or
+            record.get(k_mtime_ns) != stat.st_mtime_ns):
+        logger.debug('File changed since digests were recorded: '
+                     '{}'.format(path))
+        return None
+
+    return record[k_digests]
+
+
+def compute_file_digests(path, algorithms=digest_algorithms,
+                         chunk_size=read_chunk_size):
+    """Read the file at path once, computing all digests. Reads go into
+    one reused buffer, unbuffered by Python."""
+    hasher = StreamHasher(algorithms)
+    buffer = bytearray(chunk_size)
+    view = memoryview(buffer)
+    with open(path, 'rb', buffering=0) as src:
+        while True:
+            n = src.readinto(buffer)
+            if not n:
+                break
+            hasher.update(view[:n])
+
+    return hasher.hexdigests()
+
+
+class ChecksumCache:
+    def __init__(self, db_path):
+        """
+        SQLite cache of the digests computed for files, so that files
+        are not hashed again by later runs while unchanged. An entry is
+        only used while the file has the size, modification time and
+        inode it had when hashed, and a file that changed while being
+        hashed is not cached.
+
+        Parameters
+        ----------
+        db_path : str, pathlib.Path
+            Path to the database, see lib.lib.get_checksum_cache.
+        """
+        self.db_path = Path(db_path)
+        self._lock = threading.Lock()
+        conn = self._connect()
+        try:
+            conn.executescript(create_cache_sql)
+        finally:
+            conn.close()
+
+    def _connect(self):
+        conn = sqlite3.connect(str(self.db_path), timeout=60)
+        conn.row_factory = sqlite3.Row
+        return conn
+
+    def _execute(self, sql, params=()):
+        with self._lock:
+            conn = self._connect()
+            try:
+                with conn:
+                    conn.execute(sql, params)
+            finally:
+                conn.close()
+
+    @staticmethod
+    def _key(path):
+        return str(Path(path).absolute())
+
+    def get(self, path):
+        """Get the cached digests of the file at path, None if not
+        cached, or the file has changed since it was hashed."""
+        conn = self._connect()
+        try:
+            row = conn.execute('SELECT size, mtime_ns, inode, md5, sha256 '
+                               'FROM digests WHERE path = ?',
+                               (self._key(path),)).fetchone()
+        finally:
+            conn.close()
+        if row is None:
+            return None
+        try:
+            stat = os.stat(path)
+        except FileNotFoundError:
+            return None
+        if ((row['size'], row['mtime_ns'], row['inode']) !=
+                (stat.st_size, stat.st_mtime_ns, stat.st_ino)):
+            return None
+
+        return {a: row[a] for a in digest_algorithms if row[a]}
+
+    def put(self, path, digests, stat):
+        """Cache digests of the file at path, computed from the file as
+        it was when stat was taken, only if it is unchanged since."""
+        current = os.stat(path)
+        if ((current.st_size, current.st_mtime_ns, current.st_ino) !=
+                (stat.st_size, stat.st_mtime_ns, stat.st_ino)):
+            logger.debug('File changed while hashing, not caching: '
+                         '{}'.format(path))
+            return
+        self._execute(upsert_cache_sql, (
+            self._key(path), stat.st_size, stat.st_mtime_ns, stat.st_ino,
+            digests.get(k_md5), digests.get(k_sha256),
+            datetime.datetime.utcnow().isoformat()))
+
+    def purge(self):
+        """Remove entries of files that no longer exist or have changed
+        since they were hashed, returning the number removed."""
+        conn = self._connect()
+        try:
+            rows = conn.execute('SELECT path, size, mtime_ns, inode FROM '
+                                'digests').fetchall()
+        finally:
+            conn.close()
+        stale = []
+        for row in rows:
+            try:
+                stat = os.stat(row['path'])
+            except FileNotFoundError:
+                stale.append(row['path'])
+                continue
+            if ((row['size'], row['mtime_ns'], row['inode']) !=
+                    (stat.st_size, stat.st_mtime_ns, stat.st_ino)):
+                stale.append(row['path'])
+        with self._lock:
+            conn = self._connect()
+            try:
+                with conn:
+                    conn.executemany('DELETE FROM digests WHERE path = ?',
+                                     [(p,) for p in stale])
+            finally:
+                conn.close()
+
+        return len(stale)
+
+    def count(self):
+        conn = self._connect()
+        try:
+            return conn.execute('SELECT COUNT(*) FROM digests').fetchone()[0]
+        finally:
+            conn.close()
+
+
+def known_digests(path, algorithms=digest_algorithms, cache=None):
+    """Get the digests of a file without reading it, from its sidecar or
+    cache, if they are current and include all algorithms, else None."""
+    for source in (read_digests, cache.get if cache else None):
+        if source is None:
+            continue
+        digests = source(path)
+        if digests is not None and all(a in digests for a in algorithms):
+            return digests
+
+    return None
+
+
+def cached_file_digests(path, algorithms=digest_algorithms, cache=None):
+    """Hash the file at path, caching the digests if cache is passed."""
+    stat = os.stat(path)
+    digests = compute_file_digests(path, algorithms=algorithms)
+    if cache is not None:
+        cache.put(path, digests, stat)
+
+    return digests
+
+
+def file_digests(path, cache=None):
+    """
+    Get the md5 and sha256 digests of a file, from the record written
+    when it was downloaded if the file is unchanged since, or from cache
+    (a ChecksumCache), otherwise by reading the file, the digests then
+    being cached.
+
+    Returns
+    -------
+    dict : algorithm: hex digest
+    """
+    digests = known_digests(path, cache=cache)
+    if digests is None:
+        logger.debug('Hashing file: {}'.format(path))
+        digests = cached_file_digests(path, cache=cache)
+
+    return digests
+
+
+class HashStats:
+    def __init__(self):
+        """Thread-safe totals of files and bytes hashed."""
+        self.lock = threading.Lock()
+        self.start = time.time()
+        self.files = 0
+        self.bytes = 0
+        # Files whose digests were recorded or cached, so were not read
+        self.recorded = 0
+        self.errors = 0
+
+    def add_file(self, size=0, recorded=False, error=False):
+        with self.lock:
+            if error:
+                self.errors += 1
+            elif recorded:
+                self.recorded += 1
+            else:
+                self.files += 1
+                self.bytes += size
+
+    @property
+    def elapsed(self):
+        return time.time() - self.start
+
+    def report(self):
+        logger.info('Hashed {:,} files, {:,.1f} MB in {:,.1f}s: {:,.2f} '
+                    'MB/s ({:,} from recorded or cached digests, {:,} '
+                    'errors)'.format(self.files, self.bytes / MB,
+                                     self.elapsed,
+                                     self.bytes / MB / max(self.elapsed, 1e-6),
+                                     self.recorded, self.errors))
+
+
+def hash_files(paths, algorithms=digest_algorithms,
+               threads=default_hash_threads, cache=None,
+               desc='Hashing files'):
+    """
+    Get digests of many files, hashing them in parallel on a pool of
+    threads, each file read once for all algorithms. Files with digests
+    recorded or cached while unchanged (see known_digests) are not read,
+    and the digests of files that are read are cached. The throughput is
+    logged once done.
+
+    Parameters
+    ----------
+    paths : list
+        Paths of files.
+    algorithms : tuple
+        Digests to compute, e.g. those listed in a manifest.
+    threads : int
+        Files hashed at once.
+    cache : ChecksumCache
+    desc : str
+        Description of progress bar.
+
+    Returns
+    -------
+    dict : {path: {algorithm: hex digest}}, None for files that could
+        not be read
+    """
+    stats = HashStats()
+
+    def _hash(path):
+        try:
+            digests = known_digests(path, algorithms=algorithms, cache=cache)
+            if digests is not None:
+                stats.add_file(recorded=True)
+                return digests
+            logger.debug('Hashing file: {}'.format(path))
+            digests = cached_file_digests(path, algorithms=algorithms,
+                                          cache=cache)
+            stats.add_file(size=os.path.getsize(path))
+            return digests
+        except OSError as e:
+            logger.error('Error hashing: {}'.format(path))
+            logger.error(e)
+            stats.add_file(error=True)
+            return None
+
+    results = {}
+    with ThreadPoolExecutor(max_workers=threads) as executor:
+        futures = {executor.submit(_hash, p): p for p in paths}
+        for future in tqdm(as_completed(futures), total=len(futures),
+                           desc=desc):
+            results[futures[future]] = future.result()
+    stats.report()
+
+    return results
@@ -0,0 +1,145 @@
+import bisect
+import os
+from pathlib import Path
+
+from lib.logging_utils import create_logger
+
+logger = create_logger(__name__, 'sh', 'INFO')
+
+# Post processing suffixes of scene files, not in the names of their
+# metadata files, e.g. 20191009_160416_100d_3B_AnalyticMS_SR.tif
+scene_suffixes = ('_SR', '_DN')
+
+
+def scene_name(scene_path):
+    """Get the name of a scene without post processing suffixes (see
+    scene_suffixes), the prefix shared by the scene's files."""
+    name = Path(scene_path).stem
+    for sfx in scene_suffixes:
+        name = name.replace(sfx, '')
+
+    return name
+
+
+def _key(directory):
+    return os.path.normpath(os.path.abspath(str(directory)))
+
+
+class DirectoryIndex:
+    def __init__(self, *roots):
+        """
+        Index of the files in directory trees, built by a single walk of
+        each tree with os.scandir, so that the files of many scenes can
+        be looked up without listing directories once per scene (e.g.
+        with Path.rglob), which is slow over NFS for large orders.
+
+        The file names of each directory are kept sorted, so the files
+        starting with a prefix, e.g. the files of a scene (see
+        scene_name), are contiguous and found by bisection. Directories
+        looked up that are not in an indexed tree are indexed on first
+        use. The index is a snapshot: files written afterwards are only
+        found if added with add().
+
+        Parameters
+        ----------
+        roots : str, pathlib.Path
+            Directories to index.
+        """
+        # Directory: sorted file names
+        self._names = {}
+        # Directory: subdirectories
+        self._subdirs = {}
+        for root in roots:
+            self.index(root)
+
+    def index(self, root):
+        """Walk the tree under root, replacing any previous index of it."""
+        root = _key(root)
+        file_count = 0
+        stack = [root]
+        while stack:
+            directory = stack.pop()
+            names = []
+            subdirs = []
+            try:
+                with os.scandir(directory) as it:
+                    for entry in it:
+                        if entry.is_dir(follow_symlinks=False):
+                            subdirs.append(entry.path)
+                        elif entry.is_file():
+                            names.append(entry.name)
+            except (FileNotFoundError, NotADirectoryError,
+                    PermissionError) as e:
+                logger.debug('Could not list directory: {} ({})'.format(
+                    directory, e))
+            self._names[directory] = sorted(names)
+            self._subdirs[directory] = subdirs
+            stack.extend(subdirs)
+            file_count += len(names)
+        logger.debug('Indexed {:,} files in: {}'.format(file_count, root))
+
+    def _directories(self, directory, recursive=True):
+        """Keys of directory and, if recursive, its subdirectories,
+        indexing directory if it is not already."""
+        directory = _key(directory)
+        if directory not in self._names:
+            self.index(directory)
+        if not recursive:
+            return [directory]
+        directories = []
+        stack = [directory]
+        while stack:
+            d = stack.pop()
+            directories.append(d)
+            stack.extend(self._subdirs.get(d, []))
+
+        return sorted(directories)
+
+    def find(self, directory, prefix='', suffix='', name=None,
+             recursive=True):
+        """
+        Get the files in directory (and its subdirectories if recursive)
+        whose names start with prefix and end with suffix, or are name.
+
+        Returns
+        -------
+        list : pathlib.Path, joined onto directory as passed, as with
+            Path.rglob
+        """
+        if name is not None:
+            prefix = name
+        base = Path(directory)
+        root = _key(directory)
+        matches = []
+        for d in self._directories(directory, recursive=recursive):
+            names = self._names[d]
+            parent = base if d == root else base / os.path.relpath(d, root)
+            i = bisect.bisect_left(names, prefix)
+            while i < len(names) and names[i].startswith(prefix):
+                n = names[i]
+                i += 1
+                if n.endswith(suffix) and (name is None or n == name):
+                    matches.append(parent / n)
+
+        return matches
+
+    def exists(self, path):
+        """Check whether a file exists, from the index if its directory
+        is indexed."""
+        directory, name = os.path.split(_key(path))
+        names = self._names.get(directory)
+        if names is None:
+            return Path(path).is_file()
+        i = bisect.bisect_left(names, name)
+
+        return i < len(names) and names[i] == name
+
+    def add(self, path):
+        """Add a file written since its directory was indexed."""
+        directory, name = os.path.split(_key(path))
+        names = self._names.get(directory)
+        if names is None:
+            return
+        i = bisect.bisect_left(names, name)
+        if i == len(names) or names[i] != name:
+            names.insert(i, name)
@@ -0,0 +1,144 @@
+import datetime
+import os
+from pathlib import Path
+import sqlite3
+import threading
+
+from lib.lib import get_cache_dir
+from lib.logging_utils import create_logger
+
+logger = create_logger(__name__, 'sh', 'INFO')
+
+ledger_file = 'downloads.sqlite'
+
+# Download states
+partial = 'partial'
+complete = 'complete'
+
+columns = ['path', 'key', 'size', 'etag', 'md5', 'mtime_ns', 'state',
+           'updated']
+create_table_sql = """
+CREATE TABLE IF NOT EXISTS downloads (
+    path TEXT PRIMARY KEY,
+    key TEXT,
+    size INTEGER,
+    etag TEXT,
+    md5 TEXT,
+    mtime_ns INTEGER,
+    state TEXT,
+    updated TEXT
+);
+"""
+upsert_sql = """
+INSERT INTO downloads (path, key, size, etag, md5, mtime_ns, state, updated)
+VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+ON CONFLICT (path) DO UPDATE SET
+    key = excluded.key,
+    size = excluded.size,
+    etag = excluded.etag,
+    md5 = excluded.md5,
+    mtime_ns = excluded.mtime_ns,
+    state = excluded.state,
+    updated = excluded.updated
+"""
+
+
+def etag_md5(etag):
+    """Get the md5 of an object from its ETag, None if the object was
+    uploaded in parts, in which case the ETag is not an md5."""
+    if etag is None:
+        return None
+    etag = etag.strip('"')
+    if '-' in etag:
+        return None
+
+    return etag
+
+
+class DownloadLedger:
+    def __init__(self, db_path=None):
+        """
+        Local SQLite record of files downloaded from S3: the object each
+        was downloaded from (key, size and ETag) and, once complete, the
+        size and modification time of the file written. A file is only
+        treated as downloaded while it matches both the object and the
+        record, so a truncated or modified file, or one whose object has
+        changed, is downloaded again. Downloads in progress are recorded
+        as partial, with the ETag of the object being written, so that
+        they can be resumed only from the same object.
+
+        Parameters
+        ----------
+        db_path : str, pathlib.Path
+            Alternative path to the database, defaults to a file in the
+            cache directory.
+        """
+        if db_path is None:
+            db_path = get_cache_dir() / ledger_file
+        self.db_path = Path(db_path)
+        self._lock = threading.Lock()
+        conn = self._connect()
+        try:
+            conn.executescript(create_table_sql)
+        finally:
+            conn.close()
+
+    def _connect(self):
+        conn = sqlite3.connect(str(self.db_path), timeout=60)
+        conn.row_factory = sqlite3.Row
+        return conn
+
+    def _execute(self, sql, params=()):
+        with self._lock:
+            conn = self._connect()
+            try:
+                with conn:
+                    conn.execute(sql, params)
+            finally:
+                conn.close()
+
+    def get(self, path):
+        conn = self._connect()
+        try:
+            row = conn.execute('SELECT {} FROM downloads WHERE path = ?'.format(
+                ','.join(columns)), (str(Path(path).absolute()),)).fetchone()
+        finally:
+            conn.close()
+
+        return dict(row) if row else None
+
+    def record(self, path, key, size, etag, state=complete, md5=None):
+        """Record a download of key to path. Complete downloads record the
+        modification time of the file, which must be closed."""
+        mtime_ns = os.stat(path).st_mtime_ns if state == complete else None
+        updated = datetime.datetime.utcnow().isoformat()
+        self._execute(upsert_sql, (str(Path(path).absolute()), key, size,
+                                   etag, md5, mtime_ns, state, updated))
+
+    def remove(self, path):
+        self._execute('DELETE FROM downloads WHERE path = ?',
+                      (str(Path(path).absolute()),))
+
+    def is_complete(self, path, size, etag):
+        """True if path was completely downloaded from an object with
+        the given size and ETag and is unchanged since."""
+        entry = self.get(path)
+        if not entry or entry['state'] != complete:
+            return False
+        try:
+            stat = os.stat(path)
+        except FileNotFoundError:
+            return False
+
+        return (entry['etag'] == etag and entry['size'] == size and
+                stat.st_size == size and
+                stat.st_mtime_ns == entry['mtime_ns'])
+
+    def partial_etag(self, path):
+        """ETag of the object being written to path when its download was
+        interrupted, None if there is no partial download recorded."""
+        entry = self.get(path)
+        if not entry or entry['state'] != partial:
+            return None
+
+        return entry['etag']
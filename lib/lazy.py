@@ -0,0 +1,63 @@
+import importlib.machinery
+import importlib.util
+import sys
+import threading
+
+_lock = threading.RLock()
+# Specs of modules imported lazily, as reading __spec__ from a lazy
+# module would load it
+_specs = {}
+
+
+def _find_spec(name):
+    """Find the spec of a module without importing its parent
+    packages."""
+    parent, _, child = name.rpartition('.')
+    if not parent:
+        return importlib.util.find_spec(name)
+    if parent in _specs:
+        parent_spec = _specs[parent]
+    else:
+        parent_spec = sys.modules[parent].__spec__
+    return importlib.machinery.PathFinder.find_spec(
+        name, parent_spec.submodule_search_locations)
+
+
+def lazy_import(name):
+    """
+    Import a module when one of its attributes is first used, rather
+    than now, so that heavy dependencies (e.g. geopandas) only slow down
+    the tools that use them, and not e.g. printing --help. Used in place
+    of a module-level import:
+        gpd = lazy_import('geopandas')
+    Parent packages of submodules are imported lazily as well.
+
+    Parameters
+    ----------
+    name : str
+        Full name of module, e.g. 'shapely.geometry'.
+
+    Returns
+    -------
+    module : module that is loaded on first attribute access
+    """
+    with _lock:
+        if name in sys.modules:
+            return sys.modules[name]
+        parent, _, child = name.rpartition('.')
+        if parent:
+            lazy_import(parent)
+        spec = _find_spec(name)
+        if spec is None:
+            raise ModuleNotFoundError('No module named {!r}'.format(name),
+                                      name=name)
+        loader = importlib.util.LazyLoader(spec.loader)
+        spec.loader = loader
+        module = importlib.util.module_from_spec(spec)
+        sys.modules[name] = module
+        _specs[name] = spec
+        loader.exec_module(module)
+        if parent:
+            setattr(sys.modules[parent], child, module)
+
+    return module
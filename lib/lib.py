@@ -1,7 +1,6 @@
 import argparse
 import copy
 import datetime
-import hashlib
 import json
 import os
 from pathlib import Path, PurePosixPath
@@ -9,17 +8,25 @@ import pathlib
 import platform
 import re
 import sys
+import threading
 import time
 import xml.etree.ElementTree as ET
 
-import pandas as pd
-import geopandas as gpd
-import shapely
-from shapely.geometry import Point, Polygon
 from tqdm import tqdm
 
+from .digests import ChecksumCache, compute_file_digests, \
+    default_hash_threads, file_digests, hash_files, is_sidecar, k_sha256
+from .dir_index import DirectoryIndex, scene_name
+from .lazy import lazy_import
 from .logging_utils import create_logger
 
+# Imported on first use, as importing is slow and many tools never use
+# them
+pd = lazy_import('pandas')
+gpd = lazy_import('geopandas')
+shapely = lazy_import('shapely')
+lazy_import('shapely.geometry')
+
 logger = create_logger(__name__, 'sh', 'INFO')
 
 # TODO: clean up logging around unshelveable scenes
@@ -35,6 +42,12 @@ image = 'image'
 
 config_file = Path(__file__).parent.parent / "config" / "config.json"
 # config_file = r'C:\code\planet_stereo\config\config.json'
+# Default location for local state (search checkpoints, caches, etc.) if
+# 'cache_dir' is not set in the config file
+default_cache_dir = Path(__file__).parent.parent / "cache"
+# Database of digests of files hashed, in the cache directory, see
+# get_checksum_cache
+checksum_cache_file = 'checksums.sqlite'
 
 # Constants
 windows = 'Windows'
@@ -54,6 +67,7 @@ k_annotations = 'annotations'
 k_asset_type = 'planet/asset_type'
 k_bundle_type = 'planet/bundle_type'
 k_item_type = 'planet/item_type'
+k_item_id = 'planet/item_id'
 k_digests = 'digests'
 k_md5 = 'md5'
 # Manifest Constants
@@ -64,22 +78,79 @@ udm = 'udm'
 # start of media_type in master source that indicates imagery
 
 
-def get_config(param):
+# Parsed config file, and the modification time it was read at
+_config = {'mtime': None, 'params': None}
+_config_lock = threading.Lock()
+
+
+def load_config():
+    """Read the config file, only reading it again if it has been
+    modified since last read."""
+    mtime = os.stat(config_file).st_mtime_ns
+    with _config_lock:
+        if _config['mtime'] != mtime:
+            with open(config_file) as src:
+                _config['params'] = json.load(src)
+            _config['mtime'] = mtime
+
+        return _config['params']
+
+
+def get_config(param, default=None):
+    """Get a parameter from the config file. If default is provided, it
+    is returned when the parameter (or config file) is not found,
+    otherwise FileNotFoundError or KeyError is raised."""
     try:
-        config_params = json.load(open(config_file))
+        config_params = load_config()
     except FileNotFoundError:
-        print('Config file not found at: {}'.format(config_file))
-        print('Please create a config.json file based on the example.')
+        if default is not None:
+            return default
+        raise FileNotFoundError('Config file not found at: {}\nPlease create '
+                                'a config.json file based on the '
+                                'example.'.format(config_file))
 
     try:
-        config = config_params[param]
+        # Copied, so callers modifying it do not change the cached config
+        config = copy.deepcopy(config_params[param])
     except KeyError:
-        print('Config parameter not found: {}'.format(param))
-        print('Available configs:\n{}'.format('\n'.join(config_params.keys())))
+        if default is not None:
+            return default
+        raise KeyError('Config parameter not found: {}\nAvailable configs:'
+                       '\n{}'.format(param, '\n'.join(config_params.keys())))
 
     return config
 
 
+def get_cache_dir(*subdirs):
+    """Get the directory used for local state, e.g. search checkpoints,
+    creating it if necessary. Uses 'cache_dir' from the config file if
+    present, with any subdirs passed joined on."""
+    cache_dir = Path(get_config('cache_dir', default=str(default_cache_dir)))
+    cache_dir = cache_dir.joinpath(*subdirs)
+    os.makedirs(cache_dir, exist_ok=True)
+
+    return cache_dir
+
+
+# Checksum cache shared by all scenes, opened on first use
+_checksum_cache = {}
+_checksum_cache_lock = threading.Lock()
+
+
+def get_checksum_cache():
+    """Get the cache of digests of files hashed (see
+    lib.digests.ChecksumCache), in the cache directory, or None if
+    'checksum_cache' is false in the config file."""
+    if not get_config('checksum_cache', default=True):
+        return None
+    db_path = get_cache_dir() / checksum_cache_file
+    with _checksum_cache_lock:
+        if db_path not in _checksum_cache:
+            _checksum_cache[db_path] = ChecksumCache(db_path)
+
+        return _checksum_cache[db_path]
+
+
 # def linux2win(path):
 #     wp = Path(str(path).replace('/mnt', 'V:').replace('/', '\\'))
 #     return wp
@@ -375,8 +446,8 @@ def gdf_from_metadata(scene_md_paths, relative_directory=None,
         try:
             # TODO: Figure out why some footprints are multipolygon - handle better
             if metadata['geometry']['type'] == 'Polygon':
-                properties['geometry'] = Polygon(metadata['geometry']
-                                                 ['coordinates'][0])
+                properties['geometry'] = shapely.geometry.Polygon(
+                    metadata['geometry']['coordinates'][0])
             elif metadata['geometry']['type'] == 'MultiPolygon':
                 logger.warning('MultiPolygon geometry found. Not yet supported'
                                ' - skipping.')
@@ -486,17 +557,16 @@ def create_scene_manifests(master_manifest, overwrite=False):
 
 
 def create_file_md5(fname):
-    hash_md5 = hashlib.md5()
-    with open(fname, "rb") as f:
-        for chunk in iter(lambda: f.read(4096), b""):
-            hash_md5.update(chunk)
-
-    return hash_md5.hexdigest()
+    return compute_file_digests(fname, algorithms=(k_md5,))[k_md5]
 
 
 def verify_scene_md5(manifest_md5, scene_file):
+    """Verify scene file against the md5 in its manifest, using the
+    digests recorded when the file was downloaded or cached when last
+    hashed if it is unchanged since, rather than reading the whole file
+    again."""
     logger.debug('Verifying md5 checksum for scene: {}'.format(scene_file))
-    file_md5 = create_file_md5(scene_file)
+    file_md5 = file_digests(scene_file, cache=get_checksum_cache())[k_md5]
     if file_md5 == manifest_md5:
         verified = True
     else:
@@ -507,12 +577,56 @@ def verify_scene_md5(manifest_md5, scene_file):
     return verified
 
 
-def verify_all_checksums(scenes, verify_checksums=True):
+def verify_digests(expected, digests, scene_file):
+    """Check digests of a scene file against all of those expected, e.g.
+    both md5 and sha256 from its manifest. Invalid if none are expected,
+    e.g. the manifest is missing or does not list the file."""
+    if not expected:
+        logger.warning('No checksums in manifest to verify scene: '
+                       '{}'.format(scene_file))
+        return False
+    mismatched = [a for a, d in expected.items() if digests.get(a) != d]
+    if mismatched:
+        logger.warning('Verification of {} checksum failed for scene: '
+                       '{}'.format(', '.join(mismatched), scene_file))
+        return False
+
+    return True
+
+
+def verify_all_checksums(scenes, verify_checksums=True, threads=None):
+    """
+    Verify the checksums of scene files in parallel, see
+    lib.digests.hash_files, each file read once for all digests listed
+    in its manifest, and files unchanged since last hashed not read
+    again (see get_checksum_cache). Results are set on each PlanetScene
+    (valid_checksum).
+
+    Parameters
+    ----------
+    scenes : list
+        PlanetScenes.
+    verify_checksums : bool
+        If False, scenes are marked to skip checksums.
+    threads : int
+        Files hashed at once, defaults to 'hash_threads' in the config
+        file.
+    """
     # Verify checksum, or mark all as skip if not checking
     if verify_checksums:
         logger.info('Verifying scene checksums...')
-        for ps in tqdm(scenes, desc='Verifying scene checksums...'):
-            ps.verify_checksum()
+        if threads is None:
+            threads = get_config('hash_threads',
+                                 default=default_hash_threads)
+        to_verify = [ps for ps in scenes if ps._valid_checksum is None]
+        algorithms = tuple(dict.fromkeys(
+            [a for ps in to_verify for a in ps.expected_digests]))
+        digests = hash_files([ps.scene_path for ps in to_verify],
+                             algorithms=algorithms, threads=threads,
+                             cache=get_checksum_cache(),
+                             desc='Verifying scene checksums')
+        for ps in to_verify:
+            ps.check_digests(digests[ps.scene_path])
     else:
         logger.info('Skipping checksum verification...')
         for ps in scenes:
@@ -543,13 +657,19 @@ def add_renamed_attributes(node, renamer, root, attributes):
 
 
 def find_planet_scenes(directory, exclude_meta=None,
-                       shelved_parent=None):
+                       shelved_parent=None, dir_index=None):
+    """Create PlanetScenes from all scene manifests in directory, its
+    files listed once (see lib.dir_index.DirectoryIndex) and the index
+    shared by the scenes to locate their metadata files."""
     if not isinstance(directory, pathlib.PurePath):
         directory = Path(directory)
-    manifest_files = directory.rglob('*_manifest.json')
+    if dir_index is None:
+        dir_index = DirectoryIndex(directory)
+    manifest_files = dir_index.find(directory, suffix='_manifest.json')
 
     planet_scenes = [PlanetScene(mf, exclude_meta=exclude_meta,
-                                 shelved_parent=shelved_parent)
+                                 shelved_parent=shelved_parent,
+                                 dir_index=dir_index)
                      for mf in manifest_files]
 
     return planet_scenes
@@ -562,7 +682,9 @@ def locate_manifest(scene):
 class PlanetScene:
     def __init__(self, source, exclude_meta=None,
                  shelved_parent=None,
-                 scene_file_source=False):
+                 scene_file_source=False,
+                 scene_remote=False,
+                 dir_index=None):
         """A class to represent a Planet scene, including metadata
         file paths, attributes, etc.
 
@@ -587,7 +709,18 @@ class PlanetScene:
             Alternative path to build shelved directories on, if not
             passed, default data directory is used. Useful for "shelving"
             in other locations, i.e. for deliveries.
+        scene_remote : bool
+            The scene file is not on disk alongside its metadata, e.g. it
+            is streamed from S3 straight to its shelved location (see
+            lib.shelve_direct), so it is not required to exist to be
+            shelveable.
+        dir_index : lib.dir_index.DirectoryIndex
+            Index of the files of the directory the scene is in, shared
+            by scenes to locate metadata files without listing the
+            directory for each. If not passed, the scene's directory is
+            indexed when its metadata files are first located.
         """
+        self.dir_index = dir_index
         # TODO: Refactor so that a scene tif or metadata can be passed
         #  as source. Some methods won't be available, but this class
         #  can still be used for locating scene metadata files,
@@ -598,7 +731,8 @@ class PlanetScene:
             source = Path(source)
             manifest = Path('{}_manifest.json'.format(source.parent /
                                                       source.stem))
-            if manifest.exists():
+            if (dir_index.exists(manifest) if dir_index else
+                    manifest.exists()):
                 source = manifest
                 self.scene_manifest_present = True
             else:
@@ -611,6 +745,7 @@ class PlanetScene:
             logger.error('Must pass *_manifest.json file.')
 
         self.exclude_meta = exclude_meta
+        self.scene_remote = scene_remote
         # Parent directory upon which shelved path is built
         if shelved_parent:
             self.shelved_parent = shelved_parent
@@ -635,11 +770,7 @@ class PlanetScene:
 
         # Determine "scene name" - the scene name without post processing
         # suffixes used when searching for metadata files, e.g.: _SR
-        self.scene_name = self.scene_path.stem
-        scene_sfxs = ['_SR', '_DN', ]
-        if any([sfx in self.scene_name for sfx in scene_sfxs]):
-            for sfx in scene_sfxs:
-                self.scene_name = self.scene_name.replace(sfx, '')
+        self.scene_name = scene_name(self.scene_path)
 
         # Empty attributes calculated from methods
         self._shelveable = None
@@ -718,12 +849,14 @@ class PlanetScene:
         if self._meta_files is None:
             logger.debug('Locating metadata files for: '
                          '{}'.format(self.scene_path))
+            if self.dir_index is None:
+                self.dir_index = DirectoryIndex(self.scene_path.parent)
             self._meta_files = [f for f in
-                                self.scene_path.parent.rglob(
-                                    '{}*'.format(self.scene_name)
-                                )
-                                if f != self.scene_path]
-            if self.metadata_json.exists():
+                                self.dir_index.find(self.scene_path.parent,
+                                                    prefix=self.scene_name)
+                                if f != self.scene_path
+                                and not is_sidecar(f)]
+            if self.dir_index.exists(self.metadata_json):
                 self._meta_files.append(self.metadata_json)
             else:
                 logger.debug('Metadata JSON not found for: '
@@ -740,10 +873,28 @@ class PlanetScene:
             self._scene_files = self.meta_files + [self.scene_path]
         return self._scene_files
 
+    @property
+    def expected_digests(self):
+        """Digests of the scene file listed in its manifest."""
+        return {a: d for a, d in ((k_md5, self.md5), (k_sha256, self.sha256))
+                if d}
+
+    def check_digests(self, digests):
+        """Set whether the scene file is valid from its digests, e.g.
+        computed for many scenes at once by verify_all_checksums, None
+        if the file could not be read."""
+        if digests is None:
+            self._valid_checksum = False
+        else:
+            self._valid_checksum = verify_digests(self.expected_digests,
+                                                  digests, self.scene_path)
+        return self._valid_checksum
+
     @property
     def valid_checksum(self):
         if self._valid_checksum is None:
-            self._valid_checksum = verify_scene_md5(self.md5, self.scene_path)
+            self.check_digests(file_digests(self.scene_path,
+                                            cache=get_checksum_cache()))
         return self._valid_checksum
 
     def verify_checksum(self):
@@ -893,11 +1044,11 @@ class PlanetScene:
                 pts = [(pt.split(',')) for pt in points]
                 pts = [tuple(pt.split(',')) for pt in points]
                 pts = [tuple(float(x) for x in p) for p in pts]
-                self._geometry = Polygon(pts)
+                self._geometry = shapely.geometry.Polygon(pts)
 
                 # Convert center point to shapely Point
-                self._centroid = Point(float(x) for x in
-                                       attributes['centroid'].split())
+                self._centroid = shapely.geometry.Point(
+                    float(x) for x in attributes['centroid'].split())
                 self._center_x = self._centroid.x
                 self._center_y = self._centroid.y
 
@@ -978,7 +1129,7 @@ class PlanetScene:
     @property
     def shelveable(self):
         """True if all attributes necessary to shelve are found."""
-        required_atts = [self.scene_path.exists(),
+        required_atts = [self.scene_path.exists() or self.scene_remote,
                          self.xml_path,
                          self.xml_valid,
                          self.instrument,
@@ -0,0 +1,179 @@
+import os
+import time
+
+from lib.db import Postgres
+from lib.lazy import lazy_import
+from lib.lib import get_cache_dir, get_config
+from lib.logging_utils import create_logger
+
+# Imported on first use
+np = lazy_import('numpy')
+
+logger = create_logger(__name__, 'sh', 'INFO')
+
+# Tables of scene IDs that can be excluded from searches / orders
+scenes = 'scenes'
+scenes_onhand = 'scenes_onhand'
+id_col = 'id'
+geom_col = 'geometry'
+# Acquisition date column in each table
+date_cols = {scenes: 'acquired',
+             scenes_onhand: 'acquisitiondatetime'}
+# Local snapshot of on hand IDs, in the cache directory
+onhand_snapshot_file = 'scenes_onhand_ids.npy'
+# Hours a snapshot is used before being loaded again from the database,
+# overridden by 'onhand_snapshot_ttl' in the config file
+default_snapshot_ttl = 12
+
+
+class IDSet:
+    def __init__(self, ids):
+        """
+        Compact, read-only set of scene IDs. IDs are held in a sorted
+        numpy array of fixed-width byte strings (~20 bytes per ID rather
+        than ~70 for a Python str in a set), and membership is checked by
+        binary search, which can be done for a whole page of IDs at once
+        with contains().
+
+        Parameters
+        ----------
+        ids : iterable
+            Scene IDs, duplicates are removed.
+        """
+        ids = [str(i) for i in ids if i is not None]
+        if ids:
+            self._ids = np.unique(np.array(ids, dtype='S'))
+        else:
+            self._ids = np.array([], dtype='S1')
+
+    def __len__(self):
+        return len(self._ids)
+
+    def __contains__(self, scene_id):
+        return bool(self.contains([scene_id])[0])
+
+    def contains(self, ids):
+        """Determine which of the passed ids are in the set.
+
+        Returns
+        -------
+        np.ndarray : bool for each of ids
+        """
+        ids = np.array([str(i) for i in ids], dtype='S')
+        if len(self._ids) == 0 or len(ids) == 0:
+            return np.zeros(len(ids), dtype=bool)
+        idx = np.searchsorted(self._ids, ids)
+        idx[idx == len(self._ids)] = 0
+
+        return self._ids[idx] == ids
+
+    def tolist(self):
+        return [i.decode() for i in self._ids]
+
+    def save(self, path):
+        tmp_path = '{}.tmp'.format(path)
+        with open(tmp_path, 'wb') as dst:
+            np.save(dst, self._ids)
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path):
+        id_set = cls([])
+        with open(path, 'rb') as src:
+            id_set._ids = np.load(src)
+
+        return id_set
+
+    def exclude(self, ids):
+        """Return only the passed ids that are not in the set."""
+        ids = list(ids)
+        in_set = self.contains(ids)
+
+        return [i for i, is_in in zip(ids, in_set) if not is_in]
+
+
+def load_ids(tables, where=None):
+    """Load the distinct scene IDs in each of tables, optionally only
+    those matching a where clause, into an IDSet.
+
+    Parameters
+    ----------
+    tables : str, list
+        Table(s) to load IDs from, e.g. ['scenes_onhand']
+    where : dict
+        Optional where clause for each table: {table: where}
+
+    Returns
+    -------
+    IDSet
+    """
+    if isinstance(tables, str):
+        tables = [tables]
+    ids = []
+    with Postgres() as db:
+        for tbl in tables:
+            sql = "SELECT DISTINCT {} FROM {}".format(id_col, tbl)
+            if where and where.get(tbl):
+                sql += " WHERE {}".format(where[tbl])
+            tbl_ids = [r[0] for r in db.execute_sql(sql)]
+            logger.info('IDs loaded from {}: {:,}'.format(tbl, len(tbl_ids)))
+            ids.extend(tbl_ids)
+
+    return IDSet(ids)
+
+
+def load_onhand_snapshot(ttl=None, refresh=False):
+    """Get the IDs in scenes_onhand as an IDSet, from a snapshot saved
+    in the cache directory if it is less than ttl hours old, otherwise
+    from the database, saving a new snapshot.
+
+    Parameters
+    ----------
+    ttl : float
+        Max age of snapshot in hours, defaults to 'onhand_snapshot_ttl'
+        in the config file.
+    refresh : bool
+        Load from the database regardless of the snapshot's age.
+
+    Returns
+    -------
+    IDSet
+    """
+    if ttl is None:
+        ttl = get_config('onhand_snapshot_ttl', default=default_snapshot_ttl)
+    snapshot = get_cache_dir() / onhand_snapshot_file
+    if (not refresh and snapshot.exists() and
+            time.time() - snapshot.stat().st_mtime < ttl * 60 * 60):
+        onhand = IDSet.load(snapshot)
+        logger.debug('On hand IDs loaded from snapshot: {:,}'.format(
+            len(onhand)))
+        return onhand
+    onhand = load_ids(scenes_onhand)
+    onhand.save(snapshot)
+
+    return onhand
+
+
+def load_exclude_ids(not_on_hand=False, fp_not_on_hand=False):
+    """Load the IDs to remove from search results, if any.
+
+    Parameters
+    ----------
+    not_on_hand : bool
+        Exclude IDs in the scenes_onhand table.
+    fp_not_on_hand : bool
+        Exclude IDs in the scenes (footprint) table.
+
+    Returns
+    -------
+    IDSet, None if neither table is to be excluded
+    """
+    tables = []
+    if not_on_hand:
+        tables.append(scenes_onhand)
+    if fp_not_on_hand:
+        tables.append(scenes)
+    if not tables:
+        return None
+
+    return load_ids(tables)
@@ -3,27 +3,44 @@ import json
 
 import os
 import pathlib
-import requests
+import threading
 import time
-import sys
 
-from itertools import product
-from multiprocessing.dummy import Pool as ThreadPool
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
-from requests.auth import HTTPBasicAuth
-from retrying import retry, RetryError
-
-import boto3
-
-import geopandas as gpd
 
 from tqdm import tqdm
 
-from lib.lib import read_ids, get_config
+from lib.archive import ArchiveExtractor, archive_filename, archive_type, \
+    is_archive, is_within
+from lib.lazy import lazy_import
+from lib.lib import read_ids, get_config, id_from_scene, k_annotations, \
+    k_digests, k_files, k_item_id, k_md5, k_path
+from lib.download_ledger import etag_md5
+from lib.transfer import S3Downloader, get_transfer_config, \
+    default_max_workers, default_part_concurrency
 from lib.db import Postgres, stereo_pair_sql
+from lib.onhand import load_onhand_snapshot
+from lib.order_tools import check_clippable, create_clip_tool, \
+    estimate_order_size, excluded_paths, get_exclude_assets, \
+    load_footprints, log_size_estimate, read_clip_aoi, trim_bundle
+from lib.shelve_direct import shelve_order_direct
+from lib import s3_inventory
+from lib.s3_inventory import master_manifest
+from lib.order_registry import OrderRegistry, dl_started, dl_success, \
+    dl_failed, dl_not_ready
+from lib.order_scheduler import OrderJournal, OrderScheduler, chunk_ids, \
+    default_journal_path, default_threads
+from lib.transport import ORDERS_STATS_URL, ORDERS_URL, get_shared_session
 from lib.logging_utils import create_logger
 
 
+# Imported on first use
+boto3 = lazy_import('boto3')
+botocore = lazy_import('botocore')
+lazy_import('botocore.config')
+gpd = lazy_import('geopandas')
+
 logger = create_logger(__name__, 'sh', 'INFO')
 
 # Constants
@@ -41,12 +58,9 @@ logger = create_logger(__name__, 'sh', 'INFO')
 srid = 4326
 
 # Planet
-# API URLs
-ORDERS_URL = "https://api.planet.com/compute/ops/orders/v2"
 PLANET_API_KEY = os.getenv("PL_API_KEY")
 if not PLANET_API_KEY:
     logger.error("Error retrieving API key. Is PL_API_KEY env. variable set?")
-auth = HTTPBasicAuth(PLANET_API_KEY, "")
 
 # Postgres
 # Used for finding connection config file -> config/sandwich-pool.planet.json
@@ -59,55 +73,106 @@ fld_id = 'id'
 
 # AWS
 # TODO: Update when NASA bucket created
-aws_params = get_config("aws")
-aws_access_key_id = aws_params["aws_access_key_id"]
-aws_secret_access_key = aws_params["aws_secret_access_key"]
-aws_bucket = aws_params["aws_bucket"]
-aws_region = aws_params["aws_region"]
-aws_path_prefix = aws_params["aws_path_prefix"]
+# Key of AWS parameters in config file, read when first needed
+aws_key = "aws"
 bucket_name = 'pgc-data'
 prefix = r'jeff/planet'
 
-default_dst_parent = get_config("shelved_loc")
-
-# Check Planet authorization
-auth_resp = requests.get(ORDERS_URL, auth=auth)
-logger.debug("Authorizing Planet API Key....")
-if auth_resp.status_code != 200:
-    logger.error("Issue authorizing: {}".format(auth_resp))
-logger.debug("Response: {}".format(auth_resp))
-
-headers = {"content-type": "application/json"}
+# Order tracking
+# Orders API states
+ready_states = ['success', 'partial']
+failed_states = ['failed', 'cancelled']
+# Sources for checking if orders are ready
+api_source = 'api'
+s3_source = 's3'
+# Seconds between checks of all pending orders
+default_poll_interval = 60
+# Seconds to wait for orders to be ready before giving up
+default_wait_max = 4 * 60 * 60
+
+# Local record of orders, created on first use
+order_registry = None
+# Whether the API key has been checked, see check_auth
+auth_checked = False
+auth_lock = threading.Lock()
+
+
+def check_auth():
+    """Check the Planet API key is authorized, the first time the
+    Orders API is used, rather than on import."""
+    global auth_checked
+    with auth_lock:
+        if auth_checked:
+            return
+        auth_checked = True
+        logger.debug("Authorizing Planet API Key....")
+        auth_resp = get_shared_session().get(ORDERS_URL)
+    if auth_resp.status_code != 200:
+        logger.error("Issue authorizing: {}".format(auth_resp))
+    logger.debug("Response: {}".format(auth_resp))
+
+
+def get_session():
+    """Session for Orders API requests, shared by all threads and with
+    lib.search, with pooled connections, retries and a circuit breaker
+    (see lib.transport)."""
+    check_auth()
+    return get_shared_session()
+
+
+def get_aws_params():
+    """Get the AWS credentials, bucket, region and path prefix orders
+    are delivered to, from the config file."""
+    return get_config(aws_key)
+
+
+def get_order_registry(refresh=False):
+    """Get the local registry of orders, which is created once and
+    shared. If refresh, orders are read from the API."""
+    global order_registry
+    if order_registry is None:
+        order_registry = OrderRegistry(session=get_session(),
+                                       orders_url=ORDERS_URL)
+    if refresh:
+        order_registry.refresh()
+
+    return order_registry
 
 
 def connect_aws_bucket(bucket_name=bucket_name,
-                       aws_access_key_id=aws_access_key_id,
-                       aws_secret_access_key=aws_secret_access_key):
+                       aws_access_key_id=None,
+                       aws_secret_access_key=None,
+                       max_pool_connections=10):
+    # Credentials not passed are read from the config file
+    if aws_access_key_id is None or aws_secret_access_key is None:
+        aws_params = get_aws_params()
+        aws_access_key_id = (aws_access_key_id or
+                             aws_params["aws_access_key_id"])
+        aws_secret_access_key = (aws_secret_access_key or
+                                 aws_params["aws_secret_access_key"])
+    config = botocore.config.Config(max_pool_connections=max_pool_connections)
     s3 = boto3.resource('s3', aws_access_key_id=aws_access_key_id,
-                        aws_secret_access_key=aws_secret_access_key, )
+                        aws_secret_access_key=aws_secret_access_key,
+                        config=config)
     bucket = s3.Bucket(bucket_name)
 
     return bucket
 
 
+def get_inventory(bucket, prefix=prefix):
+    """Get the inventory of orders in the bucket under prefix, which is
+    created once and shared, see lib.s3_inventory.get_inventory."""
+    return s3_inventory.get_inventory(bucket, prefix)
+
+
 def get_oids(prefix=prefix):
     """
     Get all immediate subdirectories of prefix in AWS, these are Planet order ids.
     """
-    # s3 = boto3.resource('s3', aws_access_key_id=aws_access_key_id,
-    #                     aws_secret_access_key=aws_secret_access_key, )
-    #
-    # bucket = s3.Bucket(bucket_name)
     bucket = connect_aws_bucket()
 
-    bucket_filter = bucket.objects.filter(Prefix=prefix)
-    oids = set()
     logger.info('Getting order IDs...')
-    for i, bo in enumerate(bucket_filter):
-        key = Path(bo.key)
-        oid = key.relative_to(Path(prefix)).parent.parent
-        if str(oid) != '.':
-            oids.add(str(oid))
+    oids = get_inventory(bucket, prefix).list_orders()
 
     logger.info('Order IDs found: {}'.format(len(oids)))
 
@@ -118,18 +183,12 @@ def manifest_exists(order_id, bucket):
     """
     Check if source for given order id exists in AWS bucket.
     Manifest is last file delivered for order and so presence
-    order is ready to download.
+    order is ready to download. Orders delivered as a zip archive are
+    ready once the archive exists.
     """
-    # Path to source for order
-    mani_path = prefix / Path(order_id) / 'source.json'
-    # Get files that match source path - should only be one
-    mani_filter = bucket.objects.filter(Prefix=mani_path.as_posix())
-    objs = list(mani_filter)
-    if len(objs) >= 1 and objs[0].key == mani_path.as_posix():
+    mani_exists = get_inventory(bucket).manifest_exists(order_id)
+    if mani_exists:
         logger.debug('Manifest for {} exists.'.format(order_id))
-        mani_exists = True
-    else:
-        mani_exists = False
 
     return mani_exists
 
@@ -140,10 +199,78 @@ def manifest_exists(order_id, bucket):
 #     return orders2dl
 
 
-def dl_order(oid, dst_par_dir, bucket, overwrite=False, dryrun=False):
+def read_order_manifest(oid, bucket):
+    """Get the entry for each file in an order's manifest (source.json)
+    in the bucket, empty if the manifest is not present."""
+    mani_key = '{}/{}/{}'.format(prefix, oid, master_manifest)
+    try:
+        mani = json.load(bucket.Object(mani_key).get()['Body'])
+    except bucket.meta.client.exceptions.NoSuchKey:
+        return []
+
+    return mani[k_files]
+
+
+def manifest_md5s(manifest):
+    """Get {path relative to order: md5} from manifest entries."""
+    return {f[k_path]: f[k_digests][k_md5] for f in manifest
+            if k_md5 in f.get(k_digests, {})}
+
+
+def get_manifest_md5s(oid, bucket):
+    """Get the md5 of each file in an order from its manifest
+    (source.json) in the bucket, as {path relative to order: md5}, empty
+    if the manifest is not present."""
+    return manifest_md5s(read_order_manifest(oid, bucket))
+
+
+def object_scene_ids(paths, manifest):
+    """
+    Get the scene ID of each file in an order, from the order manifest,
+    or if not listed there, parsed from the file name (see
+    id_from_scene).
+
+    Parameters
+    ----------
+    paths : list
+        Paths of files, relative to the order.
+    manifest : list
+        Manifest entries, see read_order_manifest.
+
+    Returns
+    -------
+    list : scene ID of each path, None for files that are not part of a
+        scene (e.g. the manifest)
+    """
+    manifest_ids = {f[k_path]: f.get(k_annotations, {}).get(k_item_id)
+                    for f in manifest}
+    scene_ids = []
+    for p in paths:
+        scene_id = manifest_ids.get(p)
+        if scene_id is None and any(['_{}_'.format(lvl) in Path(p).name
+                                     for lvl in ['1B', '3B']]):
+            scene_id = id_from_scene(p)
+        scene_ids.append(scene_id)
+
+    return scene_ids
+
+
+def dl_order(oid, dst_par_dir, bucket, overwrite=False, dryrun=False,
+             downloader=None, onhand=None):
     """Download an order id (oid) to destination parent directory, creating
     a new subdirectory for the order id. Order ID is also name of subdirectory
-    in AWS bucket."""
+    in AWS bucket. Files are downloaded concurrently by downloader, which
+    can be shared between orders, if not provided one is created for the
+    order. Existing files are skipped, unless overwrite, only if they match
+    the size and ETag (or manifest md5) of their objects, see
+    S3Downloader.is_current(), and interrupted downloads are resumed.
+    Orders delivered as zip archives have their members extracted straight
+    from the bucket into the order subdirectory, see
+    lib.archive.ArchiveExtractor.
+    If onhand (an IDSet of scene IDs) is passed, files of scenes in it are
+    not downloaded, the bytes not downloaded being added to the
+    downloader's stats, as are files of the asset types in
+    'exclude_assets' in the config file (see lib.order_tools)."""
     # TODO: Resolve why at least dst_par dir is not coming in as PurePath
     if not isinstance(oid, pathlib.PurePath):
         oid = Path(oid)
@@ -152,53 +279,118 @@ def dl_order(oid, dst_par_dir, bucket, overwrite=False, dryrun=False):
 
     logger.info('Downloading order: {}'.format(oid))
 
-    # Filter the bucket for the order id, removing any directory keys
-    order_prefix = '{}/{}'.format(prefix, oid)
-    bucket_filter = [bo for bo in bucket.objects.filter(Prefix=order_prefix)
-                     if not bo.key.endswith('/')]
-
-    # Set up progress bar
-    # For setting progress bar length
-    item_count = len([x for x in bucket_filter])
-    pbar = tqdm(bucket_filter, total=item_count, desc='Order: {}'.format(oid), position=1)
-    # For aligning arrows in progress bar writing
-    # arrow_loc = max([len(x.key) for x in bucket_filter]) - len(order_prefix)
+    # Objects of the order, listed only if not indexed since delivery
+    bucket_filter = get_inventory(bucket).order_objects(oid)
 
     oid_dir = dst_par_dir / oid
     if not os.path.exists(oid_dir):
         os.makedirs(oid_dir)
 
-    logger.info('Downloading {:,} files to: {}'.format(item_count, oid_dir))
-    for bo in pbar:
-        # Determine source and destination full paths
-        aws_loc = Path(bo.key)
-        # Create destination subdirectory path with order id as subdirectory
-        dst_path = dst_par_dir / aws_loc.relative_to(Path(prefix))
-        if not os.path.exists(dst_path.parent):
-            os.makedirs(dst_path.parent)
-
-        # Download
-        if os.path.exists(dst_path) and not overwrite:
-            logger.debug('File exists at destination, skipping: {}'.format(dst_path))
-            continue
+    own_downloader = downloader is None
+    if own_downloader:
+        downloader = S3Downloader(bucket)
+
+    # Files to fetch, by the downloader, or extracted from each archive
+    # by its ArchiveExtractor: [(source, {path relative to order: object})]
+    sources = []
+    loose = {}
+    for bo in bucket_filter:
+        rel_path = Path(bo.key).relative_to(Path(prefix) / oid).as_posix()
+        if is_archive(bo.key):
+            logger.info('Extracting from archive: {}'.format(rel_path))
+            extractor = ArchiveExtractor(downloader, bo.key, bo.size,
+                                         bo.e_tag)
+            sources.append((extractor, extractor.members()))
         else:
-            logger.debug('Downloading file: {}\n\t--> {}'.format(aws_loc, dst_path.absolute()))
-            # pbar.write('Downloading: {}{}-> {}'.format(aws_loc.relative_to(*aws_loc.parts[:3]),
-            #                                            ' '*(arrow_loc - len(str(aws_loc.relative_to(*aws_loc.parts[:3])))),
-            #                                            oid_dir.relative_to(*dst_par_dir.parts[:9])))
-        dl_issues = set()
-        if not dryrun:
-            try:
-                bucket.download_file(bo.key, str(dst_path))
-                dl_issues.add(False)
-            except Exception as e:
-                logger.error('Error downloading: {}'.format(aws_loc))
-                logger.error(e)
-                dl_issues.add(True)
+            loose[rel_path] = bo
+    if loose:
+        sources.append((downloader, loose))
+
+    exclude_assets = get_exclude_assets()
+    futures = []
+    results = []
+    for source, objects in sources:
+        item_count = len(objects)
+        is_extractor = isinstance(source, ArchiveExtractor)
+        # Read the manifest only if needed
+        manifest = None
+        if onhand is not None or exclude_assets:
+            if not is_extractor:
+                manifest = read_order_manifest(oid, bucket)
+            elif master_manifest in objects:
+                manifest = json.loads(source.read(master_manifest))[k_files]
+            else:
+                manifest = []
+        if exclude_assets:
+            excluded = excluded_paths(manifest, exclude_assets)
+            for rel_path in excluded & set(objects):
+                downloader.stats.add_excluded(objects.pop(rel_path).size)
+            if item_count != len(objects):
+                logger.info('Files of excluded asset types, not downloading: '
+                            '{:,}'.format(item_count - len(objects)))
+                item_count = len(objects)
+        if onhand is not None:
+            scene_ids = object_scene_ids(list(objects), manifest)
+            is_onhand = onhand.contains([s or '' for s in scene_ids])
+            for rel_path, oh in zip(list(objects), is_onhand):
+                if oh:
+                    downloader.stats.add_onhand(objects.pop(rel_path).size)
+            if item_count != len(objects):
+                logger.info('Files of scenes on hand, not downloading: '
+                            '{:,} ({:,} scenes)'.format(
+                                item_count - len(objects),
+                                len(set([s for s, oh in zip(scene_ids,
+                                                            is_onhand)
+                                         if oh]))))
+                item_count = len(objects)
+
+        logger.info('Downloading {:,} files to: {}'.format(item_count,
+                                                           oid_dir))
+        md5s = manifest_md5s(manifest) if manifest is not None else None
+        for rel_path, bo in objects.items():
+            # Destination path with order id as subdirectory
+            dst_path = oid_dir / rel_path
+            if not is_within(oid_dir, dst_path):
+                logger.error('Destination outside of order directory, '
+                             'skipping: {}'.format(bo.key))
+                results.append(False)
+                continue
+            if not os.path.exists(dst_path.parent):
+                os.makedirs(dst_path.parent, exist_ok=True)
+
+            # Download
+            if os.path.exists(dst_path) and not overwrite:
+                if (md5s is None and not is_extractor and
+                        etag_md5(bo.e_tag) is None):
+                    md5s = get_manifest_md5s(oid, bucket)
+                md5 = (md5s or {}).get(rel_path)
+                if source.is_current(bo.key, dst_path, bo.size, bo.e_tag,
+                                     md5=md5):
+                    logger.debug('File exists at destination, skipping: '
+                                 '{}'.format(dst_path))
+                    downloader.stats.add_file(skipped=True)
+                    continue
+                logger.debug('File at destination does not match source, '
+                             'downloading again: {}'.format(dst_path))
+            logger.debug('Downloading file: {}\n\t--> {}'.format(
+                bo.key, dst_path.absolute()))
+            if not dryrun:
+                futures.append(source.submit(bo.key, dst_path, size=bo.size,
+                                             etag=bo.e_tag))
+
+    # Set up progress bar
+    pbar = tqdm(total=len(futures), desc='Order: {}'.format(oid), position=1)
+    for future in futures:
+        results.append(future.result())
+        pbar.update(1)
+    pbar.close()
+    if own_downloader:
+        downloader.shutdown()
+        downloader.stats.report()
 
     logger.info('Done.')
 
-    all_success = any(dl_issues)
+    all_success = all(results)
 
     return all_success
 
@@ -206,7 +398,8 @@ def dl_order(oid, dst_par_dir, bucket, overwrite=False, dryrun=False):
 def dl_order_when_ready(order_id, dst_par_dir, bucket,
                         overwrite=False, dryrun=False,
                         wait_start=2, wait_interval=10,
-                        wait_max_interval=300, wait_max=5400):
+                        wait_max_interval=300, wait_max=5400,
+                        downloader=None):
     """
     Wrapper for dl_order that checks if source.json is present
     in order subdirectory in AWS bucket before downloading. Checks
@@ -219,6 +412,7 @@ def dl_order_when_ready(order_id, dst_par_dir, bucket,
     running_time = (datetime.datetime.now() - start_time).total_seconds()
     wait = wait_start
     start_dl = False
+    all_success = False
     # Check for presence of source, sleeping between checks.
     while running_time < wait_max and not start_dl:
         exists = manifest_exists(order_id, bucket=bucket)
@@ -239,29 +433,221 @@ def dl_order_when_ready(order_id, dst_par_dir, bucket,
     if start_dl:
         logger.info('Started downloading: {}'.format(order_id))
         all_success = dl_order(order_id, dst_par_dir=dst_par_dir, bucket=bucket,
-                               overwrite=overwrite, dryrun=dryrun)
+                               overwrite=overwrite, dryrun=dryrun,
+                               downloader=downloader)
     else:
         logger.info('Maximum wait reached, did not begin download: {}'.format(order_id))
 
     return order_id, start_dl, all_success
 
 
-def download_parallel(order_ids, dst_par_dir, overwrite=False, dryrun=False, threads=4, wait_max=3600):
+class OrderTracker:
+    def __init__(self, order_ids, bucket, source=api_source,
+                 poll_interval=default_poll_interval,
+                 wait_max=default_wait_max):
+        """
+        Tracks many orders from a single loop, checking which are ready
+        on each tick with one pass over all pending orders rather than a
+        thread sleeping and polling per order.
+
+        Parameters
+        ----------
+        order_ids : list
+            Order IDs to track.
+        bucket : boto3 s3.Bucket
+            Bucket orders are delivered to.
+        source : str
+            'api': check the state of all pending orders with one read of
+            the orders list (see lib.order_registry), confirming a
+            successful order's manifest is in the bucket before reporting
+            it ready. Orders not in the list are ready once their
+            manifest is in the bucket.
+            's3': list all manifest (source.json) keys in the bucket once
+            per tick.
+        poll_interval : float
+            Seconds between ticks.
+        wait_max : float
+            Seconds after which orders that are not ready are abandoned.
+        """
+        if source not in (api_source, s3_source):
+            raise ValueError('Unknown source: {}'.format(source))
+        self.pending = list(dict.fromkeys(order_ids))
+        self.bucket = bucket
+        self.source = source
+        self.poll_interval = poll_interval
+        self.wait_max = wait_max
+        self.states = {}
+        # Orders not in the registry, warned about once
+        self.unlisted = set()
+        self.start = time.time()
+
+    @property
+    def elapsed(self):
+        return time.time() - self.start
+
+    def _api_ready(self):
+        # One paginated read of the orders list for all pending orders
+        try:
+            registry = get_order_registry(refresh=True)
+        except Exception as e:
+            logger.warning('Could not refresh order states: {}'.format(e))
+            return []
+        self.states.update(registry.states(self.pending))
+        ready = []
+        for oid in self.pending:
+            if oid not in self.states:
+                # E.g. orders older than the orders list returns or
+                # placed by another account, ready once delivered
+                if oid not in self.unlisted:
+                    logger.warning('Order not in orders list, checking for '
+                                   'its manifest: {}'.format(oid))
+                    self.unlisted.add(oid)
+                if manifest_exists(oid, self.bucket):
+                    ready.append(oid)
+            elif (self.states[oid] in ready_states and
+                  manifest_exists(oid, self.bucket)):
+                ready.append(oid)
+
+        return ready
+
+    def _s3_ready(self):
+        manifests = list_manifests(self.bucket)
+        return [oid for oid in self.pending if oid in manifests]
+
+    def check(self):
+        """
+        Check all pending orders once.
+
+        Returns
+        -------
+        tuple : (list of order IDs now ready,
+                 list of order IDs that ended without being delivered)
+        """
+        if self.source == api_source:
+            ready = self._api_ready()
+        else:
+            ready = self._s3_ready()
+        failed = [oid for oid in self.pending
+                  if self.states.get(oid) in failed_states]
+        for oid in failed:
+            logger.warning('Order {} ended without delivery: '
+                           '{}'.format(oid, self.states[oid]))
+        done = set(ready) | set(failed)
+        self.pending = [oid for oid in self.pending if oid not in done]
+
+        return ready, failed
+
+    def poll(self):
+        """
+        Generator yielding each order ID as soon as it is ready, until
+        all orders are ready, have failed, or wait_max is reached.
+        """
+        while self.pending:
+            ready, _failed = self.check()
+            states = [self.states.get(oid) for oid in self.pending]
+            logger.info('Orders ready: {:,} - pending: {:,} ({})'.format(
+                len(ready), len(self.pending),
+                ', '.join(['{}: {}'.format(s, states.count(s))
+                           for s in sorted(set(states), key=str)])))
+            for oid in ready:
+                yield oid
+            if not self.pending:
+                break
+            if self.elapsed + self.poll_interval > self.wait_max:
+                logger.warning('Maximum wait reached, orders not ready: '
+                               '{}'.format(', '.join(self.pending)))
+                break
+            time.sleep(self.poll_interval)
+
+
+def list_manifests(bucket, prefix=prefix):
+    """Get the IDs of all orders in the bucket whose manifest
+    (source.json), the last file delivered for an order, or zip archive
+    exists."""
+    return get_inventory(bucket, prefix).list_manifests()
+
+
+def download_parallel(order_ids, dst_par_dir, overwrite=False, dryrun=False,
+                      threads=4, wait_max=default_wait_max,
+                      poll_interval=default_poll_interval, source=api_source,
+                      skip_onhand=True, shelve_direct=False):
     """
-    Download order ids in parallel.
+    Download order ids in parallel, each as soon as it is ready. If
+    skip_onhand, files of scenes in scenes_onhand (see
+    lib.onhand.load_onhand_snapshot) are not downloaded. If
+    shelve_direct, orders are shelved and indexed straight from S3 (see
+    lib.shelve_direct) rather than downloaded to dst_par_dir.
     """
-    bucket = connect_aws_bucket()
-    pool = ThreadPool(threads)
-    # Create a dl_order_when_ready call for each order id in order_ids,
-    # with the specified arguments
-    results = pool.starmap(dl_order_when_ready, product(order_ids, [dst_par_dir], [bucket],
-                                                        [overwrite], [dryrun],
-                                                        [2], [10], [wait_max]))
-    pool.close()
-    pool.join()
-
-    logger.info('Download statuses:\nOrder ID\t\tStarted\t\tIssue\n{}'.format(
-        '\n'.join(["{} {}\t{}".format(oid, start_dl, issue) for oid, start_dl, issue in results])
+    onhand = None
+    if skip_onhand:
+        try:
+            onhand = load_onhand_snapshot()
+        except Exception as e:
+            logger.warning('Could not load on hand IDs, downloading all '
+                           'files: {}'.format(e))
+    # All orders share one pool of workers downloading files, with
+    # connections for each worker downloading parts of a file
+    max_workers = get_transfer_config('max_workers', default_max_workers)
+    part_concurrency = get_transfer_config('part_concurrency',
+                                           default_part_concurrency)
+    bucket = connect_aws_bucket(
+        max_pool_connections=max_workers * part_concurrency)
+    if shelve_direct:
+        # Scene files are hashed as they are shelved, digests only being
+        # recorded in the download ledger
+        downloader = S3Downloader(bucket, max_workers=max_workers,
+                                  hash_digests=True, sidecars=False)
+    else:
+        downloader = S3Downloader(bucket, max_workers=max_workers)
+    tracker = OrderTracker(order_ids, bucket=bucket, source=source,
+                           poll_interval=poll_interval, wait_max=wait_max)
+    # Orders are dispatched to download as they become ready, while the
+    # tracker keeps checking the rest
+    registry = get_order_registry()
+    futures = {}
+    with ThreadPoolExecutor(max_workers=threads) as executor:
+        for oid in tracker.poll():
+            logger.info('Started downloading: {}'.format(oid))
+            if not dryrun:
+                registry.set_download_state(oid, dl_started)
+            if shelve_direct:
+                futures[oid] = executor.submit(shelve_order_direct, oid,
+                                               bucket=bucket,
+                                               key_prefix=prefix,
+                                               downloader=downloader,
+                                               onhand=onhand, dryrun=dryrun)
+                continue
+            futures[oid] = executor.submit(dl_order, oid,
+                                           dst_par_dir=dst_par_dir,
+                                           bucket=bucket, overwrite=overwrite,
+                                           dryrun=dryrun,
+                                           downloader=downloader,
+                                           onhand=onhand)
+    downloader.shutdown()
+    downloader.stats.report()
+
+    results = []
+    for oid in dict.fromkeys(order_ids):
+        if oid in futures:
+            # One order failing does not stop the states of the rest
+            # being recorded
+            try:
+                success = futures[oid].result()
+            except Exception as e:
+                logger.error('Error downloading order: {}'.format(oid))
+                logger.error(e)
+                success = False
+            results.append((oid, True, success))
+            dl_state = dl_success if success else dl_failed
+        else:
+            results.append((oid, False, False))
+            dl_state = dl_not_ready
+        if not dryrun:
+            registry.set_download_state(oid, dl_state)
+
+    logger.info('Download statuses:\nOrder ID\t\tStarted\t\tSuccess\n{}'.format(
+        '\n'.join(["{} {}\t{}".format(oid, start_dl, success)
+                   for oid, start_dl, success in results])
     ))
 
     return results
@@ -281,7 +667,7 @@ def get_stereo_pairs(**kwargs):
     """Load stereo pairs from DB"""
     sql = stereo_pair_sql(**kwargs)
     # Load records
-    with Postgres(planet_db) as db:
+    with Postgres() as db:
         results = gpd.GeoDataFrame.from_postgis(sql=sql, con=db.get_engine().connect(),
                                                 geom_col="ovlp_geom", crs="epsg:4326")
 
@@ -304,9 +690,16 @@ def pairs_to_list(pairs_df, id1="id1", id2="id2", removed_onhand=True):
     return out_list
 
 
-def create_aws_delivery(aws_access_key_id=aws_access_key_id,
-                        aws_secret_access_key=aws_secret_access_key,
-                        bucket=aws_bucket, aws_region=aws_region, path_prefix=aws_path_prefix):
+def create_aws_delivery(aws_access_key_id=None, aws_secret_access_key=None,
+                        bucket=None, aws_region=None, path_prefix=None):
+    # Parameters not passed are read from the config file
+    aws_params = get_aws_params()
+    aws_access_key_id = aws_access_key_id or aws_params["aws_access_key_id"]
+    aws_secret_access_key = (aws_secret_access_key or
+                             aws_params["aws_secret_access_key"])
+    bucket = bucket or aws_params["aws_bucket"]
+    aws_region = aws_region or aws_params["aws_region"]
+    path_prefix = path_prefix or aws_params["aws_path_prefix"]
     aws_delivery = {
         "delivery": {
             "amazon_s3": {
@@ -324,10 +717,17 @@ def create_aws_delivery(aws_access_key_id=aws_access_key_id,
 
 def create_order_request(order_name, ids, item_type="PSScene4Band",
                          product_bundle="basic_analytic_dn",
-                         delivery="aws"):
-    """Create order from list of IDs"""
+                         delivery="aws", archive=False, tools=None,
+                         exclude_assets=None):
+    """Create order from list of IDs. If archive, the order is delivered
+    as a single zip archive rather than a file per asset, see
+    lib.archive. tools are Orders API tools applied to each scene, e.g.
+    lib.order_tools.create_clip_tool. If UDM2s are among exclude_assets
+    (default 'exclude_assets' in the config file), the bundle without
+    them is ordered."""
     if isinstance(product_bundle, list):
         product_bundle = ','.join(product_bundle)
+    product_bundle = trim_bundle(product_bundle, exclude_assets)
     order_request = {
         "name": order_name,
         "products": [
@@ -336,8 +736,15 @@ def create_order_request(order_name, ids, item_type="PSScene4Band",
              "product_bundle": product_bundle}
         ]
     }
+    if tools:
+        order_request["tools"] = tools
     if delivery == "aws":
         order_request.update(create_aws_delivery())
+    if archive:
+        order_request.setdefault("delivery", {}).update({
+            "archive_type": archive_type,
+            "single_archive": True,
+            "archive_filename": archive_filename})
     # TODO: other cloud locations (Azure, Google)
     # logger.info(order_request)
 
@@ -345,14 +752,18 @@ def create_order_request(order_name, ids, item_type="PSScene4Band",
 
 
 def place_order(order_request):
-    response = requests.post(ORDERS_URL, data=json.dumps(order_request), auth=auth, headers=headers)
+    """Place an order, adding it to the local registry of orders. Raises
+    ValueError if the order is not placed, so that one failed order does
+    not stop others being placed, see OrderScheduler."""
+    response = get_session().post(ORDERS_URL, json=order_request)
     logger.debug("Place order response: {}".format(response))
     if response.status_code != 202:
-        logger.error("Error placing order '{}': {}".format(order_request["name"], response))
-        logger.error("Response reason: {}".format(response.reason))
-        logger.error('Request:\n{}'.format(order_request))
-        sys.exit()
-    order_id = response.json()["id"]
+        logger.debug('Request:\n{}'.format(order_request))
+        raise ValueError("Error placing order '{}': {} {}".format(
+            order_request["name"], response.status_code, response.text))
+    order = response.json()
+    order_id = order["id"]
+    get_order_registry().add(order)
     # logger.debug('Request:\n{}'.format(order_request))
     logger.debug("Order ID: {}".format(order_id))
     order_url = "{}/{}".format(ORDERS_URL, order_id)
@@ -363,12 +774,13 @@ def place_order(order_request):
 def cancel_order(order_url):
     order_id = order_url.split("/")[-1]
     # Get current status
-    state = requests.get(order_url, auth=auth).json()["state"]
+    session = get_session()
+    state = session.get(order_url).json()["state"]
     logger.debug("Order {} state: {}".format(order_id, state))
 
     logger.debug("Cancelling order: {}".format(order_id))
-    requests.put(order_url, auth=auth)
-    state = requests.get(order_url, auth=auth).json()["state"]
+    session.put(order_url)
+    state = session.get(order_url).json()["state"]
     logger.debug("Order {} state: {}".format(order_id, state))
 
     if state == "cancelled":
@@ -381,18 +793,15 @@ def poll_for_success(order_id, num_checks=50, wait=10):
     running_states = ["queued", "running"]
     end_states = ["success", "failed", "partial"]
 
+    registry = get_order_registry()
     check_count = 0
     finished = False
     waiting_reported = False
     while check_count < num_checks and finished is False:
         check_count += 1
-        r = requests.get(ORDERS_URL, auth=auth)
-        response = r.json()
-        state = None
-        for i, o in enumerate(response['orders']):
-            if o['id'] == order_id:
-                state = o["state"]
-                logger.debug('Order ID found: {}'.format(order_id))
+        registry.refresh()
+        order = registry.get(order_id)
+        state = order['state'] if order else None
         if state in running_states:
             logger.debug('Order not finished. State: {}'.format(state))
         elif state in end_states:
@@ -405,8 +814,8 @@ def poll_for_success(order_id, num_checks=50, wait=10):
         if not finished:
             if not waiting_reported:
                 logger.debug('Order did not reach end state, waiting {}s'.format(wait*num_checks))
-                time.sleep(wait)
                 waiting_reported = True
+            time.sleep(wait)
 
     if not finished:
         logger.info("Order did not reach an end state within {} checks with {}s waits.".format(num_checks, wait))
@@ -415,7 +824,7 @@ def poll_for_success(order_id, num_checks=50, wait=10):
 
 
 def get_order_results(order_url):
-    response = requests.get(order_url).json()
+    response = get_session().get(order_url).json()
     results = response["_links"]["results"]
 
     logger.debug("\n".join([r["name"] for r in results]))
@@ -445,70 +854,79 @@ def get_order_results(order_url):
 #             logger.debug("File already exists, skipping: {} {}".format(name, url))
 
 
-def list_orders(state=None):
+def list_orders(state=None, name_like=None, since=None, refresh=True):
+    """List orders from the local registry of orders, refreshed from the
+    API (all pages) first unless refresh is False.
+
+    Parameters
+    ----------
+    state : str, list
+        Only list orders in these state(s).
+    name_like : str
+        SQL LIKE pattern of order names, e.g. 'my_order_%'.
+    since : str
+        Only list orders created on or after this date.
+    """
     logger.info('Listing orders...')
-    # TODO: Check if there is a page limit on orders return
-    # TODO: Date limit on orders returned
-    # TODO: verbose print with keys:
-    #  'created_on', 'delivery', 'error_hints', 'id', 'last_message',
-    #  'last_modified', 'name', 'products', 'state'
-    params = {}
-    if state:
-        params = {"state": state}
-
-    response = requests.get(ORDERS_URL, auth=auth, params=state)
-    if response.status_code != 200:
-        logger.error('Bad response: {}: {}'.format(response.status_code, response.reason))
-        # TODO: Create error class
-        raise ConnectionError
-    orders = response.json()["orders"]
+    registry = get_order_registry(refresh=refresh)
+    orders = registry.find(state=state, name_like=name_like, since=since)
+    if not orders:
+        logger.info('No orders found.')
+        return orders
 
     # Pretty printing
     spaces = 1
     dashes = 6
     longest_id = max([len(o['id']) for o in orders])
-    longest_name = max([len(o['name']) for o in orders])
+    longest_name = max([len(o['name'] or '') for o in orders])
 
     for o in orders:
+        name = o['name'] or ''
         id_spaces = '{0}{1}{0}'.format(spaces*' ', round((dashes + longest_id - len(o['id'])) / 2)*'-')
-        name_spaces = '{0}{1}{0}'.format(spaces*' ', round((dashes + longest_name - len(o['name'])) / 2) * '-')
+        name_spaces = '{0}{1}{0}'.format(spaces*' ', round((dashes + longest_name - len(name)) / 2) * '-')
         logger.info("ID: {}{}Name: {}{}State: {}".format(o["id"], id_spaces,
-                                                         o["name"], name_spaces,
+                                                         name, name_spaces,
                                                          o["state"]))
 
     return orders
 
 
-@retry(wait_exponential_multiplier=1000, wait_exponential_max=60000)
 def count_concurrent_orders():
-    # TODO: Move these to a config file
-    orders_url = 'https://api.planet.com/compute/ops/stats/orders/v2'
-    PLANET_API_KEY = os.getenv('PL_API_KEY')
-    if not PLANET_API_KEY:
-        logger.error('Error retrieving API key. Is PL_API_KEY env. variable '
-                     'set?')
-
-    with requests.Session() as s:
-        logger.debug('Authorizing using Planet API key...')
-        s.auth = (PLANET_API_KEY, '')
-
-        res = s.get(orders_url)
-        if res.status_code == 200:
-            order_statuses = res.json()['user']
-            queued = order_statuses['queued_orders']
-            running = order_statuses['running_orders']
-            total = queued + running
-        else:
-            logger.error(res.status_code)
-            logger.error(res.reason)
-            raise Exception
+    # Transient failures are retried by the shared session
+    res = get_session().get(ORDERS_STATS_URL)
+    if res.status_code == 200:
+        order_statuses = res.json()['user']
+        queued = order_statuses['queued_orders']
+        running = order_statuses['running_orders']
+        total = queued + running
+    else:
+        logger.error(res.status_code)
+        logger.error(res.reason)
+        raise Exception
 
     return total
 
 
 def submit_order(name, ids_path, selection_path, product_bundle,
                  orders_path=None, remove_onhand=True,
-                 dryrun=False):
+                 dryrun=False, threads=default_threads, journal_path=None,
+                 archive=False, clip_aoi=None):
+    """
+    Submit IDs as orders of up to 500 IDs each, placing orders
+    concurrently while keeping under the limit of concurrent orders.
+    Each submission is recorded in a journal (by default in the cache
+    directory, named by name), so rerunning after an interruption only
+    places the orders that were not placed. If archive, orders are
+    delivered as zip archives. If clip_aoi (path to vector file) is
+    passed, scenes are clipped to it. The size of the delivery is
+    estimated and logged before orders are placed.
+    """
+    if isinstance(product_bundle, list):
+        product_bundle = ','.join(product_bundle)
+    if clip_aoi:
+        # Checked before anything is read or ordered, as the API rejects
+        # these
+        check_clippable(product_bundle)
 
     if ids_path:
         logger.info('Reading IDs from: {}'.format(ids_path))
@@ -528,54 +946,44 @@ def submit_order(name, ids_path, selection_path, product_bundle,
 
     if remove_onhand:
         logger.info('Removing onhand IDs...')
-        with Postgres(planet_db) as db:
-            onhand = set(db.get_values(scenes_onhand_tbl, columns=[scene_id]))
-
-        ids = list(set(ids) - onhand)
+        onhand = load_onhand_snapshot()
+        ids = onhand.exclude(set(ids))
         logger.info('IDs remaining: {:,}'.format(len(ids)))
 
-    # Limits are 500 ids per order, 80 concurrent orders
-    max_concur = 80
-    assets_per_order = 500
-    ids_chunks = [ids[i:i + assets_per_order]
-                  for i in range(0, len(ids), assets_per_order)]
-    more_than_one = len(ids_chunks) > 1
-
-    submitted_orders = []
-    # Iterate over IDs in chunks, submitting each as an order
-    for i, ids_chunk in enumerate(ids_chunks):
-        if more_than_one:
-            order_name = '{}_{}'.format(name, i)
-        else:
-            order_name = '{}'.format(name)
-        order_request = create_order_request(order_name=order_name, ids=ids_chunk, product_bundle=product_bundle)
-        order_submitted = False
-        while order_submitted is False:
-            concurrent_orders = count_concurrent_orders()
-            logger.debug('Concurrent orders: {}'.format(concurrent_orders))
-            if concurrent_orders < max_concur:
-                # Submit
-                if not dryrun:
-                    logger.info('Submitting order: {}'.format(order_name))
-                    order_id, order_url = place_order(order_request=order_request)
-                    submitted_orders.append(order_id)
-                    logger.info('Order ID: {}'.format(order_id))
-                    logger.info('Order URL: {}'.format(order_url))
-                    # success = poll_for_success(order_id=order_id)
-                    # if success:
-                    #     logger.info("Order placed successfully.")
-                    # else:
-                    #     logger.warning("Order placement did not finish.")
-                    order_submitted = True
-                else:
-                    logger.info('(dryrun) Order submitted: {}'.format(order_name))
-                    order_submitted = True
-            else:
-                logger.info('Concurrent orders reached ({}) waiting...'.format(max_concur))
-                time.sleep(10)
-
-        # Avoid submitting too fast
-        time.sleep(1)
+    tools = None
+    clip_geom = None
+    footprints = None
+    if clip_aoi:
+        logger.info('Clipping scenes to: {}'.format(clip_aoi))
+        clip_geom = read_clip_aoi(clip_aoi)
+        tools = [create_clip_tool(clip_geom)]
+        footprints = load_footprints(ids, selection_path=selection_path)
+    log_size_estimate(estimate_order_size(ids, product_bundle,
+                                          footprints=footprints,
+                                          clip_geom=clip_geom))
+
+    if not journal_path:
+        journal_path = default_journal_path(name)
+    logger.info('Recording submissions in: {}'.format(journal_path))
+    journal = OrderJournal(journal_path)
+    scheduler = OrderScheduler(journal, place_order, threads=threads,
+                               registry=get_order_registry())
+    if not dryrun:
+        # Orders whose outcome is unknown are looked up before planning,
+        # so their IDs are not ordered again
+        scheduler.resolve_unresolved()
+    order_requests = create_order_requests(name, ids, journal=journal,
+                                           product_bundle=product_bundle,
+                                           archive=archive, tools=tools)
+    if dryrun:
+        for order_request in order_requests:
+            logger.info('(dryrun) Order submitted: {}'.format(
+                order_request['name']))
+        return []
+
+    scheduler.submit_all(order_requests)
+    # Including orders of ids placed by earlier runs
+    submitted_orders = journal.submitted_order_ids(ids)
 
     if orders_path:
         logger.info('Writing order IDs to file: {}'.format(orders_path))
@@ -587,6 +995,42 @@ def submit_order(name, ids_path, selection_path, product_bundle,
     return submitted_orders
 
 
+def create_order_requests(name, ids, journal=None, **kwargs):
+    """Create order requests for ids in chunks of the max IDs per order,
+    named name_0, name_1, ... if there is more than one. If journal (an
+    OrderJournal) is passed, IDs it records as already ordered are left
+    out, and names it records are not reused, so a rerun only orders
+    the remaining IDs even if the IDs to order have changed. kwargs are
+    passed to create_order_request."""
+    used_names = set()
+    if journal is not None:
+        ordered = journal.submitted_ids()
+        remaining = [i for i in ids if i not in ordered]
+        if len(remaining) != len(ids):
+            logger.info('IDs already ordered (per journal): {:,} - '
+                        'remaining: {:,}'.format(len(ids) - len(remaining),
+                                                 len(remaining)))
+        ids = remaining
+        used_names = journal.names()
+    ids_chunks = chunk_ids(ids)
+    more_than_one = len(ids_chunks) > 1 or bool(used_names)
+    order_requests = []
+    i = 0
+    for ids_chunk in ids_chunks:
+        if more_than_one:
+            order_name = '{}_{}'.format(name, i)
+            while order_name in used_names:
+                i += 1
+                order_name = '{}_{}'.format(name, i)
+            i += 1
+        else:
+            order_name = '{}'.format(name)
+        order_requests.append(create_order_request(order_name=order_name,
+                                                   ids=ids_chunk, **kwargs))
+
+    return order_requests
+
+
 # if __name__ == '__main__':
 #     parser = argparse.ArgumentParser()
 #
@@ -0,0 +1,314 @@
+import datetime
+import hashlib
+import json
+from pathlib import Path
+import sqlite3
+import threading
+
+from lib.lib import get_cache_dir
+from lib.logging_utils import create_logger
+
+logger = create_logger(__name__, 'sh', 'INFO')
+
+registry_file_template = 'orders_{}.sqlite'
+
+# Keys in API responses
+k_orders = 'orders'
+k_links = '_links'
+k_next = 'next'
+k_id = 'id'
+k_name = 'name'
+k_state = 'state'
+k_created_on = 'created_on'
+k_last_modified = 'last_modified'
+k_last_message = 'last_message'
+k_products = 'products'
+k_item_ids = 'item_ids'
+k_product_bundle = 'product_bundle'
+# Orders in these states will not change
+end_states = ['success', 'partial', 'failed', 'cancelled']
+# Download states, set locally
+dl_started = 'started'
+dl_success = 'success'
+dl_failed = 'failed'
+dl_not_ready = 'not_ready'
+
+# Columns of orders table, besides the order as returned by the API
+columns = [k_id, k_name, k_state, k_created_on, k_last_modified,
+           k_last_message, 'item_count', k_product_bundle,
+           'download_state', 'download_updated', 'refreshed']
+create_table_sql = """
+CREATE TABLE IF NOT EXISTS orders (
+    id TEXT PRIMARY KEY,
+    name TEXT,
+    state TEXT,
+    created_on TEXT,
+    last_modified TEXT,
+    last_message TEXT,
+    item_count INTEGER,
+    product_bundle TEXT,
+    download_state TEXT,
+    download_updated TEXT,
+    refreshed TEXT,
+    response TEXT
+);
+CREATE INDEX IF NOT EXISTS orders_name ON orders (name);
+CREATE INDEX IF NOT EXISTS orders_state ON orders (state);
+CREATE INDEX IF NOT EXISTS orders_created_on ON orders (created_on);
+"""
+# Columns updated from the API, leaving download columns as they are
+upsert_sql = """
+INSERT INTO orders (id, name, state, created_on, last_modified,
+                    last_message, item_count, product_bundle, refreshed,
+                    response)
+VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+ON CONFLICT (id) DO UPDATE SET
+    name = excluded.name,
+    state = excluded.state,
+    created_on = excluded.created_on,
+    last_modified = excluded.last_modified,
+    last_message = excluded.last_message,
+    item_count = excluded.item_count,
+    product_bundle = excluded.product_bundle,
+    refreshed = excluded.refreshed,
+    response = excluded.response
+"""
+
+
+def order_row(order, refreshed):
+    products = order.get(k_products) or []
+    item_count = sum([len(p.get(k_item_ids, [])) for p in products])
+    bundles = ','.join(sorted(set([p.get(k_product_bundle, '')
+                                   for p in products])))
+    return (order[k_id], order.get(k_name), order.get(k_state),
+            order.get(k_created_on), order.get(k_last_modified),
+            order.get(k_last_message), item_count, bundles, refreshed,
+            json.dumps(order))
+
+
+class OrderRegistry:
+    def __init__(self, session, orders_url, db_path=None):
+        """
+        Local SQLite record of the account's orders: names, IDs and
+        states from the Orders API, and the state of downloading each
+        order. Orders are read from the API by refresh(), all pages on
+        the first refresh and afterward only as many pages as needed to
+        reach all orders that were not finished.
+
+        Parameters
+        ----------
+        session : requests.Session
+            Session authorized with the Planet API key.
+        orders_url : str
+            URL of the orders endpoint.
+        db_path : str, pathlib.Path
+            Alternative path to the database, if not passed, a file in
+            the cache directory specific to the API key is used.
+        """
+        self.session = session
+        self.orders_url = orders_url
+        if db_path is None:
+            # Separate database for each account
+            api_key = session.auth[0] if session.auth else ''
+            key_hash = hashlib.sha256(str(api_key).encode()).hexdigest()[:12]
+            db_path = get_cache_dir() / registry_file_template.format(
+                key_hash)
+        self.db_path = Path(db_path)
+        self._lock = threading.Lock()
+        conn = self._connect()
+        try:
+            conn.executescript(create_table_sql)
+        finally:
+            conn.close()
+
+    def _connect(self):
+        conn = sqlite3.connect(str(self.db_path), timeout=60)
+        conn.row_factory = sqlite3.Row
+        return conn
+
+    def _query(self, sql, params=()):
+        conn = self._connect()
+        try:
+            rows = conn.execute(sql, params).fetchall()
+        finally:
+            conn.close()
+
+        return [dict(r) for r in rows]
+
+    def _execute(self, sql, params=()):
+        with self._lock:
+            conn = self._connect()
+            try:
+                with conn:
+                    conn.execute(sql, params)
+            finally:
+                conn.close()
+
+    def _executemany(self, sql, seq_of_params):
+        with self._lock:
+            conn = self._connect()
+            try:
+                with conn:
+                    conn.executemany(sql, seq_of_params)
+            finally:
+                conn.close()
+
+    def _unfinished_ids(self):
+        return set([r[k_id] for r in self._query(
+            'SELECT id FROM orders WHERE state NOT IN ({})'.format(
+                ','.join('?' * len(end_states))), end_states)])
+
+    def _finished_ids(self):
+        return set([r[k_id] for r in self._query(
+            'SELECT id FROM orders WHERE state IN ({})'.format(
+                ','.join('?' * len(end_states))), end_states)])
+
+    def refresh(self, full=False):
+        """
+        Read orders from the API, a page at a time, newest first. Unless
+        full, stop once every order that was not finished has been seen
+        and a page has reached orders that were already finished, as
+        older orders cannot have changed.
+
+        Returns
+        -------
+        int : number of orders read
+        """
+        unfinished = self._unfinished_ids()
+        finished = self._finished_ids() if not full else set()
+        refreshed = datetime.datetime.utcnow().isoformat()
+        url = self.orders_url
+        count = 0
+        pages = 0
+        while url:
+            # Pages are read without the lock, so recording download
+            # states is not blocked for the whole refresh
+            r = self.session.get(url)
+            r.raise_for_status()
+            response = r.json()
+            orders = response[k_orders]
+            pages += 1
+            count += len(orders)
+            self._executemany(upsert_sql,
+                              [order_row(o, refreshed) for o in orders])
+            page_ids = set([o[k_id] for o in orders])
+            unfinished -= page_ids
+            if not full and not unfinished and page_ids & finished:
+                break
+            url = response.get(k_links, {}).get(k_next)
+        logger.debug('Orders read: {:,} ({:,} pages)'.format(count, pages))
+
+        return count
+
+    def add(self, order):
+        """Add or update an order from an API response, e.g. when
+        placed."""
+        refreshed = datetime.datetime.utcnow().isoformat()
+        self._execute(upsert_sql, order_row(order, refreshed))
+
+    def get(self, order_id):
+        rows = self._query('SELECT {} FROM orders WHERE id = ?'.format(
+            ','.join(columns)), (order_id,))
+        return rows[0] if rows else None
+
+    def states(self, order_ids):
+        """Get {order ID: state} for the given order IDs that are in
+        the registry."""
+        order_ids = list(order_ids)
+        states = {}
+        # Stay under SQLite's limit on parameters
+        for i in range(0, len(order_ids), 500):
+            chunk = order_ids[i:i + 500]
+            rows = self._query('SELECT id, state FROM orders WHERE id IN '
+                               '({})'.format(','.join('?' * len(chunk))),
+                               chunk)
+            states.update({r[k_id]: r[k_state] for r in rows})
+
+        return states
+
+    def order_ids_by_name(self, names):
+        """Get {name: order ID} for orders with the given names, the
+        newest order of any name used more than once."""
+        names = list(names)
+        found = {}
+        # Stay under SQLite's limit on parameters
+        for i in range(0, len(names), 500):
+            chunk = names[i:i + 500]
+            rows = self._query('SELECT id, name FROM orders WHERE name IN '
+                               '({}) ORDER BY created_on'.format(
+                                   ','.join('?' * len(chunk))), chunk)
+            found.update({r[k_name]: r[k_id] for r in rows})
+
+        return found
+
+    def find(self, name=None, name_like=None, state=None, since=None,
+             until=None, download_state=None):
+        """
+        Get orders matching all of the given criteria, newest first.
+
+        Parameters
+        ----------
+        name : str
+            Exact order name.
+        name_like : str
+            SQL LIKE pattern of order name, e.g. 'my_order_%'.
+        state : str, list
+            Order state(s).
+        since : str
+            Earliest created_on date, e.g. '2020-06-01'.
+        until : str
+            Latest created_on date (exclusive).
+        download_state : str, list
+            Download state(s), None in the list matches orders not
+            downloaded.
+
+        Returns
+        -------
+        list : dict for each order
+        """
+        where = []
+        params = []
+        if name:
+            where.append('name = ?')
+            params.append(name)
+        if name_like:
+            where.append('name LIKE ?')
+            params.append(name_like)
+        for col, values in ((k_state, state),
+                            ('download_state', download_state)):
+            if values is None:
+                continue
+            if not isinstance(values, (list, tuple)):
+                values = [values]
+            conditions = []
+            not_null = [v for v in values if v is not None]
+            if not_null:
+                conditions.append('{} IN ({})'.format(
+                    col, ','.join('?' * len(not_null))))
+                params.extend(not_null)
+            if len(not_null) != len(values):
+                conditions.append('{} IS NULL'.format(col))
+            where.append('({})'.format(' OR '.join(conditions)))
+        if since:
+            where.append('created_on >= ?')
+            params.append(since)
+        if until:
+            where.append('created_on < ?')
+            params.append(until)
+        sql = 'SELECT {} FROM orders'.format(','.join(columns))
+        if where:
+            sql += ' WHERE {}'.format(' AND '.join(where))
+        sql += ' ORDER BY created_on DESC'
+
+        return self._query(sql, params)
+
+    def set_download_state(self, order_id, download_state):
+        """Record the state of downloading an order, adding the order if
+        it has not been read from the API yet."""
+        updated = datetime.datetime.utcnow().isoformat()
+        self._execute('INSERT INTO orders (id, download_state, '
+                      'download_updated) VALUES (?, ?, ?) '
+                      'ON CONFLICT (id) DO UPDATE SET '
+                      'download_state = excluded.download_state, '
+                      'download_updated = excluded.download_updated',
+                      (order_id, download_state, updated))
@@ -0,0 +1,335 @@
+from concurrent.futures import ThreadPoolExecutor
+import datetime
+import hashlib
+import json
+import os
+from pathlib import Path
+import threading
+
+from lib.lib import get_cache_dir
+from lib.logging_utils import create_logger
+from lib.order_registry import OrderRegistry
+from lib.transport import ORDERS_STATS_URL, ORDERS_URL, get_shared_session
+
+logger = create_logger(__name__, 'sh', 'INFO')
+
+# Planet limits: IDs per order, orders queued or running at once
+assets_per_order = 500
+max_concurrent_orders = 80
+# Orders submitted at once
+default_threads = 8
+# Seconds between refreshes of the count of queued and running orders
+default_stats_interval = 30
+
+# Subdirectory of cache directory holding journals, one per order name
+journal_subdir = 'order_journals'
+# Keys in journal records
+k_name = 'name'
+k_ids_hash = 'ids_hash'
+k_ids = 'ids'
+k_state = 'state'
+k_order_id = 'order_id'
+k_error = 'error'
+k_time = 'time'
+# Journal states
+submitting = 'submitting'
+submitted = 'submitted'
+failed = 'failed'
+
+
+def ids_hash(ids):
+    return hashlib.sha1(','.join(sorted(ids)).encode()).hexdigest()
+
+
+def chunk_ids(ids, chunk_size=assets_per_order):
+    """Split IDs into chunks of at most chunk_size, sorted so the same
+    IDs always give the same chunks, e.g. when resuming."""
+    ids = sorted(set(ids))
+    return [ids[i:i + chunk_size] for i in range(0, len(ids), chunk_size)]
+
+
+def request_ids(order_request):
+    return [i for p in order_request['products'] for i in p['item_ids']]
+
+
+def default_journal_path(name):
+    return get_cache_dir(journal_subdir) / '{}.jsonl'.format(name)
+
+
+class OrderJournal:
+    def __init__(self, path):
+        """
+        Append-only record (JSON lines) of each order submission. An
+        order is recorded as submitting before it is placed, and as
+        submitted, with its order ID, once placed, so after a crash
+        orders already placed are never placed again, and any order
+        whose outcome is unknown can be looked up. Orders are keyed by
+        the hash of their IDs, and record the IDs, so that IDs already
+        ordered can be left out when orders are planned again (see
+        lib.order.create_order_requests), even if the IDs to order have
+        changed since.
+
+        Parameters
+        ----------
+        path : str
+            Path to journal file, created if it does not exist.
+        """
+        self.path = Path(path)
+        self.lock = threading.Lock()
+        self.records = self._load()
+
+    def _load(self):
+        records = {}
+        if not self.path.exists():
+            return records
+        with open(self.path, 'r') as src:
+            lines = src.read().split('\n')
+        if lines[-1]:
+            # Start a new line after a partial line written when
+            # interrupted, so the next record is not appended to it
+            with open(self.path, 'a') as dst:
+                dst.write('\n')
+        for line in lines:
+            if not line:
+                continue
+            try:
+                record = json.loads(line)
+            except ValueError:
+                # Partial line written when interrupted
+                logger.warning('Skipping invalid journal line: '
+                               '{}'.format(line.strip()))
+                continue
+            records[record[k_ids_hash]] = record
+        logger.debug('Loaded {:,} orders from journal: {}'.format(
+            len(records), self.path))
+
+        return records
+
+    def get(self, ids_hash):
+        return self.records.get(ids_hash)
+
+    def record(self, name, state, ids_hash, ids=None, order_id=None,
+               error=None):
+        record = {k_name: name, k_state: state, k_ids_hash: ids_hash,
+                  k_ids: ids, k_order_id: order_id, k_error: error,
+                  k_time: datetime.datetime.utcnow().isoformat()}
+        with self.lock:
+            if ids is None and ids_hash in self.records:
+                record[k_ids] = self.records[ids_hash].get(k_ids)
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            with open(self.path, 'a') as dst:
+                dst.write('{}\n'.format(json.dumps(record)))
+                dst.flush()
+                os.fsync(dst.fileno())
+            self.records[ids_hash] = record
+
+        return record
+
+    def names(self):
+        """Names of all orders recorded."""
+        return set([r[k_name] for r in self.records.values()])
+
+    def submitted_ids(self):
+        """IDs of all orders recorded as submitted."""
+        return set([i for r in self.records.values()
+                    if r[k_state] == submitted for i in r.get(k_ids) or []])
+
+    def submitted_order_ids(self, ids):
+        """Order IDs of orders recorded as submitted that include any of
+        ids, e.g. to download all orders of IDs, including those placed
+        by earlier runs."""
+        ids = set(ids)
+        return [r[k_order_id] for r in self.records.values()
+                if r[k_state] == submitted and
+                ids.intersection(r.get(k_ids) or [])]
+
+    def unresolved(self):
+        """Records of orders that may or may not have been placed."""
+        return [r for r in self.records.values() if r[k_state] == submitting]
+
+
+def get_session():
+    return get_shared_session()
+
+
+class OrderScheduler:
+    def __init__(self, journal, place_order,
+                 max_concurrent=max_concurrent_orders,
+                 threads=default_threads,
+                 stats_interval=default_stats_interval, session=None,
+                 registry=None):
+        """
+        Submits orders concurrently while keeping the number of queued
+        and running orders under max_concurrent. The count of open
+        orders is read from the orders stats endpoint every
+        stats_interval seconds, which frees the slots of orders that have
+        finished. Slots taken locally since are added to it: those of
+        orders being placed, and of orders placed since the count was
+        requested, which it may not include yet.
+
+        Parameters
+        ----------
+        journal : OrderJournal
+            Record of submissions, orders already submitted are skipped.
+        place_order : function
+            Places an order request, returning (order ID, order URL) and
+            raising if it is not placed, i.e. lib.order.place_order,
+            which also adds the order to the local registry of orders.
+        max_concurrent : int
+            Max orders queued or running at once.
+        threads : int
+            Max orders being placed at once.
+        stats_interval : float
+            Seconds between refreshes of the count of open orders.
+        session : requests.Session
+            Authorized session, defaults to the shared rate-limited
+            session.
+        registry : lib.order_registry.OrderRegistry
+            Local record of the account's orders, in which orders whose
+            submission was interrupted are looked up, one is opened on
+            first use if not passed.
+        """
+        self.journal = journal
+        self.place_order = place_order
+        self.max_concurrent = max_concurrent
+        self.threads = threads
+        self.stats_interval = stats_interval
+        self.session = session or get_session()
+        self.registry = registry
+        # Queued and running orders, as of the last refresh
+        self.server_count = None
+        # Slots held by orders being placed
+        self.pending = 0
+        # Orders placed, and those placed before the last refresh began,
+        # so counted by it
+        self.placed = 0
+        self.placed_counted = 0
+        self.cond = threading.Condition()
+        self.stop = threading.Event()
+
+    @property
+    def in_flight(self):
+        """Orders queued, running or being placed."""
+        return (self.server_count + self.pending +
+                self.placed - self.placed_counted)
+
+    def refresh(self):
+        """Get the count of queued and running orders."""
+        with self.cond:
+            placed_before = self.placed
+        r = self.session.get(ORDERS_STATS_URL)
+        r.raise_for_status()
+        stats = r.json()['user']
+        total = stats['queued_orders'] + stats['running_orders']
+        with self.cond:
+            self.server_count = total
+            self.placed_counted = max(self.placed_counted, placed_before)
+            self.cond.notify_all()
+        logger.debug('Concurrent orders: {}'.format(total))
+
+        return total
+
+    def _refresh_loop(self):
+        while not self.stop.wait(self.stats_interval):
+            try:
+                self.refresh()
+            except Exception as e:
+                logger.warning('Error refreshing order stats: {}'.format(e))
+
+    def acquire_slot(self):
+        with self.cond:
+            waiting_reported = False
+            while self.in_flight >= self.max_concurrent:
+                if not waiting_reported:
+                    logger.info('Concurrent orders reached ({}) '
+                                'waiting...'.format(self.max_concurrent))
+                    waiting_reported = True
+                self.cond.wait()
+            self.pending += 1
+
+    def release_slot(self, placed=False):
+        """Release a slot taken by acquire_slot. The slot of an order
+        placed is held until a refresh counts the order."""
+        with self.cond:
+            self.pending = max(self.pending - 1, 0)
+            if placed:
+                self.placed += 1
+            self.cond.notify()
+
+    def submit(self, order_request):
+        """Place an order unless the journal records it as placed,
+        returning its order ID, or None if it could not be placed."""
+        name = order_request['name']
+        ids = sorted(request_ids(order_request))
+        oh = ids_hash(ids)
+        record = self.journal.get(oh)
+        if record and record[k_state] == submitted:
+            logger.debug('Order already submitted: {} ({})'.format(
+                record[k_name], record[k_order_id]))
+            return record[k_order_id]
+
+        self.acquire_slot()
+        self.journal.record(name, submitting, oh, ids=ids)
+        try:
+            order_id, _order_url = self.place_order(order_request)
+        except Exception as e:
+            logger.error(e)
+            self.journal.record(name, failed, oh, error=str(e))
+            self.release_slot()
+            return None
+        self.release_slot(placed=True)
+        self.journal.record(name, submitted, oh, order_id=order_id)
+        logger.info('Order submitted: {} ({})'.format(name, order_id))
+
+        return order_id
+
+    def resolve_unresolved(self):
+        """Look up orders whose submission was interrupted, recording
+        those that were placed so they are not placed again."""
+        unresolved = self.journal.unresolved()
+        if not unresolved:
+            return
+        logger.info('Looking up {:,} orders with unknown '
+                    'outcome...'.format(len(unresolved)))
+        if self.registry is None:
+            self.registry = OrderRegistry(session=self.session,
+                                          orders_url=ORDERS_URL)
+        # Orders placed since the last refresh are the newest, so are
+        # read by an incremental refresh
+        self.registry.refresh()
+        found = self.registry.order_ids_by_name(
+            [r[k_name] for r in unresolved])
+        for r in unresolved:
+            name = r[k_name]
+            if name in found:
+                self.journal.record(name, submitted, r[k_ids_hash],
+                                    order_id=found[name])
+            else:
+                self.journal.record(name, failed, r[k_ids_hash],
+                                    error='Not found after interruption')
+        logger.info('Interrupted orders found placed: {:,}'.format(
+            len(found)))
+
+    def submit_all(self, order_requests):
+        """
+        Submit orders concurrently, waiting for open slots as needed.
+
+        Returns
+        -------
+        list : order ID of each request, None for those that failed
+        """
+        self.resolve_unresolved()
+        self.refresh()
+        self.stop.clear()
+        refresher = threading.Thread(target=self._refresh_loop, daemon=True)
+        refresher.start()
+        try:
+            with ThreadPoolExecutor(max_workers=self.threads) as executor:
+                order_ids = list(executor.map(self.submit, order_requests))
+        finally:
+            self.stop.set()
+        logger.info('Orders submitted: {:,} - failed: {:,}'.format(
+            len([o for o in order_ids if o]),
+            len([o for o in order_ids if not o])))
+
+        return order_ids
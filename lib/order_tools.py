@@ -0,0 +1,206 @@
+from lib.aoi import count_vertices, geom2json, prepare_aoi, read_aoi, \
+    scene_size
+from lib.db import Postgres, generate_sql, ids2sql
+from lib.lazy import lazy_import
+from lib.lib import get_config, k_annotations, k_asset_type, k_path
+from lib.logging_utils import create_logger
+from lib.onhand import scenes
+
+# Imported on first use
+gpd = lazy_import('geopandas')
+shapely = lazy_import('shapely')
+lazy_import('shapely.ops')
+
+logger = create_logger(__name__, 'sh', 'INFO')
+
+MB = 1024 ** 2
+# Max vertices in a clip AOI accepted by the Orders API
+clip_max_vertices = 500
+# Asset types (as in order manifests) left out of orders and downloads,
+# overridden by 'exclude_assets' in the config file, e.g. ["udm", "udm2"]
+default_exclude_assets = []
+# Asset types of the UDM2s added to a bundle by its '_udm2' variant,
+# ordering the base bundle instead if these are excluded
+udm2_assets = ('udm2', 'basic_udm2')
+udm2_suffix = '_udm2'
+udm_assets = ('udm', 'basic_udm')
+# Rough size of each asset of a whole PlanetScope scene, in MB, for
+# estimating the size of orders. Rasters are scaled by the fraction of
+# the scene left after clipping
+asset_mb = {'image': 150, 'udm': 2, 'udm2': 10, 'metadata': 0.1}
+raster_assets = ('image', 'udm', 'udm2')
+
+
+def get_exclude_assets():
+    return get_config('exclude_assets', default=default_exclude_assets)
+
+
+def excluded_paths(manifest, exclude_assets=None):
+    """Get the paths of files in an order manifest whose asset type is
+    excluded.
+
+    Parameters
+    ----------
+    manifest : list
+        Manifest entries, see lib.order.read_order_manifest.
+    exclude_assets : list
+        Asset types, defaults to 'exclude_assets' in the config file.
+
+    Returns
+    -------
+    set : paths relative to order
+    """
+    if exclude_assets is None:
+        exclude_assets = get_exclude_assets()
+    if not exclude_assets:
+        return set()
+
+    return set([f[k_path] for f in manifest
+                if f.get(k_annotations, {}).get(k_asset_type) in
+                exclude_assets])
+
+
+def trim_bundle(product_bundle, exclude_assets=None):
+    """Order the base bundle rather than its '_udm2' variant if UDM2s are
+    excluded, so they are not delivered at all. Other assets can only be
+    excluded once delivered, see excluded_paths."""
+    if exclude_assets is None:
+        exclude_assets = get_exclude_assets()
+    bundles = product_bundle.split(',')
+    if any([a in exclude_assets for a in udm2_assets]):
+        bundles = [b[:-len(udm2_suffix)] if b.endswith(udm2_suffix) else b
+                   for b in bundles]
+    trimmed = ','.join(dict.fromkeys(bundles))
+    if trimmed != product_bundle:
+        logger.info('UDM2s excluded, ordering bundle: {}'.format(trimmed))
+
+    return trimmed
+
+
+def read_clip_aoi(aoi):
+    """
+    Read an AOI to clip orders to, as a single geometry the Orders API
+    accepts. The AOI is prepared as for search filters (see
+    lib.aoi.prepare_aoi), so it covers the original, then dissolved and
+    simplified further until it has at most clip_max_vertices.
+
+    Parameters
+    ----------
+    aoi : str, gpd.GeoDataFrame
+        Path to vector file or GeoDataFrame of AOI.
+
+    Returns
+    -------
+    shapely geometry
+    """
+    prepared = prepare_aoi(aoi)
+    geom = shapely.ops.unary_union([g for g in prepared.geometry
+                                    if g is not None])
+    tolerance = scene_size / 100
+    while count_vertices(geom) > clip_max_vertices:
+        # Buffered first, so the simplified AOI still covers the original
+        geom = geom.buffer(tolerance).simplify(tolerance)
+        tolerance *= 2
+    logger.debug('Clip AOI vertices: {:,}'.format(count_vertices(geom)))
+
+    return geom
+
+
+def check_clippable(product_bundle):
+    """Raise ValueError if any bundle of product_bundle (comma separated)
+    is basic (unrectified), which the Orders API will not clip."""
+    basic = [b for b in product_bundle.split(',') if b.startswith('basic')]
+    if basic:
+        raise ValueError('Basic (unrectified) bundles cannot be clipped, '
+                         'order without clipping or order a rectified '
+                         'bundle: {}'.format(','.join(basic)))
+
+
+def create_clip_tool(geom):
+    """Orders API tool clipping each scene to geom."""
+    return {"clip": {"aoi": geom2json(geom)}}
+
+
+def load_footprints(ids, selection_path=None):
+    """Get footprints of ids, from the selection they were read from if
+    passed, otherwise from the scenes table. Empty if they cannot be
+    found."""
+    if selection_path:
+        footprints = read_aoi(selection_path)
+        return footprints[footprints['id'].isin(ids)]
+    try:
+        with Postgres() as db:
+            sql_str = generate_sql(layer=scenes,
+                                   columns=['id', 'geometry'],
+                                   where='id IN ({})'.format(ids2sql(
+                                       list(ids))))
+            return db.sql2gdf(sql_str.as_string(db.cursor))
+    except Exception as e:
+        logger.warning('Could not load footprints: {}'.format(e))
+        return gpd.GeoDataFrame(columns=['id', 'geometry'],
+                                geometry='geometry', crs='epsg:4326')
+
+
+def estimate_order_size(ids, product_bundle, footprints=None, clip_geom=None,
+                        exclude_assets=None):
+    """
+    Estimate the size of the delivery of an order, from rough sizes of
+    the assets of a scene (asset_mb). If clipped, rasters are scaled by
+    the fraction of each footprint within the clip AOI, footprints not
+    found being counted whole.
+
+    Parameters
+    ----------
+    ids : list
+        Scene IDs ordered.
+    product_bundle : str
+        Bundle(s) ordered, comma separated.
+    footprints : gpd.GeoDataFrame
+        Footprints of ids, with an 'id' column.
+    clip_geom : shapely geometry
+        AOI scenes are clipped to.
+    exclude_assets : list
+        Asset types excluded, defaults to 'exclude_assets' in the config
+        file.
+
+    Returns
+    -------
+    dict : {'scenes', 'whole_bytes', 'estimated_bytes'}, whole_bytes
+        being the size of the bundle without clipping or exclusions
+    """
+    if exclude_assets is None:
+        exclude_assets = get_exclude_assets()
+    bundle_assets = ['image', 'udm', 'metadata']
+    if product_bundle.split(',')[0].endswith(udm2_suffix):
+        bundle_assets.append('udm2')
+    kept = [a for a in bundle_assets
+            if not (a == 'udm' and any([u in exclude_assets
+                                        for u in udm_assets])) and
+            not (a == 'udm2' and any([u in exclude_assets
+                                      for u in udm2_assets]))]
+    whole_mb = sum([asset_mb[a] for a in bundle_assets])
+    raster_mb = sum([asset_mb[a] for a in kept if a in raster_assets])
+    other_mb = sum([asset_mb[a] for a in kept if a not in raster_assets])
+
+    # Fraction of each scene kept
+    fractions = {}
+    if clip_geom is not None and footprints is not None:
+        for scene_id, geom in zip(footprints['id'], footprints.geometry):
+            if geom is not None and geom.area > 0:
+                fractions[scene_id] = (geom.intersection(clip_geom).area /
+                                       geom.area)
+    kept_mb = sum([raster_mb * fractions.get(i, 1.0) + other_mb
+                   for i in ids])
+
+    return {'scenes': len(ids),
+            'whole_bytes': int(len(ids) * whole_mb * MB),
+            'estimated_bytes': int(kept_mb * MB)}
+
+
+def log_size_estimate(estimate):
+    whole = estimate['whole_bytes'] / 1024 ** 3
+    estimated = estimate['estimated_bytes'] / 1024 ** 3
+    saved = 1 - estimated / whole if whole else 0
+    logger.info('Estimated delivery: {:,.1f} GB for {:,} scenes (whole '
+                'scenes: {:,.1f} GB, {:.0%} less)'.format(
+                    estimated, estimate['scenes'], whole, saved))
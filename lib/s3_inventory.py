@@ -0,0 +1,300 @@
+import datetime
+from pathlib import Path
+import sqlite3
+import threading
+
+from lib.archive import is_archive
+from lib.lib import get_cache_dir
+from lib.logging_utils import create_logger
+
+logger = create_logger(__name__, 'sh', 'INFO')
+
+inventory_file = 's3_inventory.sqlite'
+# Manifest of an order, the last file delivered
+master_manifest = 'source.json'
+
+# Inventories shared by all users, by (bucket name, prefix)
+inventories = {}
+inventories_lock = threading.Lock()
+
+create_tables_sql = """
+CREATE TABLE IF NOT EXISTS orders (
+    bucket TEXT,
+    oid TEXT,
+    marker_key TEXT,
+    marker_etag TEXT,
+    indexed TEXT,
+    PRIMARY KEY (bucket, oid)
+);
+CREATE TABLE IF NOT EXISTS objects (
+    bucket TEXT,
+    oid TEXT,
+    key TEXT,
+    size INTEGER,
+    etag TEXT,
+    PRIMARY KEY (bucket, key)
+);
+CREATE INDEX IF NOT EXISTS objects_oid ON objects (bucket, oid);
+"""
+# Record the marker of a delivered order, invalidating its index of
+# objects if the marker has changed
+record_marker_sql = """
+INSERT INTO orders (bucket, oid, marker_key, marker_etag, indexed)
+VALUES (?, ?, ?, ?, NULL)
+ON CONFLICT (bucket, oid) DO UPDATE SET
+    indexed = CASE WHEN marker_key = excluded.marker_key AND
+                        marker_etag = excluded.marker_etag
+                   THEN indexed ELSE NULL END,
+    marker_key = excluded.marker_key,
+    marker_etag = excluded.marker_etag
+"""
+
+
+class S3Object:
+    def __init__(self, key, size, e_tag):
+        """Object listed in the inventory, with the attributes of a
+        boto3 ObjectSummary used when downloading."""
+        self.key = key
+        self.size = size
+        self.e_tag = e_tag
+
+
+class S3Inventory:
+    def __init__(self, bucket, prefix, db_path=None):
+        """
+        Lists orders delivered to a bucket without enumerating every
+        object in it. Order IDs are the common prefixes of a listing
+        with Delimiter='/', one request per 1,000 orders, and an order's
+        readiness is checked with a HEAD of its manifest.
+
+        The objects of each delivered order (key, size and ETag) are
+        indexed in a local SQLite database, along with the ETag of the
+        order's marker, its manifest (source.json) or zip archive, which
+        is written last. An order's index is reused while its marker is
+        unchanged, so it is only listed again if it was redelivered.
+        Orders seen delivered are not checked again by list_manifests,
+        and orders no longer in the bucket are dropped from the index
+        when orders are listed.
+
+        Parameters
+        ----------
+        bucket : boto3 s3.Bucket
+        prefix : str
+            Prefix of orders in the bucket, e.g. 'jeff/planet'.
+        db_path : str, pathlib.Path
+            Alternative path to the database, defaults to a file in the
+            cache directory.
+        """
+        if db_path is None:
+            db_path = get_cache_dir() / inventory_file
+        self.bucket = bucket
+        self.bucket_name = bucket.name
+        self.prefix = prefix.rstrip('/')
+        # Client is thread-safe, unlike the Bucket resource
+        self.client = bucket.meta.client
+        self.db_path = Path(db_path)
+        self._lock = threading.Lock()
+        conn = self._connect()
+        try:
+            conn.executescript(create_tables_sql)
+        finally:
+            conn.close()
+
+    def _connect(self):
+        conn = sqlite3.connect(str(self.db_path), timeout=60)
+        conn.row_factory = sqlite3.Row
+        return conn
+
+    def _query(self, sql, params=()):
+        conn = self._connect()
+        try:
+            return [dict(r) for r in conn.execute(sql, params).fetchall()]
+        finally:
+            conn.close()
+
+    def order_prefix(self, oid):
+        return '{}/{}/'.format(self.prefix, oid)
+
+    def _paginate(self, prefix, delimiter=None):
+        paginator = self.client.get_paginator('list_objects_v2')
+        kwargs = {'Bucket': self.bucket_name, 'Prefix': prefix}
+        if delimiter:
+            kwargs['Delimiter'] = delimiter
+        return paginator.paginate(**kwargs)
+
+    def list_orders(self):
+        """Get the IDs of all orders in the bucket, from the common
+        prefixes under prefix, dropping orders no longer in the bucket
+        from the index."""
+        oids = set()
+        for page in self._paginate('{}/'.format(self.prefix), delimiter='/'):
+            for cp in page.get('CommonPrefixes', []):
+                oids.add(cp['Prefix'].rstrip('/').split('/')[-1])
+        indexed = set([r['oid'] for r in self._query(
+            'SELECT oid FROM orders WHERE bucket = ?', (self.bucket_name,))])
+        removed = indexed - oids
+        if removed:
+            logger.debug('Orders no longer in bucket: {:,}'.format(
+                len(removed)))
+            self._drop(removed)
+
+        return oids
+
+    def _execute(self, statements):
+        """Execute [(sql, params)] in one transaction."""
+        with self._lock:
+            conn = self._connect()
+            try:
+                with conn:
+                    for sql, params in statements:
+                        conn.execute(sql, params)
+            finally:
+                conn.close()
+
+    def _drop(self, oids):
+        self._execute([('DELETE FROM {} WHERE bucket = ? AND oid = '
+                        '?'.format(table), (self.bucket_name, oid))
+                       for oid in oids for table in ('orders', 'objects')])
+
+    def _head(self, key):
+        """ETag of key, None if it does not exist."""
+        try:
+            response = self.client.head_object(Bucket=self.bucket_name,
+                                               Key=key)
+        except self.client.exceptions.ClientError as e:
+            if e.response.get('Error', {}).get('Code') in ('404', 'NoSuchKey',
+                                                           'NotFound'):
+                return None
+            raise
+        return response['ETag']
+
+    def _indexed_marker(self, oid):
+        rows = self._query('SELECT marker_key, marker_etag, indexed FROM '
+                           'orders WHERE bucket = ? AND oid = ?',
+                           (self.bucket_name, oid))
+        return rows[0] if rows else None
+
+    def find_marker(self, oid):
+        """
+        Find the marker of an order, showing it has been delivered: its
+        manifest, checked with a HEAD request, or for orders delivered
+        as an archive, the archive, found by listing only the top level
+        of the order. The key of an order's archive is remembered, so
+        it is checked with a HEAD request next time.
+
+        Returns
+        -------
+        tuple : (key, ETag) of marker, or (None, None) if not delivered
+        """
+        keys = [self.order_prefix(oid) + master_manifest]
+        indexed = self._indexed_marker(oid)
+        if indexed and indexed['marker_key'] not in keys:
+            keys.insert(0, indexed['marker_key'])
+        marker = None
+        for key in keys:
+            etag = self._head(key)
+            if etag:
+                marker = (key, etag)
+                break
+        if marker is None:
+            # Archives are named by the order, so are listed
+            for page in self._paginate(self.order_prefix(oid),
+                                       delimiter='/'):
+                for obj in page.get('Contents', []):
+                    if is_archive(obj['Key']):
+                        marker = (obj['Key'], obj['ETag'])
+        if marker is None:
+            return None, None
+        self._execute([(record_marker_sql, (self.bucket_name, oid) + marker)])
+
+        return marker
+
+    def manifest_exists(self, oid):
+        """Check whether an order has been delivered, see find_marker."""
+        key, _etag = self.find_marker(oid)
+        return key is not None
+
+    def list_manifests(self):
+        """Get the IDs of all orders in the bucket that have been
+        delivered. Orders indexed as delivered are not checked again."""
+        oids = self.list_orders()
+        indexed = set([r['oid'] for r in self._query(
+            'SELECT oid FROM orders WHERE bucket = ? AND marker_key IS NOT '
+            'NULL', (self.bucket_name,))])
+        delivered = oids & indexed
+        for oid in oids - indexed:
+            if self.manifest_exists(oid):
+                delivered.add(oid)
+
+        return delivered
+
+    def _list_order(self, oid):
+        objects = []
+        for page in self._paginate(self.order_prefix(oid)):
+            for obj in page.get('Contents', []):
+                if not obj['Key'].endswith('/'):
+                    objects.append(S3Object(obj['Key'], obj['Size'],
+                                            obj['ETag']))
+        return objects
+
+    def _index(self, oid, marker_key, marker_etag, objects):
+        indexed = datetime.datetime.utcnow().isoformat()
+        statements = [('DELETE FROM objects WHERE bucket = ? AND oid = ?',
+                       (self.bucket_name, oid))]
+        statements.extend([('INSERT OR REPLACE INTO objects (bucket, oid, '
+                            'key, size, etag) VALUES (?, ?, ?, ?, ?)',
+                            (self.bucket_name, oid, o.key, o.size, o.e_tag))
+                           for o in objects])
+        statements.append(('INSERT OR REPLACE INTO orders (bucket, oid, '
+                           'marker_key, marker_etag, indexed) VALUES '
+                           '(?, ?, ?, ?, ?)',
+                           (self.bucket_name, oid, marker_key, marker_etag,
+                            indexed)))
+        self._execute(statements)
+
+    def order_objects(self, oid, refresh=False):
+        """
+        Get the objects of an order, from the index if the order's
+        marker is unchanged since it was indexed, otherwise by listing
+        the order. Orders not yet delivered are listed every time, and
+        not indexed, as objects are still being added.
+
+        Parameters
+        ----------
+        oid : str
+            Order ID.
+        refresh : bool
+            List the order even if its index is current.
+
+        Returns
+        -------
+        list : S3Objects
+        """
+        oid = str(oid)
+        marker_key, marker_etag = self.find_marker(oid)
+        if marker_key is None:
+            return self._list_order(oid)
+        indexed = self._indexed_marker(oid)
+        if (not refresh and indexed and indexed['indexed'] and
+                indexed['marker_key'] == marker_key and
+                indexed['marker_etag'] == marker_etag):
+            rows = self._query('SELECT key, size, etag FROM objects WHERE '
+                               'bucket = ? AND oid = ? ORDER BY key',
+                               (self.bucket_name, oid))
+            logger.debug('Order index current: {} ({:,} objects)'.format(
+                oid, len(rows)))
+            return [S3Object(r['key'], r['size'], r['etag']) for r in rows]
+        objects = self._list_order(oid)
+        self._index(oid, marker_key, marker_etag, objects)
+
+        return objects
+
+
+def get_inventory(bucket, prefix):
+    """Get the inventory of orders in the bucket under prefix, which is
+    created once and shared, e.g. by lib.order and lib.shelve_direct."""
+    with inventories_lock:
+        inventory_key = (bucket.name, prefix)
+        if inventory_key not in inventories:
+            inventories[inventory_key] = S3Inventory(bucket, prefix)
+        return inventories[inventory_key]
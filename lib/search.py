@@ -1,41 +1,48 @@
 from copy import deepcopy
 from calendar import monthrange
-from datetime import datetime
+from datetime import datetime, timedelta
 import json
 import math
 import os
-import requests
 import sys
-import threading
 from multiprocessing.dummy import Pool as ThreadPool
 
-import geopandas as gpd
-import pandas as pd
-from retrying import retry
-from shapely.geometry import Point, Polygon
 from tqdm import tqdm
 
+from lib.aoi import geom2json, prepare_aoi, read_aoi, tile_aoi
+from lib.checkpoint import SearchCheckpoint
+from lib.search_registry import SearchRegistry
+from lib.transport import PLANET_BASE_URL, get_shared_session
+from lib.search_cache import SearchCache, contains_filter_type, \
+    create_delta_request, merge_footprints
+from lib.lazy import lazy_import
 from lib.lib import read_ids, write_gdf
-from lib.db import Postgres
+from lib.db import Postgres, intersect_aoi_where
+from lib.onhand import date_cols, geom_col, load_exclude_ids, load_ids
 from lib.logging_utils import create_logger
 
+# Imported on first use
+gpd = lazy_import('geopandas')
+pd = lazy_import('pandas')
+shapely = lazy_import('shapely')
+lazy_import('shapely.geometry')
+
 logger = create_logger(__name__, 'sh', 'DEBUG')
 
 # TODO: convert to search_session class (all fxns that take session)
-# TODO: Add filter: id NOT IN [list of existing IDs]
 
 # config = os.path.join('config', 'saved_searches.yaml')
 
-# API URLs and key
-PLANET_URL = r'https://api.planet.com/data/v1'
+# API URLs, under the base URL in lib.transport, and key
+PLANET_URL = '{}/data/v1'.format(PLANET_BASE_URL)
 SEARCH_URL = '{}/searches'.format(PLANET_URL)
 STATS_URL = '{}/stats'.format(PLANET_URL)
 PLANET_API_KEY = os.getenv('PL_API_KEY')
 if not PLANET_API_KEY:
     logger.error('Error retrieving API key. Is PL_API_KEY env. variable set?')
 
-# Threading
-thread_local = threading.local()
+# Saved searches, shared by all threads, see get_registry
+registry = None
 
 # CREATE SEARCHES
 # Footprint tables
@@ -61,6 +68,7 @@ nif = 'NumberInFilter'
 rf = 'RangeFilter'
 sif = 'StringInFilter'
 lte = 'lte'
+lt = 'lt'
 gte = 'gte'
 
 op_symbol = 'op_symbol'
@@ -71,6 +79,17 @@ sym_equal = '='
 # Fields
 f_id = 'id'
 
+# Max IDs to include in a NotFilter of on hand IDs - the Planet API
+# rejects payloads of more than ~35k IDs, and large filters slow searches
+noh_filter_max_ids = 10000
+
+# Paging search results
+# 250 is max page size
+feat_per_page = 250
+# Response status codes of transient failures, already retried by the
+# shared session (see lib.transport), so not retried again here
+transient_status_codes = (408, 429, 500, 502, 503, 504)
+
 # For parsing attribute arguements
 # TODO: move this to a config file?
 attrib_arg_lut = {
@@ -96,16 +115,17 @@ attrib_arg_lut = {
 }
 
 
-def create_master_geom_filter(vector_file):
-    if not isinstance(vector_file, gpd.GeoDataFrame):
-        # Read in AOI
-        aoi = gpd.read_file(vector_file)
+def create_master_geom_filter(vector_file, simplify=False, tolerance=None):
+    """Create a GeometryFilter for each geometry in the AOI, nested in
+    an OrFilter if more than one. If simplify, the AOI is first prepared
+    with lib.aoi.prepare_aoi to reduce the request payload."""
+    if simplify:
+        aoi = prepare_aoi(vector_file, tolerance=tolerance)
     else:
-        aoi = vector_file
+        aoi = read_aoi(vector_file)
     # Create list of geometries to put in separate filters
     geometries = aoi.geometry.values
-    json_geoms = [json.loads(gpd.GeoSeries([g]).to_json())['features'][0]['geometry']
-                  for g in geometries]
+    json_geoms = [geom2json(g) for g in geometries]
     # Create each geometry filter
     geom_filters = []
     for jg in json_geoms:
@@ -196,16 +216,100 @@ def monthlist(start_date, end_date):
     return mlist
 
 
+def month_ranges(months, min_date=None, max_date=None,
+                 month_min_days=None, month_max_days=None):
+    """
+    Get the date ranges covering the selected months of every year
+    between min_date and max_date, limited to the days provided for
+    each month. Ranges that are contiguous (e.g. all of June followed by
+    all of July, or December followed by January) are merged.
+
+    Parameters
+    ----------
+    See create_months_filter
+
+    Returns
+    -------
+    list : (datetime.date: start, datetime.date: end) of each range,
+        end is exclusive (the day after the last day in the range)
+    """
+    date_format = '%Y-%m-%d'
+    if not min_date:
+        min_date = '2015-01-01'
+        logger.warning('Using default minimum date of {} for creation of month filters.'.format(min_date))
+    if not max_date:
+        max_date = datetime.now().strftime(date_format)
+        logger.warning('Using default maximum date of {} for creation of month filters.'.format(max_date))
+    min_day = datetime.strptime(min_date, date_format).date()
+    max_day = datetime.strptime(max_date, date_format).date()
+
+    # Zero-pad months and validate days
+    months = ['{:02d}'.format(int(m)) for m in months]
+    for m in months:
+        if not 1 <= int(m) <= 12:
+            logger.error('Invalid month: {}'.format(m))
+            raise ValueError('Invalid month: {}'.format(m))
+    month_min_days = {'{:02d}'.format(int(m)): int(d)
+                      for m, d in (month_min_days or {}).items()}
+    month_max_days = {'{:02d}'.format(int(m)): int(d)
+                      for m, d in (month_max_days or {}).items()}
+    for m, d in list(month_min_days.items()) + list(month_max_days.items()):
+        if not 1 <= d <= 31:
+            logger.error('Invalid day for month {}: {}'.format(m, d))
+            raise ValueError('Invalid day for month {}: {}'.format(m, d))
+
+    ranges = []
+    for year, month in monthlist(min_date, max_date):
+        if month not in months:
+            continue
+        year, month_num = int(year), int(month)
+        _, days_in_month = monthrange(year, month_num)
+        # Limit days to those in month, e.g. 30 for February -> 28/29
+        first_day = min(month_min_days.get(month, 1), days_in_month)
+        last_day = min(month_max_days.get(month, days_in_month), days_in_month)
+        if first_day > last_day:
+            logger.warning('Minimum day is after maximum day for month {}, '
+                           'skipping.'.format(month))
+            continue
+        start = max(datetime(year, month_num, first_day).date(), min_day)
+        end = min(datetime(year, month_num, last_day).date(), max_day)
+        if start > end:
+            continue
+        end += timedelta(days=1)
+        if ranges and ranges[-1][1] == start:
+            # Contiguous with previous range
+            ranges[-1] = (ranges[-1][0], end)
+        else:
+            ranges.append((start, end))
+
+    return ranges
+
+
+def create_range_filter(start, end):
+    """DateRangeFilter on 'acquired' from start up to (not including)
+    end."""
+    time_format = '%Y-%m-%dT00:00:00.000Z'
+    return {
+        ftype: drf,
+        field_name: "acquired",
+        config: {
+            gte: start.strftime(time_format),
+            lt: end.strftime(time_format)
+        }
+    }
+
+
 def create_months_filter(months, min_date=None, max_date=None,
                          month_min_days=None, month_max_days=None):
     """
-    Create an OrFilter which has a subfilter for each monnth that is a
-    DateRangeFilter for every year between min date and max date for
-    that month. Eg, if months = ['01']:
-        (acquired >= 2019-01-01 and acquired is <= 2019-01-31) OR
-        (acquired >= 2020-01-01 and acquired is <= 2020-01-31)
+    Create an OrFilter which has a DateRangeFilter subfilter for each
+    range of contiguous selected months between min date and max date.
+    Eg, if months = ['12', '01', '02']:
+        (acquired >= 2018-12-01 and acquired < 2019-03-01) OR
+        (acquired >= 2019-12-01 and acquired < 2020-03-01)
     Parameters:
         months : list
+            Months, like ['01', '02'] or ['1', '2']
         min_date: str
             Date, like '2020-10-01'
         max_date: str
@@ -219,43 +323,11 @@ def create_months_filter(months, min_date=None, max_date=None,
              02: 23,
              ...}
     """
-    time_suffix = "T00:00:00.00Z"
-    date_format = '%Y-%m-%d'
-    if not min_date:
-        min_date = '2015-01-01'
-        logger.warning('Using default minimum date of {} for creation of month filters.'.format(min_date))
-    if not max_date:
-        max_date = datetime.now().strftime(date_format)
-        logger.warning('Using default maximum date of {} for creation of month filters.'.format(max_date))
-    dates = [min_date, max_date]
-    all_months = monthlist(min_date, max_date)
-
-    # Select only months provided
-    selected_months = [(y, m) for y, m in all_months if m in months]
-    mfs = []
-    for year, month in selected_months:
-        # If limits on days are provided, use those
-        if month_min_days and month in month_min_days.keys():
-            first_day = month_min_days[month]
-        else:
-            first_day = '01'
-        if month_max_days and month in month_max_days.keys():
-            last_day = month_max_days[month]
-        else:
-            _, last_day = monthrange(int(year), int(month))
-
-        month_begin = '{}-{}-{}{}'.format(year, month, first_day, time_suffix)
-        month_end = '{}-{}-{}{}'.format(year, month, last_day, time_suffix)
-
-        mf = {
-            ftype: drf,
-            field_name: "acquired",
-            config: {
-                gte: month_begin,
-                lte: month_end
-            }
-        }
-        mfs.append(mf)
+    ranges = month_ranges(months, min_date=min_date, max_date=max_date,
+                          month_min_days=month_min_days,
+                          month_max_days=month_max_days)
+    mfs = [create_range_filter(start, end) for start, end in ranges]
+    logger.debug('Month filter date ranges: {}'.format(len(mfs)))
 
     months_filters = {
         ftype: or_filter,
@@ -265,22 +337,67 @@ def create_months_filter(months, min_date=None, max_date=None,
     return months_filters
 
 
-def create_noh_filter(tbl=scenes_onhand):
-    # TODO: This does not work with as it exceeds the Planet API payload size
-    #  when more than approximately 35k ids are included. Workaround is to
-    #  subset the IDs using the same parameters as the search filter, and
-    #  add a check that the number of IDs in the not_filter is < 35k. This
-    #  still won't scale perfectly but is a start for reducing returned
-    #  results.
+def create_season_filters(months, min_date=None, max_date=None,
+                          month_min_days=None, month_max_days=None):
+    """Create a DateRangeFilter for each range of contiguous selected
+    months (each season), to be searched separately. See
+    create_months_filter."""
+    ranges = month_ranges(months, min_date=min_date, max_date=max_date,
+                          month_min_days=month_min_days,
+                          month_max_days=month_max_days)
+
+    return [create_range_filter(start, end) for start, end in ranges]
+
+
+def create_noh_filter(tbl=scenes_onhand, min_date=None, max_date=None,
+                      aoi=None, max_ids=noh_filter_max_ids):
+    """
+    Create a NotFilter of the IDs in tbl that could be returned by a
+    search, i.e. only those acquired between min_date and max_date and
+    intersecting aoi. If there are more than max_ids such IDs, no filter
+    is created, as the payload would be too large for the API - on hand
+    IDs are removed from results client-side regardless.
+
+    Parameters
+    ----------
+    tbl : str
+        Table of IDs to exclude, one of 'scenes_onhand', 'scenes'
+    min_date : str
+        Date, like '2020-10-01'
+    max_date : str
+        Date, like '2020-10-31'
+    aoi : str, gpd.GeoDataFrame
+        Path to vector file or GeoDataFrame of AOI.
+    max_ids : int
+        Max IDs to include in filter.
 
-    with Postgres('sandwich-pool.planet') as db:
-        sql = "SELECT {} FROM {}".format(f_id, tbl)
-        oh_ids = list(set(list(db.sql2df(sql_str=sql, columns=[f_id])[f_id])))
+    Returns
+    -------
+    dict : NotFilter, None if more IDs than max_ids
+    """
+    wheres = []
+    if min_date:
+        wheres.append("{} >= '{}'".format(date_cols[tbl], min_date))
+    if max_date:
+        wheres.append("{} <= '{}'".format(date_cols[tbl], max_date))
+    if aoi is not None:
+        if not isinstance(aoi, gpd.GeoDataFrame):
+            aoi = gpd.read_file(aoi)
+        wheres.append('({})'.format(intersect_aoi_where(aoi,
+                                                        geom_col=geom_col)))
+    where = ' AND '.join(wheres)
+    oh_ids = load_ids(tbl, where={tbl: where})
+    if len(oh_ids) > max_ids:
+        logger.warning('IDs in {} matching search: {:,} - exceeds max for '
+                       'NotFilter ({:,}), skipping. On hand IDs will be '
+                       'removed from results as they are '
+                       'retrieved.'.format(tbl, len(oh_ids), max_ids))
+        return None
 
     sf = {
         ftype: sif,
         field_name: f_id,
-        config: oh_ids
+        config: oh_ids.tolist()
     }
     nf = {
         ftype: not_filter,
@@ -385,79 +502,241 @@ def create_search_request(name, item_types, search_filters):
 
 
 def create_saved_search(search_request, overwrite_saved=False):
-    """Creates a saved search on the Planet API and returns the search ID."""
-    with requests.Session() as s:
-        logger.debug('Authorizing using Planet API key...')
-        s.auth = (PLANET_API_KEY, '')
-        saved_searches = get_all_searches(s)
-
-        search_name = search_request["name"]
-        # Determine if a saved search with the provided name exists
-        ids_with_same_name = [x for x in saved_searches.keys() if saved_searches[x]['name'] == search_name]
-
-        if ids_with_same_name:
-            logger.warning("Saved search with name '{}' already exists.".format(search_name))
-            if overwrite_saved:
-                logger.warning("Overwriting saved search with same name.")
-                for overwrite_id in ids_with_same_name:
-                    overwrite_url = '{}/{}'.format(SEARCH_URL, overwrite_id)
-                    r = s.delete(overwrite_url)
-                    if r.status_code == 204:
-                        logger.debug('Deleted saved search: {}'.format(overwrite_id))
-            else:
-                logger.warning('Overwrite not specified, exiting')
-                sys.exit()
-        # Create new saved search
-        logger.info('Creating new saved search: {}'.format(search_name))
-        saved_search = s.post(SEARCH_URL, json=search_request)
-        logger.debug('Search creation request status: {}'.format(saved_search.status_code))
-        if saved_search.status_code == 200:
-            saved_search_id = saved_search.json()['id']
-            logger.debug('New search created successfully: {}'.format(saved_search_id))
+    """Creates a saved search on the Planet API and returns the search ID.
+    Raises ValueError if a saved search with the same name exists and
+    overwrite_saved is False."""
+    s = get_session()
+    saved_searches = get_registry()
+
+    search_name = search_request["name"]
+    # Determine if a saved search with the provided name exists
+    ids_with_same_name = saved_searches.ids_for_name(search_name)
+
+    if ids_with_same_name:
+        logger.warning("Saved search with name '{}' already exists.".format(search_name))
+        # Reuse a search with identical parameters that has a
+        # checkpoint, allowing retrieving its footprints to resume
+        resumable = [x for x in ids_with_same_name
+                     if SearchCheckpoint(x).exists and
+                     saved_searches.get(x)['filter'] == search_request['filter'] and
+                     saved_searches.get(x)['item_types'] == search_request['item_types']]
+        if resumable:
+            logger.info('Reusing saved search with the same parameters '
+                        'that has a checkpoint: {}'.format(resumable[0]))
+            return resumable[0]
+        if overwrite_saved:
+            logger.warning("Overwriting saved search with same name.")
+            for overwrite_id in ids_with_same_name:
+                delete_search_id(overwrite_id)
         else:
-            logger.error('Error creating new search.')
-            saved_search_id = None
+            # Raised rather than exiting, as this runs in worker threads
+            raise ValueError('Saved search with name "{}" already exists '
+                             'and overwrite not specified.'.format(
+                                 search_name))
+    # Create new saved search
+    logger.info('Creating new saved search: {}'.format(search_name))
+    saved_search = s.post(SEARCH_URL, json=search_request)
+    logger.debug('Search creation request status: {}'.format(saved_search.status_code))
+    if saved_search.status_code == 200:
+        saved_search_id = saved_search.json()['id']
+        saved_searches.add(saved_search.json())
+        logger.debug('New search created successfully: {}'.format(saved_search_id))
+    else:
+        logger.error('Error creating new search.')
+        saved_search_id = None
 
     return saved_search_id
 
 
-def get_all_searches(session):
-    logger.debug('Getting saved searches...')
-    res = session.get(SEARCH_URL, params={"search_type": "saved"})
-    searches = res.json()["searches"]
+def get_registry(refresh=False):
+    """Get the registry of saved searches, which is created once and
+    shared. If refresh, the list of saved searches is reread from the
+    API."""
+    global registry
+    if registry is None:
+        registry = SearchRegistry(session=get_session(), search_url=SEARCH_URL)
+    if refresh:
+        registry.refresh()
+
+    return registry
 
-    saved_searches = dict()
-    for se in searches:
-        saved_searches[se["id"]] = {k: se[k] for k in se.keys()}
 
+def get_all_searches(session=None, refresh=False):
+    """Get all saved searches as a dict of {search ID: search}. session
+    is not used, kept for backwards compatibility."""
+    saved_searches = get_registry(refresh=refresh).searches
     logger.debug('Saved searches found: {}'.format(len(saved_searches.keys())))
-    logger.debug('Saved search IDs:\n{}'.format('\n'.join(saved_searches.keys())))
 
     return saved_searches
 
 
 def get_search_id(session, search_name):
-    """Return the saved search ID for the given search name"""
-    all_searches = get_all_searches(session)
-    matches = [s for s in all_searches if s["name"]]
-    search_id = all_searches[search_name]["id"]
-
-    return search_id
+    """Return the saved search ID for the given search name. If more than
+    one search has the name, the most recently created is returned."""
+    saved_searches = get_registry()
+    matches = [saved_searches.get(s_id)
+               for s_id in saved_searches.ids_for_name(search_name)]
+    if not matches:
+        logger.warning('No search with name {} found.'.format(search_name))
+        return None
+    if len(matches) > 1:
+        logger.warning('Multiple searches found with name {}: '
+                       '{}'.format(search_name, [m['id'] for m in matches]))
+    matches = sorted(matches, key=lambda m: m.get('created', ''))
+
+    return matches[-1]['id']
 
 
 def get_saved_search(session, search_id=None, search_name=None):
-    all_searches = get_all_searches(session=session)
-    if search_id:
-        ss = all_searches[search_id]
-    elif search_name:
-        ss_id = get_search_id(session=session, search_name=search_name)
-        ss = all_searches[search_id]
-    else:
+    if search_name and not search_id:
+        search_id = get_search_id(session=session, search_name=search_name)
+    elif not search_id:
         logger.error('Must provide one of search_id or search_name')
+        return None
+    ss = get_registry().get(search_id)
+    if ss is None:
+        # Possibly created since registry was read
+        ss = get_registry(refresh=True).get(search_id)
 
     return ss
 
 
+def build_search_request(name, item_types,
+                         ids=None,
+                         aoi=None,
+                         attrib_args=None,
+                         months=None,
+                         month_min_day_args=None,
+                         month_max_day_args=None,
+                         filters=None,
+                         asset_filters=None,
+                         load_filter=None,
+                         not_on_hand=False,
+                         fp_not_on_hand=False,
+                         noh_api_filter=False,
+                         simplify_aoi=False,
+                         aoi_tolerance=None,
+                         aoi_count_check=False,
+                         **kwargs):
+    """Create a search request from the passed search parameters. See
+    create_search for parameters. not_on_hand and fp_not_on_hand only
+    add filters to the request if noh_api_filter, otherwise on hand IDs
+    are removed from results as they are retrieved.
+
+    Returns
+    -------
+    dict : search request
+    """
+    search_filters = []
+
+    if attrib_args and any([v for k, v in attrib_args.items()]):
+        master_attribute_filter = create_master_attribute_filter(attrib_args)
+        logger.debug(master_attribute_filter)
+        search_filters.append(master_attribute_filter)
+
+    # Parse AOI to filter
+    if aoi is not None:
+        aoi_attribute_filter = create_master_geom_filter(vector_file=aoi,
+                                                         simplify=simplify_aoi,
+                                                         tolerance=aoi_tolerance)
+        aoi_filter_idx = len(search_filters)
+        search_filters.append(aoi_attribute_filter)
+
+    # Parse raw filters
+    if filters:
+        search_filters.extend([filter_from_arg(f) for f in filters])
+
+    if ids:
+        if isinstance(ids, str):
+            # Assume path
+            include_ids = read_ids(ids)
+        else:
+            include_ids = ids
+        ids_filter = create_ids_filter(include_ids)
+        search_filters.append(ids_filter)
+
+    if months:
+        month_min_days = None
+        month_max_days = None
+        if month_min_day_args:
+            month_min_days = {month: day for month, day in month_min_day_args}
+        if month_max_day_args:
+            month_max_days = {month: day for month, day in month_max_day_args}
+        mf = create_months_filter(months,
+                                  min_date=attrib_args.get('min_date'),
+                                  max_date=attrib_args.get('max_date'),
+                                  month_min_days=month_min_days,
+                                  month_max_days=month_max_days)
+        search_filters.append(mf)
+
+    # Parse any provided filters
+    if load_filter:
+        addtl_filter = json.load(open(load_filter))
+        search_filters.append(addtl_filter)
+
+    # Parse any asset filters
+    if asset_filters:
+        for af in asset_filters:
+            f = create_asset_filter(af)
+            search_filters.append(f)
+
+    if noh_api_filter:
+        noh_tbls = []
+        if not_on_hand:
+            noh_tbls.append(scenes_onhand)
+        if fp_not_on_hand:
+            noh_tbls.append(scenes)
+        for tbl in noh_tbls:
+            noh_filter = create_noh_filter(
+                tbl=tbl,
+                min_date=attrib_args.get('min_date') if attrib_args else None,
+                max_date=attrib_args.get('max_date') if attrib_args else None,
+                aoi=aoi)
+            if noh_filter:
+                search_filters.append(noh_filter)
+
+    # Create search request using the filters created above
+    sr = create_search_request(name=name, item_types=item_types, search_filters=search_filters)
+
+    if aoi is not None and simplify_aoi and aoi_count_check:
+        # Compare to the count using the AOI as provided
+        full_filters = list(search_filters)
+        full_filters[aoi_filter_idx] = create_master_geom_filter(vector_file=aoi)
+        full_sr = create_search_request(name=name, item_types=item_types,
+                                        search_filters=full_filters)
+        log_count_parity(full_sr, sr)
+
+    return sr
+
+
+def log_count_parity(full_sr, prepared_sr):
+    """Log the payload size and count of a search request before and
+    after preparing its AOI."""
+    full_count = get_search_count(full_sr)
+    prepared_count = get_search_count(prepared_sr)
+    logger.info('Search request payload: {:,} -> {:,} bytes'.format(
+        len(json.dumps(full_sr)), len(json.dumps(prepared_sr))))
+    logger.info('Count with AOI as provided: {:,}, with prepared AOI: {:,} '
+                '({:+,})'.format(full_count, prepared_count,
+                                 prepared_count - full_count))
+    if prepared_count < full_count:
+        logger.warning('Prepared AOI returns fewer results than AOI as '
+                       'provided.')
+
+
+def write_search_request(search_request, save_filter):
+    """Write search request to json file, which can then be used with
+    load_filter."""
+    if os.path.basename(save_filter) == 'default.json':
+        save_filter = os.path.join(os.path.dirname(__file__),
+                                   'config',
+                                   'search_filters',
+                                   '{}.json'.format(search_request['name']))
+    logger.debug('Saving filter to: {}'.format(save_filter))
+    with open(save_filter, 'w') as src:
+        json.dump(search_request, src)
+
+
 def create_search(name, item_types,
                   ids=None,
                   aoi=None,
@@ -470,10 +749,15 @@ def create_search(name, item_types,
                   load_filter=None,
                   not_on_hand=False,
                   fp_not_on_hand=False,
+                  noh_api_filter=False,
+                  simplify_aoi=False,
+                  aoi_tolerance=None,
+                  aoi_count_check=False,
                   get_count_only=False,
                   overwrite_saved=False,
                   save_filter=False,
                   dryrun=False,
+                  search_request=None,
                   **kwargs):
     """Create a saved search using the Planet API, which gets a search
     ID. The search ID can then be used to retrieve footprints.
@@ -502,10 +786,23 @@ def create_search(name, item_types,
         List of assests to include in search, e.g. ['basic_analytic']
     load_filter : str
         Path to json file containing filter(s) to load and use.
+    aoi : str, gpd.GeoDataFrame
+        Path to vector file or GeoDataFrame of AOI.
+    simplify_aoi : bool
+        Simplify the AOI and merge small parts to reduce the request
+        payload, see lib.aoi.prepare_aoi
+    aoi_tolerance : float
+        Tolerance in degrees for simplifying the AOI.
+    aoi_count_check : bool
+        Log the count of the search with the AOI as provided alongside
+        the count with the simplified AOI.
     not_on_hand : bool
-        Create a NOT filter with all IDs currently on hand.
+        Exclude IDs currently on hand ('scenes_onhand' table).
     fp_not_on_hand : bool
-        Create a NOT filter with all IDs currently in 'scenes' table
+        Exclude IDs currently in 'scenes' table
+    noh_api_filter : bool
+        Also add a NotFilter of the excluded IDs that could match the
+        search to the request, if there are few enough of them.
     get_count_only : bool
         Get the count of the search and stop - do not get footprints
     overwrite_saved : bool
@@ -514,6 +811,9 @@ def create_search(name, item_types,
         Path to write filter as json, can then be used with load_filter
     dryrun : bool
         Create filters and get count without saving search.
+    search_request : dict
+        Search request already created with build_search_request, if
+        passed all filter parameters are ignored.
 
     Returns
     -------
@@ -522,88 +822,26 @@ def create_search(name, item_types,
 
     logger.info('Creating saved search...')
 
-    search_filters = []
-
-    if attrib_args and any([v for k, v in attrib_args.items()]):
-        master_attribute_filter = create_master_attribute_filter(attrib_args)
-        print(master_attribute_filter)
-        search_filters.append(master_attribute_filter)
-
-    # Parse AOI to filter
-    if aoi is not None:
-        aoi_attribute_filter = create_master_geom_filter(vector_file=aoi)
-        search_filters.append(aoi_attribute_filter)
-
-    # Parse raw filters
-    if filters:
-        search_filters.extend([filter_from_arg(f) for f in filters])
-
-    if ids:
-        if isinstance(ids, str):
-            # Assume path
-            include_ids = read_ids(ids)
-        else:
-            include_ids = ids
-        ids_filter = create_ids_filter(include_ids)
-        search_filters.append(ids_filter)
-
-    if months:
-        month_min_days = None
-        month_max_days = None
-        if month_min_day_args:
-            month_min_days = {month: day for month, day in month_min_day_args}
-        if month_max_day_args:
-            month_max_days = {month: day for month, day in month_max_day_args}
-        mf = create_months_filter(months,
-                                  min_date=attrib_args['min_date'],
-                                  max_date=attrib_args['max_date'],
-                                  month_min_days=month_min_days,
-                                  month_max_days=month_max_days)
-        search_filters.append(mf)
-
-    # Parse any provided filters
-    if load_filter:
-        addtl_filter = json.load(open(load_filter))
-        search_filters.append(addtl_filter)
-
-    # Parse any asset filters
-    if asset_filters:
-        for af in asset_filters:
-            f = create_asset_filter(af)
-            search_filters.append(f)
-
-    if not_on_hand:
-        logger.warning('Not on hand filter may fail due to payload size '
-                       'restriction on Planet API.')
-        noh_filter = create_noh_filter(tbl=scenes_onhand)
-        search_filters.append(noh_filter)
-
-    if fp_not_on_hand:
-        logger.warning('Not on hand filter may fail due to payload size '
-                       'restriction on Planet API.')
-        fp_noh_filter = create_noh_filter(tbl=scenes)
-        fp_noh_filter['config']['config'] = fp_noh_filter['config']['config'][:10000]
-        search_filters.append(fp_noh_filter)
-
-    # Create search request using the filters created above
-    for f in search_filters:
-        if f['type'] == 'NotFilter':
-            pf = deepcopy(f)
-            # print(len(pf['config']['config']))
-            pf['config']['config'] = pf['config']['config'][:20]
-            # pprint(pf)
-
-    sr = create_search_request(name=name, item_types=item_types, search_filters=search_filters)
+    if search_request is None:
+        sr = build_search_request(name=name, item_types=item_types,
+                                  ids=ids, aoi=aoi, attrib_args=attrib_args,
+                                  months=months,
+                                  month_min_day_args=month_min_day_args,
+                                  month_max_day_args=month_max_day_args,
+                                  filters=filters,
+                                  asset_filters=asset_filters,
+                                  load_filter=load_filter,
+                                  not_on_hand=not_on_hand,
+                                  fp_not_on_hand=fp_not_on_hand,
+                                  noh_api_filter=noh_api_filter,
+                                  simplify_aoi=simplify_aoi,
+                                  aoi_tolerance=aoi_tolerance,
+                                  aoi_count_check=aoi_count_check)
+    else:
+        sr = search_request
 
     if save_filter:
-        if os.path.basename(save_filter) == 'default.json':
-            save_filter = os.path.join(os.path.dirname(__file__),
-                                       'config',
-                                       'search_filters',
-                                       '{}.json'.format(name))
-        logger.debug('Saving filter to: {}'.format(save_filter))
-        with open(save_filter, 'w') as src:
-            json.dump(sr, src)
+        write_search_request(sr, save_filter)
 
     if logger.level == 10:
         # pprint was happening even when logger.level = 20 (INFO)
@@ -632,30 +870,64 @@ def create_search(name, item_types,
     return ss_id, total_count
 
 
-def delete_saved_search(session, search_name=None, search_id=None,
+def delete_search_id(search_id, dryrun=False):
+    """Delete a saved search by ID, returning True if deleted."""
+    if dryrun:
+        logger.debug('-dryrun- Delete: {}'.format(search_id))
+        return False
+    delete_url = "{}/{}".format(SEARCH_URL, search_id)
+    r = get_session().delete(delete_url)
+    if r.status_code in (204, 404):
+        # Already deleted elsewhere if 404
+        get_registry().remove(search_id)
+        logger.debug('Deleted saved search: {}'.format(search_id))
+        return r.status_code == 204
+    logger.error('Error deleting search {}: {} {}'.format(search_id,
+                                                         r.status_code,
+                                                         r.reason))
+    return False
+
+
+def delete_saved_search(session=None, search_name=None, search_id=None,
                         dryrun=False):
-    all_searches = get_all_searches(session)
+    """Delete a saved search by ID, or all saved searches with name."""
     if search_id:
-        if search_id in all_searches.keys():
-            delete_id = search_id
-            delete_url = "{}/{}".format(SEARCH_URL, delete_id)
+        delete_ids = [search_id]
     elif search_name:
-        ids_names = [(s_id, all_searches[s_id]['name']) for s_id in all_searches
-                     if all_searches[s_id]['name'] == search_name]
-        if len(ids_names) == 0:
-            logger.warning('No search with name {} found.'.format(search_name))
-        elif len(ids_names) > 1:
-            logger.warning('Multiple searches found with name {}\n{}'.format(search_name, ids_names))
-        else:
-            delete_id = ids_names[0]
-        delete_url = "{}/{}".format(SEARCH_URL, delete_id)
+        delete_ids = get_registry().ids_for_name(search_name)
+        if len(delete_ids) > 1:
+            logger.warning('Multiple searches found with name {}\n'
+                           '{}'.format(search_name, delete_ids))
+    else:
+        delete_ids = []
+    if not delete_ids:
+        logger.warning('No search found to delete: '
+                       '{}'.format(search_id or search_name))
+        return
 
-    logger.debug('ID to delete: {}'.format(delete_id))
+    deleted = delete_saved_searches(delete_ids, dryrun=dryrun)
+    if deleted:
+        logger.info('Successfully deleted search.')
 
-    if not dryrun:
-        r = session.delete(delete_url)
-        if r.status_code == 204:
-            logger.info('Successfully deleted search.')
+
+def delete_saved_searches(search_ids, threads=8, dryrun=False):
+    """Delete a number of saved searches concurrently.
+
+    Returns
+    -------
+    int : count of searches deleted
+    """
+    logger.debug('IDs to delete: {}'.format(search_ids))
+    pool = ThreadPool(threads)
+    results = list(tqdm(pool.imap_unordered(
+                        lambda s_id: delete_search_id(s_id, dryrun=dryrun),
+                        search_ids),
+                        total=len(search_ids), desc='Deleting searches',
+                        disable=len(search_ids) < 2))
+    pool.close()
+    pool.join()
+
+    return sum(results)
 
 
 def get_search_count(search_request):
@@ -669,19 +941,17 @@ def get_search_count(search_request):
     buckets_key = 'buckets'
     count_key = 'count'
 
-    with requests.Session() as session:
-        logger.debug('Authorizing using Planet API key...')
-        session.auth = (PLANET_API_KEY, '')
-        stats = session.post(STATS_URL, json=stats_request)
-        if not str(stats.status_code).startswith('2'):
-            logger.error(stats.status_code)
-            logger.error(stats.reason)
-            logger.error('Error connecting to {} with request:'
-                         '\n{}'.format(STATS_URL, str(stats_request)[0:500]))
-            if len(str(stats_request)) > 500:
-                logger.error('...{}'.format(str(stats_request)[-500:]))
-            logger.debug(str(stats_request)[500:])
-        logger.debug(stats)
+    session = get_session()
+    stats = session.post(STATS_URL, json=stats_request)
+    if not str(stats.status_code).startswith('2'):
+        logger.error(stats.status_code)
+        logger.error(stats.reason)
+        logger.error('Error connecting to {} with request:'
+                     '\n{}'.format(STATS_URL, str(stats_request)[0:500]))
+        if len(str(stats_request)) > 500:
+            logger.error('...{}'.format(str(stats_request)[-500:]))
+        logger.debug(str(stats_request)[500:])
+    logger.debug(stats)
 
     # pprint(stats_request)
     total_count = sum(bucket[count_key]
@@ -693,18 +963,24 @@ def get_search_count(search_request):
 
 
 def get_session():
-    if not hasattr(thread_local, "session"):
-        thread_local.session = requests.Session()
-        thread_local.session.auth = (PLANET_API_KEY, '')
-    return thread_local.session
+    """Session for Planet API requests, shared by all threads, with a
+    pooled connection and rate limit, see lib.transport."""
+    return get_shared_session()
 
 
 def response2gdf(response):
     """Converts API response to a geodataframe."""
+    features = response.json()['features']
+
+    return features2gdf(features)
+
+
+def features2gdf(features):
+    """Converts a list of features from an API response to a
+    geodataframe."""
     # Coordinate system of features returned by Planet API
     crs = 'epsg:4326'
     # Response feature property keys
-    features_key = 'features'
     id_key = 'id'
     geometry_key = 'geometry'
     type_key = 'type'
@@ -722,7 +998,6 @@ def response2gdf(response):
                      'strip_id', 'sun_azimuth', 'sun_elevation',
                      'updated', 'view_angle']
 
-    features = response.json()[features_key]
     # Format response in dictionary format supported by geopandas
     reform_feats = {att: [] for att in property_atts}
     reform_feats[id_key] = []
@@ -734,9 +1009,11 @@ def response2gdf(response):
         # Get geometry as shapely object
         geom_type = feat[geometry_key][type_key]
         if geom_type == polygon_type:
-            geometry = Polygon(feat[geometry_key][coords_key][0])
+            geometry = shapely.geometry.Polygon(
+                feat[geometry_key][coords_key][0])
         elif geom_type == point_type:
-            geometry = Point(feat[geometry_key][coords_key][0])
+            geometry = shapely.geometry.Point(
+                feat[geometry_key][coords_key][0])
         reform_feats[geometry_key].append(geometry)
         # Get all properties
         for att in property_atts:
@@ -751,86 +1028,134 @@ def response2gdf(response):
     return gdf
 
 
-def get_search_page_urls(saved_search_id, total_count):
-    # TODO: Speed this up, bottle neck - is it possible to speed up?
-    # TODO: How much longer would it take to just process each page...?
-    # TODO: Rewrite as loop up to total number of scenes in search id
-    def fetch_pages(search_url, all_pages):
-        # logger.debug('Fetching page...')
-        session = get_session()
-        all_pages.append(search_url)
-        res = session.get(search_url)
-        if res.status_code != 200:
-            logger.error('Error connecting to search API: {}'.format(first_page_url))
-            logger.error('Status code: {}'.format(res.status_code))
-            logger.error('Reason: {}'.format(res.reason))
-            if res.status_code == 408:
-                logger.warning('Request timeout.')
-            raise ConnectionError
-        page = res.json()
-        next_url = page['_links'].get('_next')
-        logger.debug(next_url)
-
-        return next_url
-        # if next_url:
-        #     fetch_pages(next_url, all_pages)
-
-    # 250 is max page size
-    feat_per_page = 250
-
-    logger.debug('Getting page urls for search...')
-    all_pages = []
-
-    total_pages = math.ceil(total_count / feat_per_page) + 1
-    logger.debug('Total pages for search: {}'.format(total_pages))
-    pbar = tqdm(total=total_pages, desc='Parsing response pages')
-    first_page_url = '{}/{}/results?_page_size={}'.format(SEARCH_URL, saved_search_id, feat_per_page)
-    next_page = first_page_url
-    while next_page:
-        # pbar.write('Parsing: {}'.format(next_page))
-        next_page = fetch_pages(next_page, all_pages=all_pages)
-        pbar.update(1)
-    logger.debug('Pages: {}'.format(len(all_pages)))
+def exclude_features(features, exclude_ids):
+    """Remove features with IDs in exclude_ids from a page of
+    features."""
+    in_set = exclude_ids.contains([feat['id'] for feat in features])
+
+    return [feat for feat, is_in in zip(features, in_set) if not is_in]
+
 
-    return all_pages
+def exclude_footprints(footprints, exclude_ids):
+    """Remove footprints with IDs in exclude_ids."""
+    if len(footprints) == 0:
+        return footprints
+    keep = ~exclude_ids.contains(footprints[f_id])
+    logger.info('Footprints excluded as on hand: {:,}'.format(
+        len(footprints) - keep.sum()))
 
+    return footprints[keep]
 
-@retry(wait_exponential_multiplier=1000, wait_exponential_max=10000,
-       stop_max_delay=30000)
-def process_page(page_url):
+
+class SearchResultsError(ConnectionError):
+    """Raised when a page of search results cannot be retrieved for a
+    reason that retrying will not resolve."""
+    def __init__(self, page_url, status_code, reason):
+        super().__init__('{}: {} {}'.format(page_url, status_code, reason))
+        self.page_url = page_url
+        self.status_code = status_code
+        self.reason = reason
+
+
+def fetch_page(page_url):
+    """Get a page of search results. Transient failures are retried by
+    the shared session, and raised as ConnectionError once it gives up.
+
+    Returns
+    -------
+    tuple : (list:features on page, str:url of next page, None if last page)
+    """
     session = get_session()
     res = session.get(page_url)
-    if res.status_code == 429:
-        logger.debug('Response: {} - rate limited - retrying...'.format(res.status_code))
-        raise Exception("Rate limit error. Retrying...")
+    if res.status_code in transient_status_codes:
+        raise ConnectionError('Response after retries: {} {}'.format(
+            res.status_code, res.reason))
     if res.status_code != 200:
         logger.error('Error connecting to search API: {}'.format(page_url))
         logger.error('Status code: {}'.format(res.status_code))
         logger.error('Reason: {}'.format(res.reason))
-        raise ConnectionError
+        raise SearchResultsError(page_url, res.status_code, res.reason)
+    page = res.json()
+    next_url = page['_links'].get('_next')
 
-    gdf = response2gdf(response=res)
+    return page['features'], next_url
 
-    return gdf
 
+def get_features(saved_search_id, total_count, resume=True,
+                 exclude_ids=None):
+    """Get all features for a saved search, one page at a time. Each page
+    is written to a checkpoint for the search as it is processed, so an
+    interrupted retrieval can be resumed from the last page processed.
 
-def get_features(saved_search_id, total_count):
+    Parameters
+    ----------
+    saved_search_id : str
+        ID of saved search to get features for.
+    total_count : int
+        Count of the search, used for reporting progress.
+    resume : bool
+        Resume from an existing checkpoint for the search, if one exists.
+        If False, any existing checkpoint is discarded.
+    exclude_ids : lib.onhand.IDSet
+        IDs to remove from each page of results as it is processed.
 
-    all_pages = get_search_page_urls(saved_search_id=saved_search_id,
-                                     total_count=total_count)
+    Returns
+    -------
+    gpd.GeoDataFrame : footprints of all features in search
+    """
+    first_page_url = '{}/{}/results?_page_size={}'.format(SEARCH_URL,
+                                                         saved_search_id,
+                                                         feat_per_page)
+    checkpoint = SearchCheckpoint(saved_search_id)
+    if checkpoint.exists and resume:
+        logger.info('Resuming from checkpoint for search {}: {:,} pages '
+                    '({:,} features) already processed.'.format(
+                     saved_search_id, len(checkpoint.pages),
+                     checkpoint.feature_count))
+        next_page = checkpoint.next_url
+    else:
+        checkpoint.clear()
+        next_page = first_page_url
 
-    threads = 1
-    thread_pool = ThreadPool(threads)
-    logger.debug('Getting features...')
-    results = thread_pool.map(process_page, all_pages)
+    total_pages = math.ceil(total_count / feat_per_page)
+    logger.debug('Total pages for search: {}'.format(total_pages))
+    pbar = tqdm(total=total_pages, initial=len(checkpoint.pages),
+                desc='Parsing response pages')
+    while next_page:
+        try:
+            features, next_page_url = fetch_page(next_page)
+        except SearchResultsError:
+            if next_page == first_page_url:
+                raise
+            # Links to pages are not valid indefinitely
+            logger.warning('Unable to resume from checkpoint page, '
+                           'restarting from first page.')
+            checkpoint.clear()
+            pbar.reset()
+            next_page = first_page_url
+            continue
+        if exclude_ids:
+            features = exclude_features(features, exclude_ids)
+        checkpoint.add_page(features, next_page_url)
+        next_page = next_page_url
+        pbar.update(1)
+    pbar.close()
+    logger.debug('Pages: {}'.format(len(checkpoint.pages)))
+    if exclude_ids:
+        logger.info('Features excluded as on hand: {:,}'.format(
+            total_count - checkpoint.feature_count))
 
     logger.info('Combining page results...')
-    master_footprints = pd.concat(results)
+    results = [features2gdf(features) for features in checkpoint.iter_pages()]
+    if results:
+        master_footprints = pd.concat(results)
+    else:
+        master_footprints = gpd.GeoDataFrame()
 
     return master_footprints
 
 
-def select_scenes(search_id, dryrun=False):
+def select_scenes(search_id, resume=True, exclude_ids=None, dryrun=False):
 
     # Test a request
     session = get_session()
@@ -850,7 +1175,10 @@ def select_scenes(search_id, dryrun=False):
     # Perform requests to API to return features, which are converted to footprints in a geodataframe
     master_footprints = gpd.GeoDataFrame()
     if not dryrun:
-        master_footprints = get_features(saved_search_id=search_id, total_count=total_count)
+        master_footprints = get_features(saved_search_id=search_id,
+                                         total_count=total_count,
+                                         resume=resume,
+                                         exclude_ids=exclude_ids)
     logger.info('Total features processed: {:,}'.format(len(master_footprints)))
 
     return master_footprints, sr_name
@@ -865,17 +1193,9 @@ def write_scenes(scenes, out_name=None, out_path=None, out_dir=None):
     write_gdf(scenes, out_path)
 
 
-def get_search_footprints(out_path=None, out_dir=None,
-                          to_tbl=None, dryrun=False,
-                          search_id=None, **kwargs):
-    if not PLANET_API_KEY:
-        logger.error('Error retrieving API key. Is PL_API_KEY env. variable '
-                     'set?')
-
-    scenes, search_name = select_scenes(search_id=search_id, dryrun=dryrun)
-    if len(scenes) == 0:
-        logger.warning('No scenes found. Exiting.')
-        sys.exit()
+def write_search_results(scenes, search_name=None, out_path=None,
+                         out_dir=None, to_tbl=None, dryrun=False):
+    """Write footprints to a vector file and/or database table."""
     if any([out_path, out_dir]):
         if out_dir:
             write_scenes(scenes, out_name=search_name, out_dir=out_dir)
@@ -888,4 +1208,239 @@ def get_search_footprints(out_path=None, out_dir=None,
                                   table=to_tbl,
                                   dryrun=dryrun)
 
+
+def get_search_footprints(out_path=None, out_dir=None,
+                          to_tbl=None, dryrun=False,
+                          search_id=None, resume=True, not_on_hand=False,
+                          fp_not_on_hand=False, **kwargs):
+    """Get footprints for a saved search and write them out. Pages of
+    results are checkpointed as they are retrieved, if interrupted,
+    rerunning with the same search ID resumes from the last page
+    processed. The checkpoint is removed once footprints are written.
+    If not_on_hand / fp_not_on_hand, IDs in the scenes_onhand / scenes
+    tables are removed from each page."""
+    if not PLANET_API_KEY:
+        logger.error('Error retrieving API key. Is PL_API_KEY env. variable '
+                     'set?')
+
+    exclude_ids = load_exclude_ids(not_on_hand=not_on_hand,
+                                   fp_not_on_hand=fp_not_on_hand)
+    scenes, search_name = select_scenes(search_id=search_id, resume=resume,
+                                        exclude_ids=exclude_ids,
+                                        dryrun=dryrun)
+    if len(scenes) == 0:
+        logger.warning('No scenes found. Exiting.')
+        sys.exit()
+    write_search_results(scenes, search_name=search_name,
+                         out_path=out_path, out_dir=out_dir,
+                         to_tbl=to_tbl, dryrun=dryrun)
+
+    if not dryrun:
+        # All pages have been persisted to their destinations
+        SearchCheckpoint(search_id).clear()
+
     return scenes
+
+
+def fetch_search_request(search_request, overwrite_saved=False, resume=True):
+    """Save a search request as a saved search and get all of its
+    features."""
+    name = search_request['name']
+    total_count = get_search_count(search_request)
+    logger.info('Count for search "{}": {:,}'.format(name, total_count))
+    if total_count == 0:
+        return gpd.GeoDataFrame(), None
+    ss_id = create_saved_search(search_request=search_request,
+                                overwrite_saved=overwrite_saved)
+    if not ss_id:
+        logger.error('Could not create saved search: {}'.format(name))
+        raise ConnectionError
+    footprints = get_features(saved_search_id=ss_id, total_count=total_count,
+                              resume=resume)
+
+    return footprints, ss_id
+
+
+def fetch_footprints_cached(sr, cache, overwrite_saved=False, resume=True):
+    """Get footprints for a search request, reusing results cached locally
+    for an identical search (same item types and filter). Cached results
+    younger than the cache's TTL are reused as-is. Older results for
+    searches bounded by a DateRangeFilter are updated by fetching only
+    items published or updated since they were cached, otherwise the
+    search is rerun in full.
+
+    Returns
+    -------
+    gpd.GeoDataFrame : footprints
+    """
+    name = sr['name']
+    cached = cache.get(sr)
+    # Recorded before searching so items published during the search are
+    # caught by the next delta
+    fetched = datetime.utcnow()
+    if cached is not None and cache.is_fresh(cached):
+        logger.info('Using cached results for search "{}", fetched {:.1f} '
+                    'hours ago: {:,} footprints'.format(name, cached.age,
+                                                        cached.count))
+        footprints = cached.footprints
+    elif cached is not None and contains_filter_type(sr['filter'], drf):
+        logger.info('Cached results for search "{}" are {:.1f} hours old, '
+                    'fetching items published or updated since '
+                    '{}'.format(name, cached.age, cached.fetched))
+        delta_sr = create_delta_request(sr, since=cached.fetched)
+        delta_sr['name'] = '{}_delta'.format(name)
+        delta, ss_id = fetch_search_request(delta_sr, overwrite_saved=True,
+                                            resume=resume)
+        logger.info('New or updated footprints: {:,}'.format(len(delta)))
+        footprints = merge_footprints(cached.footprints, delta)
+        cache.put(sr, footprints, fetched=fetched)
+        if ss_id:
+            SearchCheckpoint(ss_id).clear()
+    else:
+        footprints, ss_id = fetch_search_request(sr,
+                                                 overwrite_saved=overwrite_saved,
+                                                 resume=resume)
+        cache.put(sr, footprints, fetched=fetched)
+        if ss_id:
+            SearchCheckpoint(ss_id).clear()
+
+    return footprints
+
+
+def build_split_requests(name, item_types, aoi=None, tile_size=None,
+                         split_months=False, simplify_aoi=False,
+                         aoi_tolerance=None, **kwargs):
+    """Create separate search requests for each tile of the AOI (see
+    lib.aoi.tile_aoi) if tile_size is passed, and for each season (range
+    of contiguous months, see create_season_filters) if split_months.
+    See create_search for other parameters.
+
+    Returns
+    -------
+    list : search requests
+    """
+    if tile_size and aoi is not None:
+        if simplify_aoi:
+            aoi = prepare_aoi(aoi, tolerance=aoi_tolerance)
+        aois = tile_aoi(aoi, tile_size=tile_size)
+        names = ['{}_tile{:03d}'.format(name, i) for i in range(len(aois))]
+    else:
+        aois = [aoi]
+        names = [name]
+
+    season_filters = None
+    months = kwargs.get('months')
+    if split_months and months:
+        attrib_args = kwargs.get('attrib_args') or {}
+        season_filters = create_season_filters(
+            months,
+            min_date=attrib_args.get('min_date'),
+            max_date=attrib_args.get('max_date'),
+            month_min_days={m: d for m, d in
+                            kwargs.get('month_min_day_args') or []},
+            month_max_days={m: d for m, d in
+                            kwargs.get('month_max_day_args') or []})
+        logger.info('Searching {:,} seasons separately'.format(
+            len(season_filters)))
+        kwargs = dict(kwargs, months=None)
+
+    srs = []
+    for sub_name, sub_aoi in zip(names, aois):
+        sr = build_search_request(name=sub_name, item_types=item_types,
+                                  aoi=sub_aoi,
+                                  simplify_aoi=simplify_aoi and not tile_size,
+                                  aoi_tolerance=aoi_tolerance, **kwargs)
+        if not season_filters:
+            srs.append(sr)
+            continue
+        for i, season_filter in enumerate(season_filters):
+            season_sr = dict(sr)
+            season_sr['name'] = '{}_season{:02d}'.format(sub_name, i)
+            season_sr['filter'] = create_master_filter([sr['filter'],
+                                                        season_filter])
+            srs.append(season_sr)
+
+    return srs
+
+
+def fetch_parallel_cached(srs, cache, threads=4, overwrite_saved=False,
+                          resume=True):
+    """Get footprints for a number of search requests in parallel, each
+    using the cache (see fetch_footprints_cached), combining the results.
+
+    Returns
+    -------
+    gpd.GeoDataFrame : footprints, without duplicates
+    """
+    def _fetch(sr):
+        return fetch_footprints_cached(sr, cache,
+                                       overwrite_saved=overwrite_saved,
+                                       resume=resume)
+
+    pool = ThreadPool(threads)
+    results = pool.map(_fetch, srs)
+    pool.close()
+    pool.join()
+
+    results = [r for r in results if len(r) != 0]
+    if not results:
+        return gpd.GeoDataFrame()
+    footprints = pd.concat(results)
+    combined_count = len(footprints)
+    footprints = footprints.drop_duplicates(subset=[f_id, 'item_type'])
+    logger.info('Footprints from {:,} searches: {:,} ({:,} duplicates '
+                'removed)'.format(len(srs), len(footprints),
+                                  combined_count - len(footprints)))
+
+    return gpd.GeoDataFrame(footprints, geometry='geometry', crs='epsg:4326')
+
+
+def get_footprints_cached(name, item_types, out_path=None, out_dir=None,
+                          to_tbl=None, overwrite_saved=False,
+                          cache_ttl=None, resume=True, save_filter=None,
+                          tile_size=None, split_months=False, threads=4,
+                          dryrun=False, **kwargs):
+    """Get footprints for a search, reusing locally cached results (see
+    fetch_footprints_cached), and write them out. If tile_size is
+    passed, the AOI is split into tiles of that size in degrees, and if
+    split_months, each season is searched separately, with the searches
+    run in parallel (see build_split_requests). On hand IDs (see
+    not_on_hand and fp_not_on_hand) are removed after caching, so the
+    cache stays valid as scenes are added to the database. See
+    create_search for search parameters.
+
+    Returns
+    -------
+    gpd.GeoDataFrame : footprints
+    """
+    cache = SearchCache(ttl=cache_ttl)
+    if ((tile_size and kwargs.get('aoi') is not None) or
+            (split_months and kwargs.get('months'))):
+        srs = build_split_requests(name=name, item_types=item_types,
+                                   tile_size=tile_size,
+                                   split_months=split_months, **kwargs)
+        footprints = fetch_parallel_cached(srs, cache, threads=threads,
+                                           overwrite_saved=overwrite_saved,
+                                           resume=resume)
+    else:
+        sr = build_search_request(name=name, item_types=item_types, **kwargs)
+        if save_filter:
+            write_search_request(sr, save_filter)
+        footprints = fetch_footprints_cached(sr, cache,
+                                             overwrite_saved=overwrite_saved,
+                                             resume=resume)
+    logger.info('Total footprints: {:,}'.format(len(footprints)))
+
+    exclude_ids = load_exclude_ids(
+        not_on_hand=kwargs.get('not_on_hand', False),
+        fp_not_on_hand=kwargs.get('fp_not_on_hand', False))
+    if exclude_ids:
+        footprints = exclude_footprints(footprints, exclude_ids)
+
+    if len(footprints) == 0:
+        logger.warning('No scenes found.')
+        return footprints
+    write_search_results(footprints, search_name=name, out_path=out_path,
+                         out_dir=out_dir, to_tbl=to_tbl, dryrun=dryrun)
+
+    return footprints
@@ -0,0 +1,238 @@
+import datetime
+import gzip
+import hashlib
+import json
+import os
+from pathlib import Path
+
+from lib.checkpoint import write_json_atomic
+from lib.lazy import lazy_import
+from lib.lib import get_cache_dir, get_config
+from lib.logging_utils import create_logger
+
+# Imported on first use
+gpd = lazy_import('geopandas')
+pd = lazy_import('pandas')
+wkb = lazy_import('shapely.wkb')
+
+logger = create_logger(__name__, 'sh', 'INFO')
+
+# Subdirectory of cache directory holding cached search results
+search_cache_subdir = 'search_results'
+# Default time that cached results are reused for without checking for
+# new or updated items, overridden by 'search_cache_ttl' in the config
+# file, in hours
+default_ttl = 24
+
+# Keys in search requests / filters
+k_type = 'type'
+k_config = 'config'
+k_filter = 'filter'
+k_item_types = 'item_types'
+# Keys in cache entry metadata
+k_key = 'key'
+k_search_request = 'search_request'
+k_fetched = 'fetched'
+k_count = 'count'
+
+# Filters whose config is a list of subfilters
+logical_filters = ('AndFilter', 'OrFilter')
+# Filters whose config is a list of values
+list_filters = ('StringInFilter', 'NumberInFilter', 'AssetFilter')
+
+# Format for datetimes in filters
+filter_date_format = '%Y-%m-%dT%H:%M:%S.000Z'
+geom_col = 'geometry'
+unique_cols = ['id', 'item_type']
+
+
+def canonical_json(obj):
+    return json.dumps(obj, sort_keys=True, separators=(',', ':'))
+
+
+def normalize_filter(search_filter):
+    """Put a filter in a canonical form, ordering subfilters and values
+    that are unordered for the API, so that equivalent filters compare
+    (and hash) equal."""
+    search_filter = dict(search_filter)
+    ft = search_filter.get(k_type)
+    if ft in logical_filters:
+        subfilters = [normalize_filter(sf) for sf in search_filter[k_config]]
+        search_filter[k_config] = sorted(subfilters, key=canonical_json)
+    elif ft == 'NotFilter':
+        search_filter[k_config] = normalize_filter(search_filter[k_config])
+    elif ft in list_filters:
+        search_filter[k_config] = sorted(set(search_filter[k_config]),
+                                         key=str)
+
+    return search_filter
+
+
+def search_key(search_request):
+    """Hash of the parts of a search request that determine its results,
+    i.e. not including the name."""
+    key_parts = {k_item_types: sorted(search_request[k_item_types]),
+                 k_filter: normalize_filter(search_request[k_filter])}
+
+    return hashlib.sha256(canonical_json(key_parts).encode()).hexdigest()
+
+
+def contains_filter_type(search_filter, filter_type):
+    """Determine if filter_type is used anywhere in search_filter."""
+    if search_filter.get(k_type) == filter_type:
+        return True
+    subfilters = search_filter.get(k_config)
+    if isinstance(subfilters, dict):
+        subfilters = [subfilters]
+    if isinstance(subfilters, list):
+        return any([contains_filter_type(sf, filter_type)
+                    for sf in subfilters if isinstance(sf, dict)])
+    return False
+
+
+def create_delta_request(search_request, since):
+    """Restrict a search request to items published or updated since the
+    datetime passed."""
+    since_str = since.strftime(filter_date_format)
+    update_filter = {
+        k_type: 'OrFilter',
+        k_config: [{k_type: 'UpdateFilter',
+                    'field_name': field,
+                    k_config: {'gte': since_str}}
+                   for field in ('published', 'updated')]
+    }
+    delta_request = dict(search_request)
+    delta_request[k_filter] = {
+        k_type: 'AndFilter',
+        k_config: [search_request[k_filter], update_filter]
+    }
+
+    return delta_request
+
+
+def gdf2columns(gdf):
+    """Convert a GeoDataFrame to a dict of {column: [values]}, with
+    geometries as hex WKB."""
+    columns = {c: gdf[c].tolist() for c in gdf.columns if c != geom_col}
+    if geom_col in gdf.columns:
+        columns[geom_col] = [g.wkb_hex for g in gdf[geom_col]]
+    else:
+        # No results
+        columns[geom_col] = []
+
+    return columns
+
+
+def columns2gdf(columns):
+    geometry = [wkb.loads(g, hex=True) for g in columns.pop(geom_col)]
+
+    return gpd.GeoDataFrame(columns, geometry=geometry, crs='epsg:4326')
+
+
+class CachedSearch:
+    def __init__(self, metadata, data_path):
+        """A search's cached results. Footprints are only read from disk
+        when accessed."""
+        self.key = metadata[k_key]
+        self.search_request = metadata[k_search_request]
+        self.fetched = datetime.datetime.strptime(metadata[k_fetched],
+                                                  filter_date_format)
+        self.count = metadata[k_count]
+        self.data_path = data_path
+        self._footprints = None
+
+    @property
+    def age(self):
+        """Hours since results were fetched."""
+        return (datetime.datetime.utcnow() -
+                self.fetched).total_seconds() / 3600
+
+    @property
+    def footprints(self):
+        if self._footprints is None:
+            with gzip.open(self.data_path, 'rt') as src:
+                self._footprints = columns2gdf(json.load(src))
+        return self._footprints
+
+
+class SearchCache:
+    def __init__(self, cache_dir=None, ttl=None):
+        """
+        Local cache of search results, stored under a hash of the search
+        request's item types and normalized filter, in a gzipped columnar
+        json file per search.
+
+        Parameters
+        ----------
+        cache_dir : str, pathlib.Path
+            Alternative directory for cached results, if not passed, the
+            'search_results' subdirectory of the cache directory is used.
+        ttl : float
+            Hours that cached results are reused without checking for
+            new or updated items.
+        """
+        if cache_dir is None:
+            cache_dir = get_cache_dir(search_cache_subdir)
+        self.cache_dir = Path(cache_dir)
+        if ttl is None:
+            ttl = get_config('search_cache_ttl', default=default_ttl)
+        self.ttl = ttl
+
+    def _paths(self, key):
+        return (self.cache_dir / '{}.meta.json'.format(key),
+                self.cache_dir / '{}.json.gz'.format(key))
+
+    def get(self, search_request):
+        """Get the cached results for a search request, None if there are
+        none."""
+        key = search_key(search_request)
+        meta_path, data_path = self._paths(key)
+        if not (meta_path.exists() and data_path.exists()):
+            logger.debug('No cached results for search: {}'.format(key))
+            return None
+        with open(meta_path, 'r') as src:
+            metadata = json.load(src)
+
+        return CachedSearch(metadata, data_path)
+
+    def is_fresh(self, cached):
+        return cached.age < self.ttl
+
+    def put(self, search_request, footprints, fetched):
+        """Cache footprints for a search request.
+
+        Parameters
+        ----------
+        search_request : dict
+        footprints : gpd.GeoDataFrame
+        fetched : datetime.datetime
+            UTC time the search was started, any items published or
+            updated after this time may not be in footprints.
+        """
+        key = search_key(search_request)
+        meta_path, data_path = self._paths(key)
+        tmp_data_path = '{}.tmp'.format(data_path)
+        with gzip.open(tmp_data_path, 'wt') as dst:
+            json.dump(gdf2columns(footprints), dst)
+        os.replace(tmp_data_path, data_path)
+        metadata = {k_key: key,
+                    k_search_request: {k_item_types: search_request[k_item_types],
+                                       k_filter: search_request[k_filter]},
+                    k_fetched: fetched.strftime(filter_date_format),
+                    k_count: len(footprints)}
+        write_json_atomic(metadata, meta_path)
+        logger.debug('Cached {:,} footprints for search: '
+                     '{}'.format(len(footprints), key))
+
+
+def merge_footprints(cached, delta):
+    """Combine cached footprints with newly fetched ones, keeping the
+    newly fetched version of any item in both."""
+    if len(delta) == 0:
+        return cached
+    if len(cached) == 0:
+        return delta
+    merged = pd.concat([cached, delta])
+    merged = merged.drop_duplicates(subset=unique_cols, keep='last')
+
+    return gpd.GeoDataFrame(merged, geometry=geom_col, crs='epsg:4326')
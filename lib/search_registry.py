@@ -0,0 +1,178 @@
+import datetime
+import hashlib
+import json
+import os
+from pathlib import Path
+import threading
+
+from lib.checkpoint import write_json_atomic
+from lib.lib import get_cache_dir, get_config
+from lib.logging_utils import create_logger
+
+logger = create_logger(__name__, 'sh', 'INFO')
+
+# Default time that the local copy of the saved searches list is used
+# before being refreshed from the API, overridden by
+# 'search_registry_ttl' in the config file, in hours
+default_ttl = 1
+registry_file_template = 'saved_searches_{}.json'
+page_size = 250
+
+# Keys in API responses
+k_searches = 'searches'
+k_links = '_links'
+k_next = '_next'
+k_id = 'id'
+k_name = 'name'
+# Keys in registry file
+k_updated = 'updated'
+date_format = '%Y-%m-%dT%H:%M:%S'
+
+
+class SearchRegistry:
+    def __init__(self, session, search_url, cache_path=None, ttl=None):
+        """
+        Saved searches for the account, with lookup by ID and by name.
+        The list is read from the API (all pages) and cached locally,
+        and is only reread once older than ttl hours, or if refreshed.
+        Searches created and deleted through the registry update the
+        cached list, so it does not need to be reread.
+
+        Parameters
+        ----------
+        session : requests.Session
+            Session authorized with the Planet API key.
+        search_url : str
+            URL of the searches endpoint.
+        cache_path : str, pathlib.Path
+            Alternative path to cache the saved searches at, if not
+            passed, a file in the cache directory specific to the API key
+            is used.
+        ttl : float
+            Hours that the cached list is used before rereading.
+        """
+        self.session = session
+        self.search_url = search_url
+        if cache_path is None:
+            # Separate file for each account
+            api_key = session.auth[0] if session.auth else ''
+            key_hash = hashlib.sha256(str(api_key).encode()).hexdigest()[:12]
+            cache_path = get_cache_dir() / registry_file_template.format(
+                key_hash)
+        self.cache_path = Path(cache_path)
+        if ttl is None:
+            ttl = get_config('search_registry_ttl', default=default_ttl)
+        self.ttl = ttl
+
+        self._searches = None
+        self._by_name = None
+        self.updated = None
+        # Searches may be added / removed from multiple threads
+        self._lock = threading.Lock()
+
+    @property
+    def age(self):
+        """Hours since list of saved searches was read from the API."""
+        if self.updated is None:
+            return None
+        return (datetime.datetime.now() -
+                self.updated).total_seconds() / 3600
+
+    @property
+    def searches(self):
+        """Dict of {search ID: search} for all saved searches."""
+        if self._searches is None:
+            self._load()
+        return self._searches
+
+    def _index(self):
+        self._by_name = dict()
+        for search_id, search in self._searches.items():
+            self._by_name.setdefault(search[k_name], []).append(search_id)
+
+    def _load(self):
+        if self.cache_path.exists():
+            with open(self.cache_path, 'r') as src:
+                data = json.load(src)
+            self.updated = datetime.datetime.strptime(data[k_updated],
+                                                      date_format)
+            if self.age < self.ttl:
+                logger.debug('Using saved searches cached {:.2f} hours '
+                             'ago'.format(self.age))
+                self._searches = data[k_searches]
+                self._index()
+                return
+        self.refresh()
+
+    def _save(self):
+        data = {k_updated: self.updated.strftime(date_format),
+                k_searches: self._searches}
+        write_json_atomic(data, self.cache_path)
+
+    def refresh(self):
+        """Read all pages of saved searches from the API."""
+        logger.debug('Getting saved searches...')
+        searches = dict()
+        next_url = self.search_url
+        params = {'search_type': 'saved', '_page_size': page_size}
+        while next_url:
+            res = self.session.get(next_url, params=params)
+            if res.status_code != 200:
+                logger.error('Error getting saved searches: {} '
+                             '{}'.format(res.status_code, res.reason))
+                raise ConnectionError(res.reason)
+            page = res.json()
+            for se in page[k_searches]:
+                searches[se[k_id]] = se
+            next_url = page.get(k_links, {}).get(k_next)
+            # Next page link includes parameters
+            params = None
+        logger.debug('Saved searches found: {:,}'.format(len(searches)))
+
+        self._searches = searches
+        self.updated = datetime.datetime.now()
+        self._index()
+        self._save()
+
+    def invalidate(self):
+        """Remove the cached list, so the next lookup rereads it."""
+        if self.cache_path.exists():
+            os.remove(self.cache_path)
+        self._searches = None
+        self._by_name = None
+        self.updated = None
+
+    def __len__(self):
+        return len(self.searches)
+
+    def __contains__(self, search_id):
+        return search_id in self.searches
+
+    def get(self, search_id):
+        """Get a saved search by ID, None if it does not exist."""
+        return self.searches.get(search_id)
+
+    def ids_for_name(self, name):
+        """Get the IDs of all saved searches with name."""
+        if self._by_name is None:
+            self._load()
+        return list(self._by_name.get(name, []))
+
+    def add(self, search):
+        """Record a newly created saved search."""
+        searches = self.searches
+        with self._lock:
+            searches[search[k_id]] = search
+            self._by_name.setdefault(search[k_name], []).append(search[k_id])
+            self._save()
+
+    def remove(self, search_id):
+        """Record that a saved search has been deleted."""
+        searches = self.searches
+        with self._lock:
+            search = searches.pop(search_id, None)
+            if search is not None:
+                self._by_name[search[k_name]].remove(search_id)
+                if not self._by_name[search[k_name]]:
+                    del self._by_name[search[k_name]]
+                self._save()
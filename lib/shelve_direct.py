@@ -0,0 +1,248 @@
+import json
+import os
+from pathlib import Path
+import shutil
+
+from lib.archive import ArchiveExtractor, is_archive, is_within
+from lib.db import Postgres
+from lib.digests import file_digests, k_md5
+from lib.dir_index import DirectoryIndex
+from lib.lazy import lazy_import
+from lib.lib import PlanetScene, create_scene_manifests, get_cache_dir, \
+    get_checksum_cache, get_config, k_files
+from lib.logging_utils import create_logger
+from lib.onhand import scenes_onhand
+from lib.s3_inventory import get_inventory, master_manifest
+from lib.order_tools import excluded_paths
+from lib.transfer import S3Downloader
+
+# Imported on first use
+gpd = lazy_import('geopandas')
+
+logger = create_logger(__name__, 'sh', 'INFO')
+
+# Subdirectory of cache directory metadata files of orders are staged in
+staging_subdir = 'shelve_staging'
+# Files of an order downloaded to the staging directory, to locate and
+# parse scenes, everything else is streamed to its shelved location
+staged_suffixes = ('.json', '.xml')
+
+
+def stage_metadata(objects, staging_dir, downloader):
+    """Download the metadata files (JSON, XML) of an order to staging_dir.
+
+    Parameters
+    ----------
+    objects : dict
+        {path relative to order: boto3 s3.ObjectSummary or
+         lib.archive.ArchiveMember}
+    staging_dir : pathlib.Path
+    downloader : S3Downloader or lib.archive.ArchiveExtractor
+
+    Returns
+    -------
+    bool : True if all were downloaded
+    """
+    futures = []
+    for rel_path, bo in objects.items():
+        if Path(rel_path).suffix not in staged_suffixes:
+            continue
+        dst_path = staging_dir / rel_path
+        if not is_within(staging_dir, dst_path):
+            logger.error('Destination outside of staging directory, '
+                         'skipping: {}'.format(bo.key))
+            return False
+        dst_path.parent.mkdir(parents=True, exist_ok=True)
+        if downloader.is_current(bo.key, dst_path, bo.size, bo.e_tag):
+            continue
+        futures.append(downloader.submit(bo.key, dst_path, size=bo.size,
+                                         etag=bo.e_tag))
+
+    return all([f.result() for f in futures])
+
+
+def scene_objects(ps, rel_dir, objects):
+    """Get the relative paths of the files of a scene in an order: those
+    in the scene's directory starting with its name, as located on disk
+    by PlanetScene.meta_files, plus its metadata JSON."""
+    metadata_json = '{}/{}'.format(rel_dir, ps.metadata_json.name)
+    return [p for p in objects
+            if (Path(p).parent.as_posix() == rel_dir and
+                Path(p).name.startswith(ps.scene_name)) or
+            p == metadata_json]
+
+
+def shelve_order_direct(oid, bucket, key_prefix, shelved_parent=None,
+                        downloader=None, onhand=None, verify_checksums=True,
+                        index=True, dryrun=False):
+    """
+    Shelve an order straight from S3, without downloading it to a
+    staging directory and copying it again to the shelf. The order's
+    metadata (source.json, XML and metadata JSON) is downloaded to the
+    cache directory and parsed into PlanetScenes, giving the shelved
+    directory of each scene, then each scene's files are streamed from
+    S3 to their shelved locations. Scene files are hashed as they are
+    written and checked against the md5 in the manifest, and scenes
+    shelved are indexed in scenes_onhand. Orders delivered as a single
+    zip archive are shelved by extracting members of the archive, see
+    lib.archive.ArchiveExtractor.
+
+    Parameters
+    ----------
+    oid : str
+        Order ID.
+    bucket : boto3 s3.Bucket
+    key_prefix : str
+        Prefix of orders in the bucket, e.g. 'jeff/planet'.
+    shelved_parent : pathlib.Path
+        Parent of shelved directories, defaults to 'shelved_loc' in the
+        config file.
+    downloader : S3Downloader
+        Downloader shared between orders, one is created if not passed.
+    onhand : lib.onhand.IDSet
+        IDs of scenes on hand, which are skipped.
+    verify_checksums : bool
+        Remove scene files whose md5 does not match the manifest, rather
+        than indexing them.
+    index : bool
+        Add scenes shelved to scenes_onhand.
+    dryrun : bool
+        Stage metadata and locate scenes only.
+
+    Returns
+    -------
+    bool : True if all shelveable scenes were shelved
+    """
+    oid = str(oid)
+    if shelved_parent is None:
+        shelved_parent = Path(get_config('shelved_loc'))
+    own_downloader = downloader is None
+    if own_downloader:
+        # Digests only recorded in the download ledger, not written
+        # next to shelved files
+        downloader = S3Downloader(bucket, hash_digests=True, sidecars=False)
+    if not downloader.hash_digests:
+        logger.warning('Downloader is not hashing files, checksums will be '
+                       'verified by reading shelved files.')
+
+    inventory = get_inventory(bucket, key_prefix)
+    order_prefix = inventory.order_prefix(oid)
+    objects = {bo.key[len(order_prefix):]: bo
+               for bo in inventory.order_objects(oid)}
+    # Files are fetched by the downloader, or extracted from the archive
+    source = downloader
+    archives = [bo for bo in objects.values() if is_archive(bo.key)]
+    if len(archives) > 1:
+        logger.error('Order delivered as multiple archives, download it '
+                     'to shelve: {}'.format(oid))
+        return False
+    elif archives:
+        bo = archives[0]
+        source = ArchiveExtractor(downloader, bo.key, bo.size, bo.e_tag)
+        objects = source.members()
+    if master_manifest not in objects:
+        logger.error('Manifest ({}) not found for order: {}'.format(
+            master_manifest, oid))
+        return False
+
+    logger.info('Staging metadata for order: {}'.format(oid))
+    staging_dir = get_cache_dir(staging_subdir, oid)
+    if not stage_metadata(objects, staging_dir, source):
+        logger.error('Error staging metadata for order: {}'.format(oid))
+        return False
+    # Files of asset types excluded in the config file are not shelved
+    with open(staging_dir / master_manifest, 'r') as src:
+        excluded = excluded_paths(json.load(src)[k_files])
+    for rel_path in excluded & set(objects):
+        downloader.stats.add_excluded(objects.pop(rel_path).size)
+    scene_manifests = create_scene_manifests(staging_dir / master_manifest,
+                                             overwrite=True)
+    dir_index = DirectoryIndex(staging_dir)
+    scenes = [PlanetScene(sm, shelved_parent=shelved_parent,
+                          scene_remote=True, dir_index=dir_index)
+              for sm in scene_manifests]
+    logger.info('Scenes in order: {:,}'.format(len(scenes)))
+
+    # Locate the files of each scene and queue those not already shelved
+    to_shelve = []
+    unshelveable_count = 0
+    onhand_count = 0
+    for ps in scenes:
+        if onhand is not None and ps.item_id in onhand:
+            onhand_count += 1
+            continue
+        if not ps.shelveable:
+            logger.warning('UNSHELVEABLE: {}'.format(ps.scene_path.name))
+            unshelveable_count += 1
+            continue
+        rel_dir = ps.scene_path.parent.relative_to(staging_dir).as_posix()
+        if '{}/{}'.format(rel_dir, ps.scene_path.name) in excluded:
+            logger.warning('Scene file of excluded asset type, not '
+                           'shelving: {}'.format(ps.scene_path.name))
+            unshelveable_count += 1
+            continue
+        futures = []
+        for rel_path in scene_objects(ps, rel_dir, objects):
+            bo = objects[rel_path]
+            dst_path = ps.shelved_dir / Path(rel_path).name
+            if dryrun:
+                continue
+            dst_path.parent.mkdir(parents=True, exist_ok=True)
+            staged = staging_dir / rel_path
+            if staged.exists():
+                # Small metadata file, already downloaded
+                if not dst_path.exists():
+                    shutil.copy2(staged, dst_path)
+                continue
+            if source.is_current(bo.key, dst_path, bo.size, bo.e_tag):
+                downloader.stats.add_file(skipped=True)
+                continue
+            futures.append(source.submit(bo.key, dst_path, size=bo.size,
+                                         etag=bo.e_tag))
+        to_shelve.append((ps, futures))
+    logger.info('Scenes to shelve: {:,} - on hand: {:,} - unshelveable: '
+                '{:,}'.format(len(to_shelve), onhand_count,
+                              unshelveable_count))
+    if dryrun:
+        return True
+
+    # Wait for each scene's files, then check the scene file's md5
+    shelved = []
+    error_count = 0
+    bad_checksum_count = 0
+    for ps, futures in to_shelve:
+        if not all([f.result() for f in futures]):
+            error_count += 1
+            continue
+        if verify_checksums:
+            # Hashed as it was streamed, otherwise read the file
+            entry = downloader.ledger.get(ps.shelved_location)
+            if entry and entry['md5']:
+                md5 = entry['md5']
+            else:
+                md5 = file_digests(ps.shelved_location,
+                                   cache=get_checksum_cache())[k_md5]
+            if md5 != ps.md5:
+                logger.warning('Invalid checksum, removing: '
+                               '{}'.format(ps.shelved_location))
+                os.remove(ps.shelved_location)
+                downloader.ledger.remove(ps.shelved_location)
+                bad_checksum_count += 1
+                continue
+        shelved.append(ps)
+    if own_downloader:
+        downloader.shutdown()
+        downloader.stats.report()
+    logger.info('Scenes shelved: {:,} - errors: {:,} - bad checksums: '
+                '{:,}'.format(len(shelved), error_count, bad_checksum_count))
+
+    if index and shelved:
+        logger.info('Indexing shelved scenes: {:,}'.format(len(shelved)))
+        gdf = gpd.GeoDataFrame([ps.index_row for ps in shelved],
+                               geometry='geometry', crs='epsg:4326')
+        with Postgres() as db:
+            db.insert_new_records(gdf, table=scenes_onhand)
+
+    shutil.rmtree(staging_dir, ignore_errors=True)
+
+    return error_count == 0 and bad_checksum_count == 0
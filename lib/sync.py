@@ -0,0 +1,183 @@
+import datetime
+import hashlib
+import json
+from pathlib import Path
+
+from lib.checkpoint import SearchCheckpoint, write_json_atomic
+from lib.db import Postgres
+from lib.lib import get_cache_dir
+from lib.logging_utils import create_logger
+from lib.search import build_search_request, fetch_search_request
+from lib.search_cache import search_key
+
+logger = create_logger(__name__, 'sh', 'INFO')
+
+# Subdirectory of cache directory holding the state of each sync
+sync_subdir = 'sync_state'
+# Fields that high-water marks are kept for
+fld_published = 'published'
+fld_updated = 'updated'
+hwm_fields = (fld_published, fld_updated)
+fld_id = 'id'
+
+# Keys in state file
+k_name = 'name'
+k_item_types = 'item_types'
+k_hwm = 'high_water_marks'
+k_last_sync = 'last_sync'
+k_last_new = 'last_new'
+
+
+def sync_key(name, search_request):
+    """Hash identifying a sync by its name and search request, i.e. its
+    item types, AOI and filters (see lib.search_cache.search_key), so
+    that syncs with different filters keep separate high-water marks."""
+    key = hashlib.sha256(name.encode())
+    key.update(search_key(search_request).encode())
+
+    return key.hexdigest()[:16]
+
+
+class SyncState:
+    def __init__(self, name, search_request, state_dir=None):
+        """
+        High-water marks of the 'published' and 'updated' values of the
+        footprints ingested for a sync's search, so that each sync only
+        requests items newer than the last.
+
+        Parameters
+        ----------
+        name : str
+            Name of sync, used for the saved search name.
+        search_request : dict
+            Search request of the sync, without the filter on high-water
+            marks, see lib.search.build_search_request.
+        state_dir : str, pathlib.Path
+            Alternative directory for state files, if not passed, the
+            'sync_state' subdirectory of the cache directory is used.
+        """
+        self.name = name
+        self.item_types = search_request['item_types']
+        if state_dir is None:
+            state_dir = get_cache_dir(sync_subdir)
+        self.key = sync_key(name, search_request)
+        self.path = Path(state_dir) / '{}.json'.format(self.key)
+
+        self.high_water_marks = {f: None for f in hwm_fields}
+        self.last_sync = None
+        if self.path.exists():
+            with open(self.path, 'r') as src:
+                data = json.load(src)
+            self.high_water_marks = data[k_hwm]
+            self.last_sync = data[k_last_sync]
+
+    def update(self, footprints):
+        """Advance the high-water marks to the latest values in
+        footprints."""
+        for fld in hwm_fields:
+            if len(footprints) == 0 or fld not in footprints.columns:
+                continue
+            latest = footprints[fld].dropna().max()
+            current = self.high_water_marks[fld]
+            # Timestamps from the API sort lexicographically
+            if latest and (current is None or latest > current):
+                self.high_water_marks[fld] = latest
+
+    def save(self, new_count=None):
+        self.last_sync = datetime.datetime.utcnow().strftime(
+            '%Y-%m-%dT%H:%M:%SZ')
+        data = {k_name: self.name,
+                k_item_types: self.item_types,
+                k_hwm: self.high_water_marks,
+                k_last_sync: self.last_sync,
+                k_last_new: new_count}
+        write_json_atomic(data, self.path)
+
+
+def create_sync_filter(high_water_marks):
+    """Filter for items published or updated at or after the high-water
+    marks, None if no marks have been set."""
+    subfilters = [{'type': 'UpdateFilter',
+                   'field_name': fld,
+                   'config': {'gte': hwm}}
+                  for fld, hwm in high_water_marks.items() if hwm]
+    if not subfilters:
+        return None
+    if len(subfilters) == 1:
+        return subfilters[0]
+
+    return {'type': 'OrFilter', 'config': subfilters}
+
+
+def write_new_ids(new_ids, new_ids_path):
+    """Append newly added IDs to a text file, one per line."""
+    with open(new_ids_path, 'a') as dst:
+        for scene_id in new_ids:
+            dst.write('{}\n'.format(scene_id))
+    logger.info('New IDs written to: {}'.format(new_ids_path))
+
+
+def sync_scenes(name, item_types, aoi=None, to_tbl='scenes',
+                new_ids_path=None, dryrun=False, **kwargs):
+    """
+    Get footprints published or updated since the last sync for an AOI
+    and item types, and upsert them into to_tbl. On the first sync
+    (no state), all footprints matching the search parameters are
+    retrieved, so a min_date attribute argument should usually be
+    passed. See lib.search.create_search for search parameters.
+
+    Parameters
+    ----------
+    name : str
+        Name of sync, used for the saved search name.
+    item_types : list
+    aoi : str, gpd.GeoDataFrame
+        Path to vector file or GeoDataFrame of AOI.
+    to_tbl : str
+        Table to upsert footprints into.
+    new_ids_path : str
+        Text file to append IDs newly added to to_tbl to.
+    dryrun : bool
+        Get footprints but do not write to table or advance state.
+
+    Returns
+    -------
+    list : IDs newly added to to_tbl
+    """
+    sr = build_search_request(name='{}_sync'.format(name),
+                              item_types=item_types, aoi=aoi, **kwargs)
+    state = SyncState(name=name, search_request=sr)
+    sync_filter = create_sync_filter(state.high_water_marks)
+    if sync_filter:
+        logger.info('Getting items published or updated since: '
+                    '{}'.format(state.high_water_marks))
+        sr['filter'] = {'type': 'AndFilter',
+                        'config': [sr['filter'], sync_filter]}
+    else:
+        logger.info('No previous sync found, getting all items matching '
+                    'search.')
+
+    footprints, ss_id = fetch_search_request(sr, overwrite_saved=True)
+    logger.info('Footprints new or updated since last sync: '
+                '{:,}'.format(len(footprints)))
+
+    new_ids = []
+    if len(footprints) != 0:
+        with Postgres() as db:
+            new_keys = db.upsert_records(footprints, table=to_tbl,
+                                         dryrun=dryrun)
+        new_ids = [k[0] if isinstance(k, tuple) else k for k in new_keys]
+        logger.info('IDs newly added to {}: {:,}'.format(to_tbl,
+                                                         len(new_ids)))
+    if dryrun:
+        return new_ids
+
+    if new_ids and new_ids_path:
+        write_new_ids(new_ids, new_ids_path)
+    # Only advance once footprints are in the table
+    state.update(footprints)
+    state.save(new_count=len(new_ids))
+    if ss_id:
+        SearchCheckpoint(ss_id).clear()
+
+    return new_ids
@@ -0,0 +1,311 @@
+from concurrent.futures import ThreadPoolExecutor
+import os
+from pathlib import Path
+import threading
+import time
+
+from retrying import retry
+
+from lib.digests import StreamHasher, file_digests, k_md5, write_digests
+from lib.download_ledger import DownloadLedger, etag_md5, partial
+from lib.lazy import lazy_import
+from lib.lib import get_config
+from lib.logging_utils import create_logger
+from lib.transport import RateLimiter
+
+# Imported on first use
+boto3 = lazy_import('boto3')
+lazy_import('boto3.s3.transfer')
+
+logger = create_logger(__name__, 'sh', 'INFO')
+
+MB = 1024 ** 2
+# Defaults, overridden by the 'transfer' section of the config file
+# Objects downloaded at once, across all orders
+default_max_workers = 16
+# Max total download rate in MB/s, None for no limit
+default_max_bandwidth = None
+# Objects larger than this are downloaded in parts, in parallel
+default_multipart_threshold = 64 * MB
+default_multipart_chunksize = 16 * MB
+# Threads downloading parts of a single object
+default_part_concurrency = 4
+# Compute digests of each object as it is downloaded, recording them
+# next to the file. Objects are then streamed in order, rather than
+# downloaded in parts
+default_hash_digests = True
+# Bytes read from the stream of an object at a time
+stream_chunk_size = 1 * MB
+# Objects are streamed to <file><part_suffix>, renamed once complete
+part_suffix = '.part'
+
+k_transfer = 'transfer'
+
+
+def get_transfer_config(param, default):
+    return get_config(k_transfer, default={}).get(param, default)
+
+
+def part_path(path):
+    return Path('{}{}'.format(path, part_suffix))
+
+
+class TransferStats:
+    def __init__(self):
+        """Thread-safe totals of files and bytes transferred."""
+        self.lock = threading.Lock()
+        self.start = time.time()
+        self.files = 0
+        self.bytes = 0
+        self.skipped = 0
+        self.errors = 0
+        # Files not downloaded as their scenes are on hand
+        self.onhand = 0
+        self.onhand_bytes = 0
+        # Files not downloaded as their asset types are excluded
+        self.excluded = 0
+        self.excluded_bytes = 0
+
+    def add_bytes(self, n):
+        with self.lock:
+            self.bytes += n
+
+    def add_file(self, skipped=False, error=False):
+        with self.lock:
+            if error:
+                self.errors += 1
+            elif skipped:
+                self.skipped += 1
+            else:
+                self.files += 1
+
+    def add_onhand(self, size):
+        with self.lock:
+            self.onhand += 1
+            self.onhand_bytes += size
+
+    def add_excluded(self, size):
+        with self.lock:
+            self.excluded += 1
+            self.excluded_bytes += size
+
+    @property
+    def elapsed(self):
+        return time.time() - self.start
+
+    @property
+    def throughput(self):
+        """MB/s since stats were started."""
+        return self.bytes / MB / max(self.elapsed, 1e-6)
+
+    def report(self):
+        logger.info('Transferred {:,} files, {:,.1f} MB in {:,.1f}s: '
+                    '{:,.2f} MB/s, {:.1f} files/s ({:,} skipped, {:,} '
+                    'errors)'.format(self.files, self.bytes / MB,
+                                     self.elapsed, self.throughput,
+                                     self.files / max(self.elapsed, 1e-6),
+                                     self.skipped, self.errors))
+        if self.onhand:
+            logger.info('Not downloaded as on hand: {:,} files, {:,.1f} '
+                        'MB'.format(self.onhand, self.onhand_bytes / MB))
+        if self.excluded:
+            logger.info('Not downloaded as excluded assets: {:,} files, '
+                        '{:,.1f} MB'.format(self.excluded,
+                                            self.excluded_bytes / MB))
+
+
+class S3Downloader:
+    def __init__(self, bucket, max_workers=None, max_bandwidth=None,
+                 hash_digests=None, ledger=None, sidecars=True):
+        """
+        Downloads S3 objects using a bounded pool of workers, which can be
+        shared by any number of orders, so the number of objects in
+        flight is capped across all of them. Large objects are downloaded
+        in parts in parallel (boto3 TransferConfig) and the total rate
+        can be limited. By default md5 and sha256 digests of each object
+        are computed as it is streamed to disk and recorded next to the
+        file (see lib.digests), so that the file does not need to be read
+        again to verify it.
+
+        Streamed objects are written to a .part file, renamed once
+        complete, and an interrupted download is resumed from the end of
+        its .part file with a ranged request, provided the object is
+        unchanged (same ETag). Completed downloads are recorded in a
+        DownloadLedger, see is_current().
+
+        Parameters
+        ----------
+        bucket : boto3 s3.Bucket
+        max_workers : int
+            Max objects downloaded at once.
+        max_bandwidth : float
+            Max total download rate in MB/s, None for no limit.
+        hash_digests : bool
+            Compute and record digests while downloading.
+        ledger : DownloadLedger
+            Record of downloads, defaults to the one in the cache
+            directory.
+        sidecars : bool
+            Write the digests computed to a file next to each file
+            downloaded, otherwise they are only recorded in the ledger.
+        """
+        if max_workers is None:
+            max_workers = get_transfer_config('max_workers',
+                                              default_max_workers)
+        if max_bandwidth is None:
+            max_bandwidth = get_transfer_config('max_bandwidth',
+                                                default_max_bandwidth)
+        if hash_digests is None:
+            hash_digests = get_transfer_config('hash_digests',
+                                               default_hash_digests)
+        self.bucket = bucket
+        self.hash_digests = hash_digests
+        self.ledger = ledger or DownloadLedger()
+        self.sidecars = sidecars
+        # Client is thread-safe, unlike the Bucket resource
+        self.client = bucket.meta.client
+        self.max_workers = max_workers
+        self.executor = ThreadPoolExecutor(max_workers=max_workers)
+        self.transfer_config = boto3.s3.transfer.TransferConfig(
+            multipart_threshold=get_transfer_config(
+                'multipart_threshold', default_multipart_threshold),
+            multipart_chunksize=get_transfer_config(
+                'multipart_chunksize', default_multipart_chunksize),
+            max_concurrency=get_transfer_config(
+                'part_concurrency', default_part_concurrency),
+            use_threads=True)
+        self.limiter = None
+        if max_bandwidth:
+            # Allow a second's worth of data at once
+            self.limiter = RateLimiter(max_bandwidth * MB,
+                                       burst=max_bandwidth * MB)
+        self.stats = TransferStats()
+
+    def _progress(self, n):
+        # Called by boto3 as each chunk is written, sleeping here slows
+        # the thread writing the chunk
+        self.stats.add_bytes(n)
+        if self.limiter:
+            self.limiter.acquire(n)
+
+    def is_current(self, key, dst_path, size, etag, md5=None):
+        """
+        Check whether dst_path is a complete download of an object, so
+        it can be skipped: the file must have the object's size and
+        either be recorded in the ledger as downloaded from an object
+        with the same ETag and be unmodified since, or, if not recorded
+        (e.g. downloaded before the ledger was kept), have the object's
+        md5, which is then recorded.
+
+        Parameters
+        ----------
+        key : str
+        dst_path : pathlib.Path
+        size : int
+            Size of object in bytes.
+        etag : str
+            ETag of object.
+        md5 : str
+            md5 of object, e.g. from the order manifest, used when the
+            ETag is not an md5 (objects uploaded in parts).
+
+        Returns
+        -------
+        bool
+        """
+        try:
+            if os.path.getsize(dst_path) != size:
+                return False
+        except FileNotFoundError:
+            return False
+        if self.ledger.is_complete(dst_path, size, etag):
+            return True
+        expected_md5 = etag_md5(etag) or md5
+        if not expected_md5:
+            return False
+        if file_digests(dst_path)[k_md5] != expected_md5:
+            return False
+        self.ledger.record(dst_path, key, size, etag, md5=expected_md5)
+
+        return True
+
+    @retry(stop_max_attempt_number=3, wait_fixed=2000)
+    def _stream(self, key, dst_path, size=None, etag=None):
+        """Stream object to a .part file, resuming a previous partial
+        download of the same object, hashing it as it is written if
+        hash_digests. Once complete the file is renamed to dst_path and
+        its digests recorded."""
+        tmp_path = part_path(dst_path)
+        hasher = StreamHasher() if self.hash_digests else None
+        offset = 0
+        if (etag and tmp_path.exists() and
+                self.ledger.partial_etag(dst_path) == etag):
+            offset = tmp_path.stat().st_size
+            if size is not None and offset > size:
+                offset = 0
+        if offset:
+            logger.debug('Resuming download at {:,} bytes: {}'.format(
+                offset, key))
+            if hasher:
+                # Hash what was already written, the rest is hashed as it
+                # is received
+                with open(tmp_path, 'rb') as src:
+                    for chunk in iter(lambda: src.read(stream_chunk_size),
+                                      b''):
+                        hasher.update(chunk)
+        else:
+            self.ledger.record(dst_path, key, size, etag, state=partial)
+
+        if size is None or offset < size:
+            kwargs = {}
+            if offset:
+                kwargs['Range'] = 'bytes={}-'.format(offset)
+            if etag:
+                # Fail rather than mix parts of different versions
+                kwargs['IfMatch'] = etag
+            body = self.client.get_object(Bucket=self.bucket.name, Key=key,
+                                          **kwargs)['Body']
+            with open(tmp_path, 'ab' if offset else 'wb') as dst:
+                for chunk in body.iter_chunks(chunk_size=stream_chunk_size):
+                    dst.write(chunk)
+                    if hasher:
+                        hasher.update(chunk)
+                    self._progress(len(chunk))
+        os.replace(tmp_path, dst_path)
+        md5 = etag_md5(etag)
+        if hasher:
+            digests = hasher.hexdigests()
+            if self.sidecars:
+                write_digests(dst_path, digests)
+            md5 = digests[k_md5]
+        self.ledger.record(dst_path, key, size, etag, md5=md5)
+
+    def _download(self, key, dst_path, size=None, etag=None):
+        try:
+            if self.hash_digests or part_path(dst_path).exists():
+                self._stream(key, dst_path, size=size, etag=etag)
+            else:
+                # Downloads to a temporary file, renamed when complete
+                self.client.download_file(self.bucket.name, key,
+                                          str(dst_path),
+                                          Config=self.transfer_config,
+                                          Callback=self._progress)
+                self.ledger.record(dst_path, key, size, etag,
+                                   md5=etag_md5(etag))
+        except Exception as e:
+            logger.error('Error downloading: {}'.format(key))
+            logger.error(e)
+            self.stats.add_file(error=True)
+            return False
+        self.stats.add_file()
+        return True
+
+    def submit(self, key, dst_path, size=None, etag=None):
+        """Queue an object for download, returning a Future whose result
+        is True if downloaded successfully. The object's size and ETag,
+        e.g. from listing the bucket, allow resuming."""
+        return self.executor.submit(self._download, key, dst_path, size,
+                                    etag)
+
+    def shutdown(self):
+        self.executor.shutdown(wait=True)
@@ -0,0 +1,318 @@
+import os
+import re
+import threading
+import time
+from urllib.parse import urlparse
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from lib.lib import get_config
+from lib.logging_utils import create_logger
+
+logger = create_logger(__name__, 'sh', 'INFO')
+
+# API URLs - base URL can be overridden, e.g. to point to a local
+# stand-in for the API (benchmarks/mock_planet_server.py)
+PLANET_BASE_URL = os.getenv('PL_API_URL', 'https://api.planet.com')
+ORDERS_URL = '{}/compute/ops/orders/v2'.format(PLANET_BASE_URL)
+ORDERS_STATS_URL = '{}/compute/ops/stats/orders/v2'.format(PLANET_BASE_URL)
+# Default max requests per second to the Planet API from this process,
+# overridden by 'api_rate_limit' in the config file
+default_rate = 5
+# Connections kept open per host, should be at least the number of
+# threads making requests
+default_pool_size = 16
+# Seconds to wait for a connection and for each read of the response,
+# unless a timeout is passed with the request
+default_timeout = (10, 120)
+# Responses retried, waiting retry_wait seconds, doubled each time, or
+# as long as the Retry-After header asks. Requests that may have been
+# acted on (e.g. placing an order) are only retried for 429 Too Many
+# Requests and failures to connect
+retry_statuses = (429, 500, 502, 503, 504)
+idempotent_methods = ('GET', 'HEAD', 'OPTIONS', 'PUT', 'DELETE')
+max_retries = 5
+retry_wait = 1
+# Retries of errors (other than 429s) are limited to this fraction of
+# requests made, with a reserve of retry_budget_min, so an outage does
+# not multiply the load on the API
+retry_budget_ratio = 0.2
+retry_budget_min = 10
+# Consecutive failures (errors connecting or 5xx responses) after which
+# requests fail immediately, until breaker_reset seconds have passed
+breaker_threshold = 5
+breaker_reset = 30
+# Latency samples kept per endpoint
+max_latency_samples = 1000
+# Path segments replaced with {id} to group URLs by endpoint
+id_pattern = re.compile(r'^[0-9a-fA-F-]{16,}$')
+
+
+class RateLimiter:
+    def __init__(self, rate, burst=None):
+        """
+        Token bucket limiting the rate of calls to acquire() across all
+        threads, e.g. requests per second, or bytes per second if each
+        call acquires the bytes about to be transferred.
+
+        Parameters
+        ----------
+        rate : float
+            Tokens per second allowed on average.
+        burst : int
+            Tokens allowed at once before being limited, defaults to rate.
+        """
+        self.rate = rate
+        self.capacity = burst if burst else max(rate, 1)
+        self.tokens = self.capacity
+        self.last = time.monotonic()
+        self.lock = threading.Lock()
+
+    def acquire(self, amount=1):
+        """Block until amount tokens are available. Tokens are reserved
+        immediately, so callers are served in order and amounts larger
+        than the burst size are allowed."""
+        with self.lock:
+            now = time.monotonic()
+            self.tokens = min(self.capacity,
+                              self.tokens + (now - self.last) * self.rate)
+            self.last = now
+            self.tokens -= amount
+            wait = -self.tokens / self.rate if self.tokens < 0 else 0
+        if wait:
+            time.sleep(wait)
+
+
+class RetryBudget:
+    def __init__(self, ratio=retry_budget_ratio, minimum=retry_budget_min):
+        """Retries allowed, earned at ratio per request made, starting
+        from and capped at minimum plus what is earned by 1,000
+        requests."""
+        self.ratio = ratio
+        self.capacity = minimum + ratio * 1000
+        self.balance = minimum
+        self.lock = threading.Lock()
+
+    def deposit(self):
+        with self.lock:
+            self.balance = min(self.capacity, self.balance + self.ratio)
+
+    def withdraw(self):
+        """Take one retry from the budget, False if none are left."""
+        with self.lock:
+            if self.balance < 1:
+                return False
+            self.balance -= 1
+            return True
+
+
+class CircuitOpenError(requests.exceptions.ConnectionError):
+    pass
+
+
+class CircuitBreaker:
+    def __init__(self, threshold=breaker_threshold, reset=breaker_reset):
+        """
+        Fails requests immediately after threshold consecutive failures,
+        rather than letting every caller wait on retries against a
+        service that is down. After reset seconds one request is let
+        through, closing the circuit if it succeeds.
+        """
+        self.threshold = threshold
+        self.reset = reset
+        self.failures = 0
+        self.opened = None
+        self.lock = threading.Lock()
+
+    def allow(self):
+        with self.lock:
+            if self.opened is None:
+                return True
+            if time.monotonic() - self.opened >= self.reset:
+                # Let one trial request through, holding others back
+                # until reset has passed again
+                self.opened = time.monotonic()
+                return True
+            return False
+
+    def record_success(self):
+        with self.lock:
+            if self.opened is not None:
+                logger.info('Planet API requests succeeding again.')
+            self.failures = 0
+            self.opened = None
+
+    def record_failure(self):
+        with self.lock:
+            self.failures += 1
+            if self.failures >= self.threshold:
+                if self.opened is None:
+                    logger.warning('{} consecutive failed requests, failing '
+                                   'requests for {}s.'.format(self.failures,
+                                                              self.reset))
+                self.opened = time.monotonic()
+
+
+class LatencyMetrics:
+    def __init__(self, max_samples=max_latency_samples):
+        """Counts, errors and latencies of requests, per endpoint."""
+        self.max_samples = max_samples
+        self.endpoints = {}
+        self.lock = threading.Lock()
+
+    @staticmethod
+    def endpoint(method, url):
+        """Group a request by method and path, with IDs replaced, e.g.
+        'GET /compute/ops/orders/v2/{id}'."""
+        segments = ['{id}' if id_pattern.match(s) else s
+                    for s in urlparse(url).path.split('/')]
+        return '{} {}'.format(method.upper(), '/'.join(segments))
+
+    def record(self, endpoint, seconds, error=False):
+        with self.lock:
+            m = self.endpoints.setdefault(endpoint, {'count': 0, 'errors': 0,
+                                                     'total': 0.0,
+                                                     'samples': []})
+            m['count'] += 1
+            m['total'] += seconds
+            if error:
+                m['errors'] += 1
+            samples = m['samples']
+            if len(samples) < self.max_samples:
+                samples.append(seconds)
+            else:
+                # Keep a rolling window of the most recent
+                samples[m['count'] % self.max_samples] = seconds
+
+    def summary(self):
+        """Get {endpoint: {count, errors, mean, p50, p95, max}}, latencies
+        in seconds."""
+        summary = {}
+        with self.lock:
+            for endpoint, m in self.endpoints.items():
+                samples = sorted(m['samples'])
+                summary[endpoint] = {
+                    'count': m['count'], 'errors': m['errors'],
+                    'mean': m['total'] / m['count'],
+                    'p50': samples[int(0.5 * (len(samples) - 1))],
+                    'p95': samples[int(0.95 * (len(samples) - 1))],
+                    'max': samples[-1]}
+
+        return summary
+
+    def report(self):
+        summary = self.summary()
+        if not summary:
+            return
+        width = max([len(e) for e in summary])
+        lines = ['{:<{w}} {:>7} {:>6} {:>8} {:>8} {:>8}'.format(
+            'Endpoint', 'Count', 'Errors', 'p50 (s)', 'p95 (s)', 'Max (s)',
+            w=width)]
+        for endpoint, m in sorted(summary.items()):
+            lines.append('{:<{w}} {:>7,} {:>6,} {:>8.3f} {:>8.3f} '
+                         '{:>8.3f}'.format(endpoint, m['count'], m['errors'],
+                                           m['p50'], m['p95'], m['max'],
+                                           w=width))
+        logger.info('Planet API requests:\n{}'.format('\n'.join(lines)))
+
+
+class RateLimitedSession(requests.Session):
+    def __init__(self, limiter=None, pool_size=default_pool_size):
+        """
+        Session with a connection pool large enough to be shared by
+        multiple threads, whose requests are all limited by one
+        RateLimiter. 429 Too Many Requests responses are retried after
+        waiting, as are server errors and failures to connect, within a
+        retry budget, and a circuit breaker fails requests immediately
+        while the API is failing. The latency of requests is recorded
+        per endpoint in metrics.
+        """
+        super().__init__()
+        self.limiter = limiter
+        self.budget = RetryBudget()
+        self.breaker = CircuitBreaker()
+        self.metrics = LatencyMetrics()
+        adapter = HTTPAdapter(pool_connections=pool_size,
+                              pool_maxsize=pool_size)
+        self.mount('https://', adapter)
+        self.mount('http://', adapter)
+
+    def _can_retry(self, method, attempt, status=None, exception=None):
+        if attempt >= max_retries:
+            return False
+        if status == 429:
+            # Throttled, the request was not acted on
+            return True
+        if (method.upper() not in idempotent_methods and
+                not isinstance(exception, requests.exceptions.ConnectTimeout)):
+            return False
+        return self.budget.withdraw()
+
+    def request(self, method, url, *args, **kwargs):
+        kwargs.setdefault('timeout', default_timeout)
+        endpoint = self.metrics.endpoint(method, url)
+        self.budget.deposit()
+        wait = retry_wait
+        attempt = 0
+        while True:
+            if not self.breaker.allow():
+                raise CircuitOpenError('Planet API requests are failing, not '
+                                       'sending: {} {}'.format(method, url))
+            if self.limiter:
+                self.limiter.acquire()
+            start = time.perf_counter()
+            try:
+                response = super().request(method, url, *args, **kwargs)
+            except (requests.exceptions.ConnectionError,
+                    requests.exceptions.Timeout) as e:
+                self.metrics.record(endpoint, time.perf_counter() - start,
+                                    error=True)
+                self.breaker.record_failure()
+                if not self._can_retry(method, attempt, exception=e):
+                    raise
+                logger.debug('{}, retrying in {}s: {}'.format(
+                    type(e).__name__, wait, url))
+            else:
+                status = response.status_code
+                self.metrics.record(endpoint, time.perf_counter() - start,
+                                    error=status >= 400)
+                if status >= 500:
+                    self.breaker.record_failure()
+                else:
+                    self.breaker.record_success()
+                if (status not in retry_statuses or
+                        not self._can_retry(method, attempt, status=status)):
+                    return response
+                retry_after = response.headers.get('Retry-After')
+                if retry_after and retry_after.isdigit():
+                    wait = max(wait, int(retry_after))
+                logger.debug('{} response, retrying in {}s: {}'.format(
+                    status, wait, url))
+            time.sleep(wait)
+            wait *= 2
+            attempt += 1
+
+
+lock = threading.Lock()
+shared_session = None
+
+
+def get_shared_session():
+    """Get the session shared by all threads for Planet API requests,
+    authorized with the PL_API_KEY and rate limited to 'api_rate_limit'
+    requests per second."""
+    global shared_session
+    with lock:
+        if shared_session is None:
+            rate = get_config('api_rate_limit', default=default_rate)
+            shared_session = RateLimitedSession(limiter=RateLimiter(rate))
+            shared_session.auth = (os.getenv('PL_API_KEY'), '')
+    return shared_session
+
+
+def report_metrics():
+    """Log the latency of requests made with the shared session, per
+    endpoint."""
+    if shared_session is not None:
+        shared_session.metrics.report()
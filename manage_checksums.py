@@ -0,0 +1,99 @@
+import argparse
+import os
+
+from lib.digests import default_hash_threads, digest_algorithms, hash_files
+from lib.lib import find_planet_scenes, get_checksum_cache, get_config
+from lib.logging_utils import create_logger
+
+logger = create_logger(__name__, 'sh', 'INFO')
+
+# Niceness added when warming in the background, so hashing yields to
+# other work on the machine
+background_niceness = 10
+
+
+def warm_cache(directories, threads=default_hash_threads, dryrun=False):
+    """Hash the scene files of all scenes in directories that are not
+    already cached (or recorded when downloaded), so later verification
+    (e.g. shelve_scenes.py) does not read them."""
+    cache = get_checksum_cache()
+    scene_files = []
+    for d in directories:
+        logger.info('Locating scenes in: {}'.format(d))
+        scenes = find_planet_scenes(d)
+        scene_files.extend([ps.scene_path for ps in scenes
+                            if ps.scene_path is not None and
+                            ps.scene_path.exists()])
+    logger.info('Scene files found: {:,}'.format(len(scene_files)))
+    if dryrun:
+        return
+    hash_files(scene_files, algorithms=digest_algorithms, threads=threads,
+               cache=cache, desc='Warming checksum cache')
+
+
+def purge_cache(dryrun=False):
+    cache = get_checksum_cache()
+    logger.info('Cached files: {:,}'.format(cache.count()))
+    if dryrun:
+        return
+    logger.info('Purging entries of missing or modified files...')
+    purged = cache.purge()
+    logger.info('Entries purged: {:,}'.format(purged))
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(
+        description='Manage the cache of checksums of files hashed, see '
+                    'lib.digests.ChecksumCache.')
+
+    parser.add_argument('-w', '--warm', type=os.path.abspath, nargs='+',
+                        help='Directories of scenes to hash ahead of '
+                             'verification, e.g. orders awaiting shelving.')
+    parser.add_argument('-p', '--purge', action='store_true',
+                        help='Remove entries of files that no longer exist '
+                             'or have been modified.')
+    parser.add_argument('-c', '--count', action='store_true',
+                        help='Log the number of files cached.')
+    parser.add_argument('--hash_threads', type=int,
+                        help='Files hashed at once, defaults to '
+                             '"hash_threads" in the config file.')
+    parser.add_argument('--background', action='store_true',
+                        help='Lower the priority of this process, to warm '
+                             'the cache without slowing other work.')
+    parser.add_argument('-v', '--verbose', action='store_true')
+    parser.add_argument('-dr', '--dryrun', action='store_true')
+
+    args = parser.parse_args()
+
+    warm = args.warm
+    purge = args.purge
+    count = args.count
+    hash_threads = args.hash_threads
+    background = args.background
+    verbose = args.verbose
+    dryrun = args.dryrun
+
+    if verbose:
+        # Lower the level of the module's handler rather than adding a
+        # second one, which would log each message twice
+        logger.setLevel('DEBUG')
+        for h in logger.handlers:
+            h.setLevel('DEBUG')
+
+    if get_checksum_cache() is None:
+        logger.error('Checksum cache disabled ("checksum_cache" is false in '
+                     'the config file).')
+        raise SystemExit(1)
+
+    if background and hasattr(os, 'nice'):
+        os.nice(background_niceness)
+    if hash_threads is None:
+        hash_threads = get_config('hash_threads',
+                                  default=default_hash_threads)
+
+    if purge:
+        purge_cache(dryrun=dryrun)
+    if warm:
+        warm_cache(warm, threads=hash_threads, dryrun=dryrun)
+    if count:
+        logger.info('Cached files: {:,}'.format(get_checksum_cache().count()))
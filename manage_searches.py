@@ -1,12 +1,13 @@
 import argparse
+from fnmatch import fnmatch
 import json
 import os
-import requests
 
 from pprint import pprint
 
 from lib.logging_utils import create_logger
-from lib.search import get_all_searches, delete_saved_search
+from lib.search import get_all_searches, get_registry, \
+    delete_saved_searches, get_session
 
 
 def list_searches(session, verbose=False):
@@ -23,6 +24,26 @@ def write_searches(session, out_json):
     with open(out_json, 'w') as oj:
         json.dump(all_searches, oj)
 
+
+def select_delete_ids(search_ids=None, search_names=None, name_pattern=None):
+    """Get the IDs of saved searches to delete, from IDs, exact names
+    and/or a shell-style pattern of names, e.g. 'my_search_tile*'"""
+    registry = get_registry()
+    delete_ids = []
+    if search_ids:
+        delete_ids.extend(search_ids)
+    if search_names:
+        for name in search_names:
+            name_ids = registry.ids_for_name(name)
+            if not name_ids:
+                logger.warning('No search with name {} found.'.format(name))
+            delete_ids.extend(name_ids)
+    if name_pattern:
+        delete_ids.extend([s_id for s_id, s in registry.searches.items()
+                           if fnmatch(s['name'], name_pattern)])
+
+    return list(dict.fromkeys(delete_ids))
+
 # CLI create_search
 # if __name__ == '__main__':
 #     # Groups
@@ -117,10 +138,18 @@ if __name__ == '__main__':
                         help='List all saved searches as name: id')
     parser.add_argument('-sj', '--searches_json', type=os.path.abspath,
                         help='Write searches of all searches to file passed. Specify "verbose" for full parameters.')
-    parser.add_argument('-di', '--delete_search_id', type=str,
-                        help='Delete the passed ID')
-    parser.add_argument('-dn', '--delete_search_name', type=str,
-                        help='Delete the passed search name.')
+    parser.add_argument('-di', '--delete_search_id', type=str, nargs='+',
+                        help='Delete the passed ID(s)')
+    parser.add_argument('-dn', '--delete_search_name', type=str, nargs='+',
+                        help='Delete the passed search name(s).')
+    parser.add_argument('-dl', '--delete_name_like', type=str,
+                        help='Delete all searches with names matching the '
+                             'passed pattern, e.g. "my_search_tile*"')
+    parser.add_argument('--threads', type=int, default=8,
+                        help='Number of searches to delete concurrently.')
+    parser.add_argument('--refresh', action='store_true',
+                        help='Reread saved searches from the API rather than '
+                             'using the local copy.')
     parser.add_argument('-v', '--verbose', action='store_true',
                         help='Set logging to debug. This will print full search parameters.')
     parser.add_argument('-dr', '--dryrun', action='store_true',
@@ -132,6 +161,9 @@ if __name__ == '__main__':
     searches_json = args.searches_json
     delete_search_id = args.delete_search_id
     delete_search_name = args.delete_search_name
+    delete_name_like = args.delete_name_like
+    threads = args.threads
+    refresh = args.refresh
     verbose = args.verbose
     dryrun = args.dryrun
 
@@ -141,16 +173,20 @@ if __name__ == '__main__':
         log_lvl = 'INFO'
     logger = create_logger(__name__, 'sh', log_lvl)
 
-    s = requests.Session()
-    s.auth = (os.getenv('PL_API_KEY'), '')
+    s = get_session()
+
+    if refresh:
+        get_registry(refresh=True)
 
     if seraches_list:
         list_searches(session=s, verbose=verbose)
     if searches_json:
         write_searches(session=s, out_json=searches_json)
-    if delete_search_name:
-        logger.info('Deleting search by name: {}'.format(delete_search_name))
-        delete_saved_search(session=s, search_name=args.delete_search_name, dryrun=dryrun)
-    if delete_search_id:
-        logger.info('Deleting search by ID: {}'.format(delete_search_id))
-        delete_saved_search(session=s, search_id=args.delete_search_id, dryrun=dryrun)
+    if any([delete_search_id, delete_search_name, delete_name_like]):
+        delete_ids = select_delete_ids(search_ids=delete_search_id,
+                                       search_names=delete_search_name,
+                                       name_pattern=delete_name_like)
+        logger.info('Searches to delete: {:,}'.format(len(delete_ids)))
+        deleted = delete_saved_searches(delete_ids, threads=threads,
+                                        dryrun=dryrun)
+        logger.info('Searches deleted: {:,}'.format(deleted))
@@ -1,13 +1,15 @@
 import argparse
 import os
 
-import pandas as pd
-import geopandas as gpd
-
+from lib.lazy import lazy_import
 from lib.lib import write_gdf
 from lib.db import Postgres, intersect_aoi_where
 from lib.logging_utils import create_logger
 
+# Imported on first use, so e.g. --help is quick
+pd = lazy_import('pandas')
+gpd = lazy_import('geopandas')
+
 # TODO: See if this can be done on scenes table, to facilitate ordering only
 #  scenes that meet multilook specifications. As written all overlappng scenes
 #  would have to exist in the scenes_onhand table already to be considered for
@@ -2,13 +2,16 @@ import argparse
 import os
 from pathlib import Path
 
-import geopandas as gpd
-import pandas as pd
 from tqdm import tqdm
 
+from lib.lazy import lazy_import
 from lib.db import Postgres
 from lib.logging_utils import create_logger
 
+# Imported on first use, so e.g. --help is quick
+gpd = lazy_import('geopandas')
+pd = lazy_import('pandas')
+
 
 logger = create_logger(__name__, 'sh', 'INFO')
 
@@ -1,62 +1,78 @@
 import argparse
-import datetime
 from pathlib import Path
 import os
 import sys
-import time
 
 from lib.lib import read_ids, get_config
 from lib.logging_utils import create_logger, create_logfile_path
 from submit_order import submit_order
-from lib.order import download_parallel
+from lib.order import download_parallel, get_order_registry, \
+    default_poll_interval, default_wait_max, api_source, s3_source
+from lib.order_registry import dl_success
+from lib.transport import report_metrics
 
 logger = create_logger(__name__, 'sh', 'DEBUG')
 
-default_dst_parent = get_config("download_loc")
-
 
 def order_and_download(order_name, order_ids_path,
                        order_selection_path,
                        out_orders_list,
                        order_product_bundle,
                        remove_onhand=True,
-                       initial_wait=1200,
-                       download_par_dir=default_dst_parent,
+                       poll_interval=default_poll_interval,
+                       wait_max=default_wait_max,
+                       ready_source=api_source,
+                       download_par_dir=None,
                        overwrite_downloads=False,
                        dl_orders=None,
+                       dl_name=None,
+                       shelve_direct=False,
+                       archive=False,
+                       clip_aoi=None,
                        dryrun=False):
     """Submit orders to Planet API with delivery to AWS. Selection will
     be chunked into groups of 500 IDs/order  Download order from AWS
-    to download_par_dir with subdirectories for each chunk's order ID."""
-    if not dl_orders:
+    to download_par_dir (defaults to 'download_loc' in the config file)
+    with subdirectories for each chunk's order ID.
+    All orders are checked every poll_interval seconds and each is
+    downloaded as soon as it is ready. Alternatively, download orders
+    listed in dl_orders, or those in the local registry of orders whose
+    name matches dl_name that have not been downloaded. If shelve_direct,
+    orders are shelved and indexed straight from AWS instead of being
+    downloaded to download_par_dir. If archive, orders are delivered as
+    zip archives, whose members are extracted straight from AWS. If
+    clip_aoi (path to vector file) is passed, scenes are clipped to it."""
+    if dl_name:
+        logger.info('Finding orders matching: {}'.format(dl_name))
+        registry = get_order_registry(refresh=True)
+        order_ids = [o['id'] for o in registry.find(name_like=dl_name)
+                     if o['download_state'] != dl_success]
+        logger.info('Orders IDs: {}'.format(len(order_ids)))
+    elif not dl_orders:
         logger.info('Submitting orders...')
         order_ids = submit_order(name=order_name, ids_path=order_ids_path,
                                  selection_path=order_selection_path,
                                  product_bundle=order_product_bundle,
                                  orders_path=out_orders_list,
                                  remove_onhand=remove_onhand,
-                                 dryrun=dryrun)
-        logger.info('Waiting {:,} seconds before checking AWS for '
-                    'orders...'.format(initial_wait))
-        now = datetime.datetime.now()
-        waiting_start = datetime.datetime.now()
-        resume_time = waiting_start + datetime.timedelta(seconds=initial_wait)
-        wait_interval = initial_wait / 10
+                                 dryrun=dryrun, archive=archive,
+                                 clip_aoi=clip_aoi)
         if dryrun:
             sys.exit()
-        while now < resume_time:
-            now = datetime.datetime.now()
-            logger.info('...waiting. {:,}s remain'.format(
-                round((resume_time - now).total_seconds())))
-            time.sleep(wait_interval)
     else:
         logger.info('Loading order IDs from file...')
         order_ids = read_ids(dl_orders)
         logger.info('Orders IDs: {}'.format(len(order_ids)))
 
+    if download_par_dir is None:
+        download_par_dir = Path(get_config("download_loc"))
     logger.info('Checking for ready orders...')
     download_parallel(order_ids, dst_par_dir=download_par_dir,
-                      overwrite=overwrite_downloads, dryrun=dryrun)
+                      overwrite=overwrite_downloads, dryrun=dryrun,
+                      poll_interval=poll_interval, wait_max=wait_max,
+                      source=ready_source, skip_onhand=remove_onhand,
+                      shelve_direct=shelve_direct)
+    report_metrics()
 
 
 if __name__ == '__main__':
@@ -86,21 +102,38 @@ if __name__ == '__main__':
                             default=os.path.join(os.getcwd(), 'planet_orders.txt'),
                             help='Path to write order IDs to.')
     order_args.add_argument('--do_not_remove_onhand', action='store_true',
-                            help='On hand IDs are removed by default. Use this flag to not remove.')
-
-    download_args.add_argument('--initial_wait', type=int, default=600,
-                               help='Initial period to wait before checking AWS for completed orders, in seconds.')
+                            help='On hand IDs are removed by default, from orders and '
+                                 'when downloading. Use this flag to not remove.')
+    order_args.add_argument('--clip', type=os.path.abspath,
+                            help='Path to vector file of AOI to clip scenes to.')
+    order_args.add_argument('--zip', action='store_true',
+                            help='Have each order delivered as a single zip archive, '
+                                 'rather than a file per asset.')
+
+    download_args.add_argument('--poll_interval', type=int, default=default_poll_interval,
+                               help='Seconds between checks of which orders are ready.')
+    download_args.add_argument('--wait_max', type=int, default=default_wait_max,
+                               help='Seconds to wait for orders to be ready before skipping them.')
+    download_args.add_argument('--ready_source', type=str, default=api_source,
+                               choices=[api_source, s3_source],
+                               help="""Check if orders are ready using the Orders API state of each order 
+                               ('{}') or by listing order manifests in AWS ('{}').""".format(api_source, s3_source))
     download_args.add_argument('--download_orders', type=os.path.abspath,
                                help='Skip ordering and begin downloading all order IDs in the '
                                     'provided text file.')
+    download_args.add_argument('--download_name', type=str,
+                               help='Skip ordering and download all orders with names matching this '
+                                    'pattern (SQL LIKE, e.g. "my_order_%%") that have not been '
+                                    'downloaded, from the local registry of orders.')
     download_args.add_argument('-dpd', '--destination_parent_directory', type=os.path.abspath,
                                 help="""Directory to download imagery to. Subdirectories for each 
                                 order will be created here.""")
-    # download_args.add_argument('-w', '--wait_max', type=int, default=3_600_000,
-    #                            help='Maximum amount of time to wait for an order '
-    #                                 'to arrive in AWS before skipping, in milliseconds.')
     download_args.add_argument('--overwrite', action='store_true',
                                 help='Overwrite files in destination. Otherwise duplicates are skipped.')
+    download_args.add_argument('--shelve_direct', action='store_true',
+                               help='Shelve and index scenes straight from AWS, rather than '
+                                    'downloading to the destination directory to be shelved '
+                                    'with shelve_scenes.py.')
     download_args.add_argument('-l', '--logfile', type=os.path.abspath,
                                 help='Location to write log to.')
 
@@ -116,20 +149,25 @@ if __name__ == '__main__':
     out_orders_list = args.orders
     order_product_bundle = args.product_bundle
     remove_onhand = not args.do_not_remove_onhand
+    archive = args.zip
+    clip_aoi = args.clip
 
     # Download args
-    initial_wait = args.initial_wait
+    poll_interval = args.poll_interval
+    wait_max = args.wait_max
+    ready_source = args.ready_source
     download_orders = args.download_orders
+    download_name = args.download_name
     download_par_dir = args.destination_parent_directory
-    # wait_max = args.wait_max
     overwrite_downloads = args.overwrite
+    shelve_direct = args.shelve_direct
 
     dryrun = args.dryrun
     logfile = args.logfile
 
     # Destination for downloads
     if not download_par_dir:
-        dst_parent = Path(default_dst_parent)
+        dst_parent = Path(get_config("download_loc"))
     else:
         dst_parent = Path(download_par_dir)
 
@@ -149,9 +187,14 @@ if __name__ == '__main__':
                        out_orders_list=out_orders_list,
                        order_product_bundle=order_product_bundle,
                        remove_onhand=remove_onhand,
-                       initial_wait=initial_wait,
-                       download_par_dir=download_par_dir,
-                       # wait_max=wait_max,
+                       poll_interval=poll_interval,
+                       wait_max=wait_max,
+                       ready_source=ready_source,
+                       download_par_dir=dst_parent,
                        dl_orders=download_orders,
+                       dl_name=download_name,
+                       shelve_direct=shelve_direct,
+                       archive=archive,
+                       clip_aoi=clip_aoi,
                        overwrite_downloads=overwrite_downloads,
                        dryrun=dryrun)
@@ -4,15 +4,19 @@ from pathlib import Path
 import platform
 import shutil
 
-import geopandas as gpd
 from tqdm import tqdm
 
+from lib.lazy import lazy_import
 from lib.db import Postgres, ids2sql
+from lib.dir_index import DirectoryIndex
 from lib.lib import get_config, linux2win, read_ids, write_gdf, \
     get_platform_location, PlanetScene
 # from shelve_scenes import shelve_scenes
 from lib.logging_utils import create_logger
 
+# Imported on first use, so e.g. --help is quick
+gpd = lazy_import('geopandas')
+
 # TODO: Add ability to select by either ID (current method) or filename
 
 logger = create_logger(__name__, 'sh', 'DEBUG')
@@ -29,11 +33,16 @@ required_fields = [scene_id, location]
 # Transfer methods
 tm_link = 'link'
 tm_copy = 'copy'
-shelved_base = get_config(location)
-if platform.system() == 'Windows':
-    shelved_base = Path(linux2win(shelved_base))
-else:
-    shelved_base = Path(shelved_base)
+
+
+def get_shelved_base():
+    """Shelved location from the config file, as a path on this
+    platform."""
+    shelved_base = get_config(location)
+    if platform.system() == 'Windows':
+        return Path(linux2win(shelved_base))
+
+    return Path(shelved_base)
 
 
 def load_selection(scene_ids_path=None, footprint_path=None):
@@ -86,11 +95,14 @@ def locate_scenes(selection, destination_path):
     # scenes = [PlanetScene(pl, shelved_parent=destination_path,
     #                       scene_file_source=True)
     #           for pl in selection[platform_location].unique()]
+    # Each scene directory is listed once, shared by scenes in it
+    dir_index = DirectoryIndex()
     scenes = []
     for pl in tqdm(selection[platform_location].unique()):
         scenes.append(PlanetScene(pl,
                                   # shelved_parent=destination_path,
-                                  scene_file_source=True))
+                                  scene_file_source=True,
+                                  dir_index=dir_index))
 
     return scenes
 
@@ -118,7 +130,7 @@ def copy_files(scenes, destination_path,
             src = sf
             if use_shelved_struct:
                 # Use same folder structure as shelved data
-                dst_suffix = sf.relative_to(shelved_base)
+                dst_suffix = sf.relative_to(get_shelved_base())
                 dst = destination_path / dst_suffix
             else:
                 # Flat structure, just add the filename to the destination path
@@ -2,7 +2,8 @@ import argparse
 import os
 
 from lib.lib import parse_group_args
-from lib.search import create_search, get_search_footprints
+from lib.search import create_search, get_search_footprints, \
+    get_footprints_cached
 from lib.logging_utils import create_logger
 
 # TODO: Add option to just create search from this script
@@ -29,7 +30,13 @@ logger = create_logger(__name__, 'sh', 'INFO',)
 #                       out_dir=None,
 #                       to_tbl=None,
 #                       dryrun=False):
-def search4footprints(**kwargs):
+def search4footprints(use_cache=True, **kwargs):
+    if use_cache and not (kwargs.get('get_count_only') or
+                          kwargs.get('dryrun')):
+        logger.info('Searching, using any locally cached results...')
+        get_footprints_cached(**kwargs)
+        return
+
     logger.info('Creating search...')
     ssid, search_count = create_search(**kwargs)
     if ssid:
@@ -102,6 +109,28 @@ if __name__ == '__main__':
 
     parser.add_argument('--aoi', type=os.path.abspath,
                         help='Path to AOI vector file to use for selection.')
+    parser.add_argument('--simplify_aoi', action='store_true',
+                        help='Simplify the AOI and merge small parts before '
+                             'searching, to reduce the request size. The '
+                             'simplified AOI always covers the original.')
+    parser.add_argument('--aoi_tolerance', type=float,
+                        help='Tolerance in degrees for --simplify_aoi. '
+                             'Defaults to ~500 m, a fraction of a scene.')
+    parser.add_argument('--aoi_count_check', action='store_true',
+                        help='With --simplify_aoi, log the search count '
+                             'using the AOI as provided and simplified.')
+    parser.add_argument('--tile_size', nargs='?', type=float, const=2.5,
+                        help='Split the AOI into tiles of this size in '
+                             'degrees, searched in parallel. Default size '
+                             'if passed without a value: 2.5. Not used with '
+                             '--no_cache.')
+    parser.add_argument('--split_months', action='store_true',
+                        help='With --months, search each season (range of '
+                             'contiguous months) separately, in parallel. '
+                             'Not used with --no_cache.')
+    parser.add_argument('--threads', type=int, default=4,
+                        help='Number of tiles / seasons to search in '
+                             'parallel.')
 
     parser.add_argument('-it', '--item_types', nargs='*', required=True,
                         help='Item types to search. E.g.: PSScene3Band, '
@@ -120,10 +149,18 @@ if __name__ == '__main__':
                         help='Base filter to load, upon which any provided '
                              'filters will be added.')
 
-    # parser.add_argument('--not_on_hand', action='store_true',
-    #                     help='Remove on hand IDs from search.')
-    # parser.add_argument('--fp_not_on_hand', action='store_true',
-    #                     help='Remove IDs from search if footprint is on hand.')
+    parser.add_argument('--not_on_hand', action='store_true',
+                        help='Remove on hand IDs from search results.')
+    parser.add_argument('--fp_not_on_hand', action='store_true',
+                        help='Remove IDs from search results if footprint '
+                             'is on hand.')
+    parser.add_argument('--noh_api_filter', action='store_true',
+                        help='With --not_on_hand / --fp_not_on_hand, also '
+                             'add a NotFilter of on hand IDs within the '
+                             'date range and AOI to the search request, if '
+                             'there are few enough of them. On hand IDs are '
+                             'always removed from results as they are '
+                             'retrieved.')
 
     parser.add_argument('--get_count_only', action='store_true',
                         help="Pass to only get total count for the newly "
@@ -133,6 +170,18 @@ if __name__ == '__main__':
     parser.add_argument('--overwrite_saved', action='store_true',
                         help='Pass to overwrite a saved search of the same '
                              'name.')
+    parser.add_argument('--no_cache', action='store_true',
+                        help='Do not use or update the local cache of '
+                             'search results.')
+    parser.add_argument('--cache_ttl', type=float,
+                        help='Hours that locally cached results for an '
+                             'identical search are reused before checking '
+                             'for new or updated items. Defaults to '
+                             '"search_cache_ttl" in config, or 24.')
+    parser.add_argument('--no_resume', action='store_true',
+                        help='Ignore any checkpoint left by an interrupted '
+                             'retrieval of the search\'s footprints and '
+                             'start from the first page.')
     parser.add_argument('--save_filter', nargs='?', type=os.path.abspath,
                         const='default.json',
                         help='Path to save filter (json).')
@@ -177,8 +226,15 @@ if __name__ == '__main__':
               'filters': args.filters,
               'asset_filters': args.asset_filter,
               'load_filter': args.load_filter,
-              # 'not_on_hand': args.not_on_hand,
-              # 'fp_not_on_hand': args.fp_not_on_hand,
+              'not_on_hand': args.not_on_hand,
+              'fp_not_on_hand': args.fp_not_on_hand,
+              'noh_api_filter': args.noh_api_filter,
+              'simplify_aoi': args.simplify_aoi,
+              'aoi_tolerance': args.aoi_tolerance,
+              'aoi_count_check': args.aoi_count_check,
+              'tile_size': args.tile_size,
+              'split_months': args.split_months,
+              'threads': args.threads,
               'get_count_only': args.get_count_only,
               'overwrite_saved': args.overwrite_saved,
               'save_filter': args.save_filter,
@@ -187,6 +243,9 @@ if __name__ == '__main__':
               'out_path': args.out_path,
               'out_dir': args.out_dir,
               'to_tbl': args.to_tbl,
+              'resume': not args.no_resume,
+              'use_cache': not args.no_cache,
+              'cache_ttl': args.cache_ttl,
               'dryrun': args.dryrun,
               }
 
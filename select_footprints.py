@@ -1,15 +1,18 @@
 import argparse
 import os
 
-import geopandas as gpd
-from sqlalchemy.exc import ProgrammingError
-
+from lib.lazy import lazy_import
 from lib.db import Postgres, intersect_aoi_where
 from lib.lib import write_gdf, parse_group_args
 # TODO: Fix this - place attrib_arg_lut dict somewhere better
 from lib.search import attrib_arg_lut
 from lib.logging_utils import create_logger
 
+# Imported on first use, so e.g. --help is quick
+gpd = lazy_import('geopandas')
+sqlalchemy = lazy_import('sqlalchemy')
+lazy_import('sqlalchemy.exc')
+
 # logger = create_logger('lib', 'sh', 'INFO')
 scenes_tbl = 'scenes'
 scenes_onhand_tbl = 'scenes_onhand'
@@ -90,11 +93,11 @@ def make_selection(sql):
     with Postgres('sandwich-pool.planet') as db:
         try:
             selection = db.sql2gdf(sql=sql)
-        except ProgrammingError as sql_error:
+        except sqlalchemy.exc.ProgrammingError as sql_error:
             logger.error('SQL: {}'.format(sql[:500]))
             if len(sql) > 500:
                 logger.error('...{}'.format(sql[-500:]))
-            raise ProgrammingError
+            raise sqlalchemy.exc.ProgrammingError
 
     logger.info('Selected features: {:,}'.format(len(selection)))
 
@@ -6,13 +6,18 @@ import shutil
 import sys
 import time
 
-import geopandas as gpd
 from tqdm import tqdm
 
+from lib.lazy import lazy_import
 from lib.db import Postgres
-from lib.lib import create_scene_manifests, PlanetScene, get_config, linux2win
+from lib.dir_index import DirectoryIndex
+from lib.lib import create_scene_manifests, PlanetScene, get_config, \
+    linux2win, verify_all_checksums
 from lib.logging_utils import create_logger, create_logfile_path
 
+# Imported on first use, so e.g. --help is quick
+gpd = lazy_import('geopandas')
+
 subloggers = ['lib.db', 'lib.lib']
 
 logger = create_logger(__name__, 'sh', 'INFO')
@@ -20,14 +25,21 @@ for sl in subloggers:
     create_logger(sl, 'sh', 'INFO')
 
 # Constants
-# Destination directory for shelving
-planet_data_dir = get_config('shelved_loc')
-if platform.system() == 'Windows':
-    planet_data_dir = linux2win(planet_data_dir)
-
-# Index table name and unique constraint
+# Index table name
 index_tbl = 'scenes_onhand'
-index_unique_constraint = get_config('db')['tables'][index_tbl]['unique_id']
+
+
+def get_planet_data_dir():
+    """Destination directory for shelving, from the config file."""
+    planet_data_dir = get_config('shelved_loc')
+    if platform.system() == 'Windows':
+        planet_data_dir = linux2win(planet_data_dir)
+
+    return planet_data_dir
+
+
+def get_index_unique_constraint():
+    return get_config('db')['tables'][index_tbl]['unique_id']
 
 
 def determine_copy_fxn(transfer_method):
@@ -55,7 +67,7 @@ def determine_copy_fxn(transfer_method):
     return copy_fxn
 
 
-def create_all_scene_manifests(directory):
+def create_all_scene_manifests(directory, dir_index=None):
     """
     Finds all master manifests ('source.json') in the given directory,
     then parses each for the sections corresponding to scenes and
@@ -66,12 +78,18 @@ def create_all_scene_manifests(directory):
     ---------
     directory : pathlib.Path, str
         Path to directory to parse for order-level manifests.
+    dir_index : lib.dir_index.DirectoryIndex
+        Index of directory, to which the scene manifests written are
+        added, so it can be reused to locate scenes. Created if not
+        passed.
     Returns
     ---------
     None
     """
+    if dir_index is None:
+        dir_index = DirectoryIndex(directory)
     # Get all master manifests
-    master_manifests = set(directory.rglob('source.json'))
+    master_manifests = set(dir_index.find(directory, name='source.json'))
     logger.info('Master manifests found: '
                 '{}'.format(len(master_manifests)))
     logger.debug('Master manifests found:\n'
@@ -83,7 +101,8 @@ def create_all_scene_manifests(directory):
         pbar.set_description('Creating scene manifests for: '
                              '{}'.format(mm.parent.name))
         # Create scene manifests (*_manifest.json) from a master source
-        create_scene_manifests(mm, overwrite=False)
+        for sm in create_scene_manifests(mm, overwrite=False):
+            dir_index.add(sm)
 
 
 def handle_unshelveable(unshelveable, transfer_method, move_unshelveable,
@@ -154,6 +173,7 @@ def shelve_scenes(input_directory, destination_directory=None,
                   move_unshelveable=None,
                   manage_unshelveable_only=False,
                   cleanup=False,
+                  hash_threads=None,
                   dryrun=False):
     """
     Shelve all Planet scenes found in the input_directory. Scenes are
@@ -189,6 +209,9 @@ def shelve_scenes(input_directory, destination_directory=None,
     cleanup : bool
         True to remove any remaining files after shelving and managing
         unshelveable.
+    hash_threads : int
+        Scene files hashed at once when verifying checksums, defaults to
+        'hash_threads' in the config file.
     dryrun : bool
         Locate scenes, determine if shelveable,
 
@@ -200,7 +223,7 @@ def shelve_scenes(input_directory, destination_directory=None,
     # Use default directory if destination directory not provided
     if not destination_directory:
         # Use default data directory
-        destination_directory = planet_data_dir
+        destination_directory = get_planet_data_dir()
 
     # Convert to pathlib.Path objects if necessary
     if not isinstance(input_directory, Path):
@@ -222,14 +245,17 @@ def shelve_scenes(input_directory, destination_directory=None,
     # To allow cancelling if a parameter is not correct
     time.sleep(5)
 
+    # Files in input directory, listed once and used to locate manifests
+    # and each scene's metadata files
+    logger.info('Indexing input directory...')
+    dir_index = DirectoryIndex(input_directory)
+
     # Create scene-level manifests from master manifests
     if not scene_manifests_exist and not dryrun:
-        create_all_scene_manifests(input_directory)
+        create_all_scene_manifests(input_directory, dir_index=dir_index)
 
     logger.info('Locating scene manifests...')
-    # TODO: Is this an ok way to get all scene-level manifests?
-    # TODO: Speed up - multithread or - capture from create all scene manifests
-    scene_manifests = input_directory.rglob('*_manifest.json')
+    scene_manifests = dir_index.find(input_directory, suffix='_manifest.json')
 
     # Use manifests to create PlanetScene objects, this parses
     # the information in the scene source files into attributes
@@ -238,7 +264,8 @@ def shelve_scenes(input_directory, destination_directory=None,
 
     scenes = []
     for sm in tqdm(scene_manifests, desc='Creating scenes'):
-        scenes.append(PlanetScene(sm, shelved_parent=destination_directory))
+        scenes.append(PlanetScene(sm, shelved_parent=destination_directory,
+                                  dir_index=dir_index))
 
     if len(scenes) == 0:
         if dryrun:
@@ -260,21 +287,21 @@ def shelve_scenes(input_directory, destination_directory=None,
     with Postgres() as db_src:
         indexed_ids = set(
             db_src.get_values(table=index_tbl,
-                              columns=index_unique_constraint,
+                              columns=get_index_unique_constraint(),
                               distinct=True)
         )
     logger.debug('Indexed IDs loaded: {:,}'.format((len(indexed_ids))))
 
     # Locate scenes that are not shelveable, or have already been shelved
     # and indexed
-    # TODO: Speed up, multiprocess?
-    logger.info('Parsing XML files and verifying checksums...')
+    logger.info('Parsing XML files...')
     skip_scenes = []
+    to_verify = []
     unshelveable_count = 0
     shelved_count = 0
     indexed_count = 0
     bad_checksum_count = 0
-    for ps in tqdm(scenes, desc='Parsing XML files and verifying checksums:'):
+    for ps in tqdm(scenes, desc='Parsing XML files:'):
         # Check if scene is shelveable or has been shelved and indexed
         # first to avoid verifying checksums for scenes that don't are
         # unshelveable or don't need to be reshelved
@@ -302,8 +329,14 @@ def shelve_scenes(input_directory, destination_directory=None,
         if ps.is_shelved and ps.indexed:
             skip_scenes.append(ps)
             continue
-        if verify_checksums:
-            if not ps.verify_checksum():
+        to_verify.append(ps)
+
+    # Hash remaining scenes in parallel, each file read once for md5 and
+    # sha256
+    if verify_checksums:
+        verify_all_checksums(to_verify, threads=hash_threads)
+        for ps in to_verify:
+            if not ps.valid_checksum:
                 logger.warning('Invalid checksum: '
                                '{}'.format(ps.scene_path))
                 bad_checksum_count += 1
@@ -443,7 +476,8 @@ def index_scenes(scenes, index_tbl=index_tbl, dryrun=False):
 def main(args):
     # Parse arguments, convert to pathlib.Path objects
     input_directory = Path(args.input_directory)
-    destination_directory = Path(args.destination_directory)
+    destination_directory = Path(args.destination_directory or
+                                 get_planet_data_dir())
     scene_manifests_exist = args.scene_manifests_exist
     move_unshelveable = (Path(args.move_unshelveable)
                          if args.move_unshelveable is not None
@@ -453,6 +487,7 @@ def main(args):
     remove_sources = args.remove_sources
     cleanup = args.cleanup
     run_indexer = args.index_scenes
+    hash_threads = args.hash_threads
     logdir = args.logdir
     dryrun = args.dryrun
     # Alternative routine arguments
@@ -497,6 +532,7 @@ def main(args):
                            transfer_method=transfer_method,
                            remove_sources=remove_sources,
                            cleanup=cleanup,
+                           hash_threads=hash_threads,
                            dryrun=dryrun)
 
     # Add all scenes that were shelved to index
@@ -516,8 +552,9 @@ if __name__ == '__main__':
                         help='Directory holding data to shelve.')
     # TODO: remove this arg and make a default
     parser.add_argument('--destination_directory', type=os.path.abspath,
-                        default=planet_data_dir,
-                        help='Base directory upon which to build filepath.')
+                        help='Base directory upon which to build filepath, '
+                             'defaults to "shelved_loc" in the config '
+                             'file.')
     parser.add_argument('-sme', '--scene_manifests_exist', action='store_true',
                         help='Use to specify that scene manifests exist '
                              'and recreating is not necessary or not '
@@ -525,6 +562,10 @@ if __name__ == '__main__':
     parser.add_argument('--skip_checksums', action='store_true',
                         help='Skip verifying checksums, all new scenes found '
                              'in data directory will be moved to destination.')
+    parser.add_argument('--hash_threads', type=int,
+                        help='Scene files to hash at once when verifying '
+                             'checksums, defaults to "hash_threads" in the '
+                             'config file, or 8.')
     parser.add_argument('-tm', '--transfer_method', choices=['link', 'copy'],
                         default='copy',
                         help='Method to use for transfer.')
@@ -5,6 +5,7 @@ import shutil
 
 from tqdm import tqdm
 
+from lib.dir_index import DirectoryIndex
 from lib.logging_utils import create_logger
 
 
@@ -22,7 +23,8 @@ def sort_scene_by_date(src_dir, dst_dir,
     dst_dir = Path(dst_dir)
 
     logger.info('Locating scene files...')
-    scenes = data_dir.rglob('*.tif')
+    dir_index = DirectoryIndex(data_dir)
+    scenes = dir_index.find(data_dir, suffix='.tif')
 
     logger.info('Copying scenes to sorted destination locations...')
     pbar = tqdm(scenes)
@@ -56,7 +58,7 @@ def sort_scene_by_date(src_dir, dst_dir,
             os.makedirs(subdir)
 
         # TODO: Change this to use PlanetScene.scene_files
-        scene_files = Path(sp).parent.glob('{}*'.format(sid))
+        scene_files = dir_index.find(sp.parent, prefix=sid, recursive=False)
         for sf in scene_files:
             df = subdir / sf.name
             if df.exists():
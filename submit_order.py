@@ -3,8 +3,7 @@ import os
 
 from lib.logging_utils import create_logger
 from lib.order import submit_order
-
-# TODO: order compressed?
+from lib.order_scheduler import default_threads
 
 logger = create_logger(__name__, 'sh', 'INFO')
 
@@ -35,6 +34,18 @@ if __name__ == '__main__':
                         help='Path to write order IDs to.')
     parser.add_argument('--do_not_remove_onhand', action='store_true',
                         help='On hand IDs are removed by default. Use this flag to not remove.')
+    parser.add_argument('--threads', type=int, default=default_threads,
+                        help='Number of orders to place at once.')
+    parser.add_argument('--journal', type=os.path.abspath,
+                        help='Path to record order submissions in, orders '
+                             'recorded as submitted are not placed again. '
+                             'Defaults to a file named by --order_name in '
+                             'the cache directory.')
+    parser.add_argument('--clip', type=os.path.abspath,
+                        help='Path to vector file of AOI to clip scenes to.')
+    parser.add_argument('--zip', action='store_true',
+                        help='Have each order delivered as a single zip '
+                             'archive, rather than a file per asset.')
     parser.add_argument('--dryrun', action='store_true',
                         help='Create order request, but do not place.')
 
@@ -46,10 +57,16 @@ if __name__ == '__main__':
     orders_path = args.orders
     product_bundle = args.product_bundle
     remove_onhand = not args.do_not_remove_onhand
+    threads = args.threads
+    journal_path = args.journal
+    archive = args.zip
+    clip_aoi = args.clip
     dryrun = args.dryrun
 
     submit_order(name=name, ids_path=ids_path, selection_path=selection_path,
                  orders_path=orders_path, product_bundle=product_bundle,
-                 remove_onhand=remove_onhand, dryrun=dryrun)
+                 remove_onhand=remove_onhand, dryrun=dryrun,
+                 threads=threads, journal_path=journal_path,
+                 archive=archive, clip_aoi=clip_aoi)
 
     logger.info('Done.')
@@ -0,0 +1,85 @@
+import argparse
+import os
+import time
+
+from lib.lib import parse_group_args
+from lib.sync import sync_scenes
+from lib.logging_utils import create_logger
+
+logger = create_logger(__name__, 'sh', 'INFO')
+
+
+def run_sync(interval=None, **kwargs):
+    """Sync once, or every interval minutes until interrupted."""
+    while True:
+        start = time.time()
+        try:
+            new_ids = sync_scenes(**kwargs)
+            logger.info('Sync complete, new IDs: {:,}'.format(len(new_ids)))
+        except Exception as e:
+            if not interval:
+                raise e
+            # Try again next interval
+            logger.error('Sync failed: {}'.format(e))
+        if not interval:
+            break
+        wait = max(interval * 60 - (time.time() - start), 0)
+        logger.info('Next sync in {:.1f} minutes'.format(wait / 60))
+        time.sleep(wait)
+
+
+if __name__ == '__main__':
+    att_group = 'Attributes'
+
+    choices_instruments = ['PS2', 'PSB.SD', 'PS2.SD']
+
+    parser = argparse.ArgumentParser(
+        description="Keep a footprint table current with the Planet archive "
+        "for an AOI and item types. The latest 'published' and 'updated' "
+        "values ingested are recorded after each sync, and only items "
+        "published or updated since are requested on the next. Footprints "
+        "are upserted into --to_tbl, and the IDs newly added can be "
+        "appended to --new_ids for incremental downstream processing.",
+        formatter_class=argparse.RawTextHelpFormatter,
+    )
+    attribute_args = parser.add_argument_group(att_group)
+
+    parser.add_argument('-n', '--name', type=str, required=True,
+                        help='Name of sync, used for saved search name.')
+    parser.add_argument('--aoi', type=os.path.abspath,
+                        help='Path to AOI vector file to sync.')
+    parser.add_argument('-it', '--item_types', nargs='*', required=True,
+                        help='Item types to sync. E.g.: PSScene4Band')
+    parser.add_argument('-af', '--asset_filter', action='append',
+                        help='Asset filter to include. E.g.: basic_analytic')
+    attribute_args.add_argument('--min_date', type=str,
+                                help='Earliest acquisition date to sync, '
+                                     'bounds the first sync.')
+    attribute_args.add_argument('--max_cc', type=float, )
+    attribute_args.add_argument('--instrument', type=str, nargs='+',
+                                choices=choices_instruments, )
+    attribute_args.add_argument('--quality_category', type=str, nargs='+')
+    parser.add_argument('--to_tbl', type=str, default='scenes',
+                        help='Table to upsert footprints into.')
+    parser.add_argument('--new_ids', type=os.path.abspath,
+                        help='Text file to append newly added IDs to.')
+    parser.add_argument('--interval', type=float,
+                        help='Minutes between syncs. If not provided, sync '
+                             'once and exit (e.g. when run by cron).')
+    parser.add_argument('-d', '--dryrun', action='store_true',
+                        help='Get footprints but do not write them or '
+                             'record the sync.')
+
+    args = parser.parse_args()
+    attrib_args = parse_group_args(parser=parser, group_name=att_group)
+    attrib_args = {k: v for k, v in attrib_args._get_kwargs()}
+
+    run_sync(interval=args.interval,
+             name=args.name,
+             aoi=args.aoi,
+             item_types=args.item_types,
+             asset_filters=args.asset_filter,
+             attrib_args=attrib_args,
+             to_tbl=args.to_tbl,
+             new_ids_path=args.new_ids,
+             dryrun=args.dryrun)
@@ -0,0 +1,37 @@
+import math
+
+from shapely.geometry import Point, box
+
+from lib.aoi import hull_small_parts, scene_size
+
+min_area = scene_size ** 2
+
+
+def test_hull_small_parts_cluster():
+    parts = [box(0, 0, 0.05, 0.05), box(0.1, 0, 0.15, 0.05),
+             box(0.05, 0.1, 0.1, 0.15)]
+    merged = hull_small_parts(parts, min_area=min_area, distance=scene_size)
+    assert len(merged) == 1
+    assert all([merged[0].contains(p) for p in parts])
+
+
+def test_hull_small_parts_keeps_large():
+    large = box(0, 0, 1, 1)
+    merged = hull_small_parts([large, box(5, 5, 5.01, 5.01)],
+                              min_area=min_area, distance=scene_size)
+    assert large in merged
+
+
+def test_hull_small_parts_ring_capped():
+    # Ring of small islands, each within distance of the next
+    radius = 2.0
+    n = 60
+    parts = [Point(radius * math.cos(2 * math.pi * i / n),
+                   radius * math.sin(2 * math.pi * i / n)).buffer(0.02)
+             for i in range(n)]
+    merged = hull_small_parts(parts, min_area=min_area, distance=scene_size)
+    assert len(merged) == 1
+    # The centre of the ring is not covered, as it would be by a hull
+    assert not merged[0].contains(Point(0, 0))
+    assert all([merged[0].contains(p) for p in parts])
+    assert merged[0].area < 0.5 * math.pi * radius ** 2
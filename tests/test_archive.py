@@ -0,0 +1,49 @@
+import io
+import os
+import zipfile
+
+import pytest
+
+from lib.archive import ArchiveExtractor, is_within, safe_member_path
+
+
+@pytest.mark.parametrize('name, expected', [
+    ('PSScene/a.tif', 'PSScene/a.tif'),
+    ('./PSScene/./a.tif', 'PSScene/a.tif'),
+    ('/etc/passwd', 'etc/passwd'),
+    ('../../a.tif', 'a.tif'),
+    ('PSScene/../../a.tif', 'PSScene/a.tif'),
+    ('C:\\Windows\\a.tif', 'Windows/a.tif'),
+    ('..', ''),
+])
+def test_safe_member_path(name, expected):
+    assert safe_member_path(name) == expected
+
+
+def test_is_within(tmp_path):
+    assert is_within(tmp_path, tmp_path / 'order' / 'a.tif')
+    assert not is_within(tmp_path / 'order', tmp_path / 'order' / '..' / 'a')
+    assert not is_within(tmp_path / 'order', tmp_path / 'order2' / 'a')
+
+
+def test_members_unsafe_names():
+    buffer = io.BytesIO()
+    with zipfile.ZipFile(buffer, 'w') as zf:
+        zf.writestr('source.json', '{}')
+        zf.writestr('../evil.tif', 'x')
+        zf.writestr('/abs/b.tif', 'x')
+        zf.writestr('evil.tif', 'x')
+        zf.writestr('..', 'x')
+    extractor = ArchiveExtractor.__new__(ArchiveExtractor)
+    extractor.key = 'order.zip'
+    extractor.etag = '"etag"'
+    with zipfile.ZipFile(buffer) as zf:
+        extractor.infos = {i.filename: i for i in zf.infolist()}
+
+    members = extractor.members()
+
+    assert list(members) == ['source.json', 'evil.tif', 'abs/b.tif']
+    # Members are still read by their names in the archive
+    assert members['evil.tif'].key == '../evil.tif'
+    for rel_path in members:
+        assert not os.path.isabs(rel_path) and '..' not in rel_path.split('/')
@@ -0,0 +1,37 @@
+from lib.checkpoint import SearchCheckpoint
+
+next_url = 'https://api.planet.com/data/v1/searches/abc/results?_page=2'
+
+
+def test_resume(tmp_path):
+    cp = SearchCheckpoint('abc', checkpoint_dir=tmp_path)
+    assert not cp.exists
+    cp.add_page([{'id': 'a'}, {'id': 'b'}], next_url)
+
+    resumed = SearchCheckpoint('abc', checkpoint_dir=tmp_path)
+    assert resumed.exists
+    assert resumed.next_url == next_url
+    assert resumed.feature_count == 2
+    assert not resumed.complete
+
+    resumed.add_page([{'id': 'c'}], None)
+    assert resumed.complete
+    pages = list(SearchCheckpoint('abc', checkpoint_dir=tmp_path)
+                 .iter_pages())
+    assert [[f['id'] for f in p] for p in pages] == [['a', 'b'], ['c']]
+
+
+def test_clear(tmp_path):
+    cp = SearchCheckpoint('abc', checkpoint_dir=tmp_path)
+    cp.add_page([{'id': 'a'}], next_url)
+    cp.clear()
+    assert not cp.exists
+    assert not (tmp_path / 'abc').exists()
+    assert cp.pages == []
+    assert cp.feature_count == 0
+
+
+def test_no_partial_files(tmp_path):
+    cp = SearchCheckpoint('abc', checkpoint_dir=tmp_path)
+    cp.add_page([{'id': 'a'}], next_url)
+    assert not list((tmp_path / 'abc').glob('*.tmp'))
@@ -0,0 +1,81 @@
+import hashlib
+import os
+
+import pytest
+
+from lib.digests import ChecksumCache, compute_file_digests, hash_files
+from lib.lib import verify_digests
+
+expected = {'md5': 'a' * 32, 'sha256': 'b' * 64}
+
+
+def test_verify_digests_match():
+    assert verify_digests(expected, dict(expected), 'a.tif')
+
+
+def test_verify_digests_mismatch():
+    digests = dict(expected, sha256='c' * 64)
+    assert not verify_digests(expected, digests, 'a.tif')
+
+
+def test_verify_digests_none_expected():
+    assert not verify_digests({}, dict(expected), 'a.tif')
+
+
+@pytest.fixture
+def cache(tmp_path):
+    return ChecksumCache(tmp_path / 'checksums.sqlite')
+
+
+@pytest.fixture
+def scene(tmp_path):
+    path = tmp_path / 'scene.tif'
+    path.write_bytes(b'scene data')
+    return path
+
+
+def test_compute_file_digests(scene):
+    digests = compute_file_digests(scene, chunk_size=3)
+    assert digests == {'md5': hashlib.md5(b'scene data').hexdigest(),
+                       'sha256': hashlib.sha256(b'scene data').hexdigest()}
+
+
+def test_cache_hit(cache, scene):
+    digests = compute_file_digests(scene)
+    cache.put(scene, digests, os.stat(scene))
+    assert cache.get(scene) == digests
+    assert cache.count() == 1
+
+
+def test_cache_modified(cache, scene):
+    stat = os.stat(scene)
+    cache.put(scene, compute_file_digests(scene), stat)
+    scene.write_bytes(b'modified scene data')
+    assert cache.get(scene) is None
+    assert cache.purge() == 1
+    assert cache.count() == 0
+
+
+def test_cache_changed_while_hashing(cache, scene):
+    stat = os.stat(scene)
+    digests = compute_file_digests(scene)
+    scene.write_bytes(b'modified scene data')
+    cache.put(scene, digests, stat)
+    assert cache.count() == 0
+
+
+def test_cache_purge_missing(cache, scene):
+    cache.put(scene, compute_file_digests(scene), os.stat(scene))
+    scene.unlink()
+    assert cache.get(scene) is None
+    assert cache.purge() == 1
+
+
+def test_hash_files_cached(cache, scene, monkeypatch):
+    digests = hash_files([scene], cache=cache, threads=1)
+    assert cache.get(scene) == digests[scene]
+
+    def fail(*args, **kwargs):
+        raise AssertionError('File read again')
+    monkeypatch.setattr('lib.digests.compute_file_digests', fail)
+    assert hash_files([scene], cache=cache, threads=1) == digests
@@ -0,0 +1,71 @@
+from pathlib import Path
+
+import pytest
+
+from lib.dir_index import DirectoryIndex, scene_name
+
+scene = '20191009_160416_100d'
+
+
+@pytest.fixture
+def order_dir(tmp_path):
+    files = ['{}_3B_AnalyticMS_SR.tif'.format(scene),
+             '{}_3B_AnalyticMS_metadata.xml'.format(scene),
+             '{}_3B_udm2.tif'.format(scene),
+             'sub/{}_metadata.json'.format(scene),
+             'sub/20191009_160417_100d_metadata.json',
+             'sub/deeper/{}_3B_AnalyticMS_DN_udm.tif'.format(scene),
+             'manifest.json']
+    for f in files:
+        path = tmp_path / f
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.write_text('')
+    return tmp_path
+
+
+def test_scene_name():
+    assert scene_name('a/{}_3B_AnalyticMS_SR.tif'.format(scene)) == \
+        '{}_3B_AnalyticMS'.format(scene)
+
+
+def test_find_prefix(order_dir):
+    index = DirectoryIndex(order_dir)
+    found = index.find(order_dir, prefix=scene)
+    assert sorted(found) == sorted(
+        [p for p in order_dir.rglob('{}*'.format(scene)) if p.is_file()])
+    assert len(found) == 5
+
+
+def test_find_suffix_not_recursive(order_dir):
+    index = DirectoryIndex(order_dir)
+    found = index.find(order_dir, prefix=scene, suffix='.tif',
+                       recursive=False)
+    assert sorted([p.name for p in found]) == \
+        ['{}_3B_AnalyticMS_SR.tif'.format(scene),
+         '{}_3B_udm2.tif'.format(scene)]
+
+
+def test_find_name(order_dir):
+    index = DirectoryIndex(order_dir)
+    assert index.find(order_dir, name='manifest.json') == \
+        [order_dir / 'manifest.json']
+    assert index.find(order_dir, name='{}_3B'.format(scene)) == []
+
+
+def test_unindexed_directory(order_dir):
+    index = DirectoryIndex()
+    found = index.find(order_dir / 'sub', suffix='metadata.json')
+    assert len(found) == 2
+    assert all([isinstance(p, Path) for p in found])
+
+
+def test_exists_add(order_dir):
+    index = DirectoryIndex(order_dir)
+    new = order_dir / 'sub' / '{}_new.tif'.format(scene)
+    assert index.exists(order_dir / 'manifest.json')
+    new.write_text('')
+    # Snapshot until added
+    assert not index.exists(new)
+    index.add(new)
+    assert index.exists(new)
+    assert new in index.find(order_dir, prefix=scene)
@@ -0,0 +1,38 @@
+from lib.onhand import IDSet
+
+ids = ['20200101_101010_1001', '20200102_101010_0f02',
+       '20210101_000000_22_2276', '20200101_101010_1001']
+
+
+def test_contains():
+    id_set = IDSet(ids)
+    assert len(id_set) == 3
+    assert '20200102_101010_0f02' in id_set
+    assert '20200102_101010_0f0' not in id_set
+    assert '20200102_101010_0f021' not in id_set
+    # Beyond either end of the sorted IDs
+    assert '0' not in id_set
+    assert 'z' not in id_set
+    assert list(id_set.contains(['z', ids[2], 'a', ids[0]])) == \
+        [False, True, False, True]
+
+
+def test_empty():
+    id_set = IDSet([])
+    assert len(id_set) == 0
+    assert ids[0] not in id_set
+    assert id_set.exclude(ids[:2]) == ids[:2]
+    assert len(IDSet(ids).contains([])) == 0
+
+
+def test_exclude():
+    id_set = IDSet(ids[:2])
+    assert id_set.exclude(ids) == [ids[2]]
+
+
+def test_save_load(tmp_path):
+    path = tmp_path / 'ids.npy'
+    IDSet(ids).save(path)
+    loaded = IDSet.load(path)
+    assert loaded.tolist() == sorted(set(ids))
+    assert ids[2] in loaded
@@ -0,0 +1,32 @@
+from lib import order
+from lib.order import OrderTracker
+
+
+class Registry:
+    """Registry holding set order states."""
+    def __init__(self, states):
+        self._states = states
+
+    def states(self, order_ids):
+        return {oid: self._states[oid] for oid in order_ids
+                if oid in self._states}
+
+
+def test_tracker_unlisted_orders(monkeypatch):
+    registry = Registry({'listed': 'success', 'running': 'running',
+                         'failed': 'failed'})
+    delivered = {'listed', 'unlisted'}
+    monkeypatch.setattr(order, 'get_order_registry',
+                        lambda refresh=False: registry)
+    monkeypatch.setattr(order, 'manifest_exists',
+                        lambda oid, bucket: oid in delivered)
+    tracker = OrderTracker(['listed', 'running', 'failed', 'unlisted',
+                            'undelivered'], bucket=None)
+    ready, failed = tracker.check()
+    assert sorted(ready) == ['listed', 'unlisted']
+    assert failed == ['failed']
+    assert tracker.pending == ['running', 'undelivered']
+
+    delivered.add('undelivered')
+    ready, _failed = tracker.check()
+    assert ready == ['undelivered']
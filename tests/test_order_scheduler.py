@@ -0,0 +1,145 @@
+from lib.order_registry import OrderRegistry
+from lib.order_scheduler import OrderJournal, OrderScheduler, chunk_ids, \
+    failed, ids_hash, submitted, submitting
+
+
+class Response:
+    def __init__(self, data):
+        self.data = data
+
+    def raise_for_status(self):
+        pass
+
+    def json(self):
+        return self.data
+
+
+class StatsSession:
+    """Session returning a set count of queued and running orders."""
+    def __init__(self, count=0):
+        self.count = count
+
+    def get(self, url):
+        return Response({'user': {'queued_orders': self.count,
+                                  'running_orders': 0}})
+
+
+class OrdersSession:
+    """Session returning pages of orders, newest first."""
+    auth = None
+
+    def __init__(self, pages):
+        self.pages = pages
+
+    def get(self, url):
+        i = int(url.rsplit('=', 1)[-1]) if '=' in url else 0
+        links = {}
+        if i + 1 < len(self.pages):
+            links['next'] = 'orders?page={}'.format(i + 1)
+        return Response({'orders': self.pages[i], '_links': links})
+
+
+def order_request(name, ids):
+    return {'name': name, 'products': [{'item_ids': ids}]}
+
+
+def test_chunk_ids():
+    ids = ['id_{:03d}'.format(i) for i in range(1200)]
+    chunks = chunk_ids(reversed(ids), chunk_size=500)
+    assert [len(c) for c in chunks] == [500, 500, 200]
+    assert chunks == chunk_ids(ids, chunk_size=500)
+
+
+def test_refresh_keeps_pending_slots(tmp_path):
+    session = StatsSession(count=5)
+    scheduler = OrderScheduler(OrderJournal(tmp_path / 'j.jsonl'), None,
+                               max_concurrent=10, session=session)
+    scheduler.refresh()
+    scheduler.acquire_slot()
+    scheduler.acquire_slot()
+    assert scheduler.in_flight == 7
+    # Orders still being placed are not in the server's count
+    scheduler.refresh()
+    assert scheduler.in_flight == 7
+    scheduler.release_slot()
+    scheduler.release_slot(placed=True)
+    assert scheduler.in_flight == 6
+    # Once counted by the server, the placed order is not counted twice
+    session.count = 6
+    scheduler.refresh()
+    assert scheduler.in_flight == 6
+
+
+def test_release_never_below_server_count(tmp_path):
+    scheduler = OrderScheduler(OrderJournal(tmp_path / 'j.jsonl'), None,
+                               session=StatsSession(count=3))
+    scheduler.refresh()
+    scheduler.release_slot()
+    scheduler.release_slot()
+    assert scheduler.in_flight == 3
+
+
+def test_submit_skips_submitted(tmp_path):
+    journal = OrderJournal(tmp_path / 'j.jsonl')
+    placed = []
+
+    def place(request):
+        placed.append(request['name'])
+        return 'oid_{}'.format(len(placed)), None
+
+    scheduler = OrderScheduler(journal, place, session=StatsSession())
+    scheduler.refresh()
+    requests = [order_request('a_0', ['1', '2']),
+                order_request('a_1', ['3'])]
+    assert scheduler.submit_all(requests) == ['oid_1', 'oid_2']
+    assert scheduler.in_flight == 2
+
+    # Journal is reloaded, keyed by the IDs of each order
+    journal = OrderJournal(tmp_path / 'j.jsonl')
+    scheduler = OrderScheduler(journal, place, session=StatsSession())
+    scheduler.refresh()
+    assert scheduler.submit(order_request('renamed', ['2', '1'])) == 'oid_1'
+    assert placed == ['a_0', 'a_1']
+    assert journal.submitted_ids() == {'1', '2', '3'}
+    assert journal.submitted_order_ids(['3', '4']) == ['oid_2']
+    assert journal.submitted_order_ids(['1', '3']) == ['oid_1', 'oid_2']
+    assert journal.names() == {'a_0', 'a_1'}
+
+
+def test_journal_unresolved(tmp_path):
+    path = tmp_path / 'j.jsonl'
+    journal = OrderJournal(path)
+    journal.record('a', submitting, ids_hash(['1']), ids=['1'])
+    journal.record('b', submitting, ids_hash(['2']), ids=['2'])
+    journal.record('b', submitted, ids_hash(['2']), order_id='oid')
+    # Partial line written when interrupted
+    with open(path, 'a') as dst:
+        dst.write('{"name": ')
+
+    journal = OrderJournal(path)
+    assert [r['name'] for r in journal.unresolved()] == ['a']
+    # IDs are kept from the record of the submission
+    assert journal.submitted_ids() == {'2'}
+    assert journal.get(ids_hash(['2']))['state'] == submitted
+
+
+def test_resolve_unresolved(tmp_path):
+    journal = OrderJournal(tmp_path / 'j.jsonl')
+    journal.record('a_0', submitting, ids_hash(['1']), ids=['1'])
+    journal.record('a_1', submitting, ids_hash(['2']), ids=['2'])
+    pages = [[{'id': 'oid_2', 'name': 'a_0', 'state': 'queued',
+               'created_on': '2021-01-02'}],
+             [{'id': 'oid_1', 'name': 'a_0', 'state': 'failed',
+               'created_on': '2021-01-01'},
+              {'id': 'oid_0', 'name': 'b_0', 'state': 'success',
+               'created_on': '2020-12-31'}]]
+    session = OrdersSession(pages)
+    registry = OrderRegistry(session, 'orders',
+                             db_path=tmp_path / 'orders.sqlite')
+    scheduler = OrderScheduler(journal, None, session=session,
+                               registry=registry)
+    scheduler.resolve_unresolved()
+    assert journal.unresolved() == []
+    # The newest order of the name is the one placed
+    assert journal.get(ids_hash(['1']))['order_id'] == 'oid_2'
+    assert journal.get(ids_hash(['2']))['state'] == failed
@@ -0,0 +1,88 @@
+from datetime import date
+
+import pytest
+
+from lib import search
+from lib.search import SearchResultsError, fetch_page, month_ranges
+
+
+def test_winter_months_merged():
+    ranges = month_ranges(['12', '1', '2'], min_date='2018-06-15',
+                          max_date='2020-01-10')
+    assert ranges == [(date(2018, 12, 1), date(2019, 3, 1)),
+                      (date(2019, 12, 1), date(2020, 1, 11))]
+
+
+def test_clipped_to_dates():
+    ranges = month_ranges(['06', '07'], min_date='2019-06-15',
+                          max_date='2019-07-20')
+    assert ranges == [(date(2019, 6, 15), date(2019, 7, 21))]
+
+
+def test_days_not_merged():
+    ranges = month_ranges(['06', '07'], min_date='2019-01-01',
+                          max_date='2019-12-31',
+                          month_min_days={'07': 5},
+                          month_max_days={'6': 20})
+    assert ranges == [(date(2019, 6, 1), date(2019, 6, 21)),
+                      (date(2019, 7, 5), date(2019, 8, 1))]
+
+
+def test_days_beyond_month():
+    ranges = month_ranges(['02'], min_date='2020-01-01',
+                          max_date='2021-12-31',
+                          month_max_days={'02': 30})
+    assert ranges == [(date(2020, 2, 1), date(2020, 3, 1)),
+                      (date(2021, 2, 1), date(2021, 3, 1))]
+
+
+@pytest.mark.parametrize('months, min_days', [
+    (['13'], None),
+    (['06'], {'06': 0}),
+])
+def test_invalid(months, min_days):
+    with pytest.raises(ValueError):
+        month_ranges(months, min_date='2019-01-01', max_date='2019-12-31',
+                     month_min_days=min_days)
+
+
+class Response:
+    def __init__(self, status_code, data=None):
+        self.status_code = status_code
+        self.reason = 'reason'
+        self.data = data
+
+    def json(self):
+        return self.data
+
+
+class Session:
+    """Session returning set responses, as after its own retries."""
+    def __init__(self, responses):
+        self.responses = responses
+        self.urls = []
+
+    def get(self, url):
+        self.urls.append(url)
+        return self.responses.pop(0)
+
+
+@pytest.mark.parametrize('status_code, error', [
+    (503, ConnectionError),
+    (404, SearchResultsError),
+])
+def test_fetch_page_not_retried(monkeypatch, status_code, error):
+    session = Session([Response(status_code), Response(200)])
+    monkeypatch.setattr(search, 'get_session', lambda: session)
+    with pytest.raises(ConnectionError) as e:
+        fetch_page('page_1')
+    # Only expired pages are SearchResultsErrors, restarting the search
+    assert type(e.value) is error
+    assert session.urls == ['page_1']
+
+
+def test_fetch_page(monkeypatch):
+    page = {'features': [{'id': 'a'}], '_links': {'_next': 'page_2'}}
+    monkeypatch.setattr(search, 'get_session',
+                        lambda: Session([Response(200, page)]))
+    assert fetch_page('page_1') == ([{'id': 'a'}], 'page_2')
@@ -0,0 +1,75 @@
+import datetime
+
+import geopandas as gpd
+from shapely.geometry import Point
+
+from lib.search_cache import contains_filter_type, create_delta_request, \
+    merge_footprints, search_key
+
+date_filter = {'type': 'DateRangeFilter', 'field_name': 'acquired',
+               'config': {'gte': '2020-01-01T00:00:00.000Z'}}
+cloud_filter = {'type': 'RangeFilter', 'field_name': 'cloud_cover',
+                'config': {'lte': 0.2}}
+instrument_filter = {'type': 'StringInFilter', 'field_name': 'instrument',
+                     'config': ['PS2', 'PS2.SD']}
+
+
+def search_request(search_filter, name='search'):
+    return {'name': name, 'item_types': ['PSScene'], 'filter': search_filter}
+
+
+def test_search_key_unordered():
+    sr1 = search_request({'type': 'AndFilter',
+                          'config': [date_filter, instrument_filter]})
+    sr2 = search_request({'type': 'AndFilter',
+                          'config': [dict(instrument_filter,
+                                          config=['PS2.SD', 'PS2']),
+                                     date_filter]}, name='other')
+    assert search_key(sr1) == search_key(sr2)
+    sr3 = search_request({'type': 'AndFilter',
+                          'config': [date_filter, cloud_filter]})
+    assert search_key(sr1) != search_key(sr3)
+
+
+def test_contains_filter_type():
+    nested = {'type': 'AndFilter',
+              'config': [cloud_filter,
+                         {'type': 'NotFilter', 'config': date_filter}]}
+    assert contains_filter_type(nested, 'DateRangeFilter')
+    assert contains_filter_type(nested, 'AndFilter')
+    assert not contains_filter_type(nested, 'StringInFilter')
+
+
+def test_create_delta_request():
+    sr = search_request(date_filter)
+    since = datetime.datetime(2021, 3, 4, 5, 6, 7)
+    delta = create_delta_request(sr, since)
+    # Original request unchanged
+    assert sr['filter'] == date_filter
+    assert delta['item_types'] == sr['item_types']
+    original, update = delta['filter']['config']
+    assert delta['filter']['type'] == 'AndFilter'
+    assert original == date_filter
+    assert update['type'] == 'OrFilter'
+    assert sorted([f['field_name'] for f in update['config']]) == \
+        ['published', 'updated']
+    assert all([f['type'] == 'UpdateFilter' and
+                f['config'] == {'gte': '2021-03-04T05:06:07.000Z'}
+                for f in update['config']])
+
+
+def test_merge_footprints():
+    cached = gpd.GeoDataFrame({'id': ['a', 'b'],
+                               'item_type': ['PSScene', 'PSScene'],
+                               'cloud_cover': [0.1, 0.5]},
+                              geometry=[Point(0, 0), Point(1, 1)],
+                              crs='epsg:4326')
+    delta = gpd.GeoDataFrame({'id': ['b', 'c'],
+                              'item_type': ['PSScene', 'PSScene'],
+                              'cloud_cover': [0.0, 0.3]},
+                             geometry=[Point(1, 1), Point(2, 2)],
+                             crs='epsg:4326')
+    merged = merge_footprints(cached, delta)
+    assert sorted(merged['id']) == ['a', 'b', 'c']
+    assert merged.set_index('id').loc['b', 'cloud_cover'] == 0.0
+    assert merge_footprints(cached, delta.iloc[:0]) is cached
@@ -0,0 +1,103 @@
+import hashlib
+import io
+import json
+
+import pytest
+
+from lib import lib, shelve_direct
+from lib.shelve_direct import shelve_order_direct
+
+oid = 'e4c2f3a0-0000-4000-8000-000000000000'
+key_prefix = 'planet'
+scene = '20191009_160416_100d'
+scene_data = b'scene data'
+objects = {
+    'manifest.json': json.dumps({'files': []}).encode(),
+    'PSScene/{}_3B_AnalyticMS.tif'.format(scene): scene_data,
+    'PSScene/{}_3B_AnalyticMS_metadata.xml'.format(scene): b'<xml/>',
+    'PSScene/{}_metadata.json'.format(scene): b'{}',
+}
+
+
+class Object:
+    def __init__(self, key, data):
+        self.key = key
+        self.size = len(data)
+        self.e_tag = '"{}"'.format(hashlib.md5(data).hexdigest())
+
+
+class Body:
+    def __init__(self, data):
+        self.stream = io.BytesIO(data)
+
+    def iter_chunks(self, chunk_size):
+        return iter(lambda: self.stream.read(chunk_size), b'')
+
+
+class Client:
+    def __init__(self, data):
+        self.data = data
+
+    def get_object(self, Bucket, Key, **kwargs):
+        return {'Body': Body(self.data[Key])}
+
+
+class Bucket:
+    name = 'bucket'
+
+    def __init__(self, data):
+        self.meta = type('Meta', (), {'client': Client(data)})
+
+
+class Inventory:
+    def __init__(self, data):
+        self.data = data
+
+    def order_prefix(self, oid):
+        return '{}/{}/'.format(key_prefix, oid)
+
+    def order_objects(self, oid):
+        return [Object(k, d) for k, d in self.data.items()]
+
+
+class Scene:
+    """Scene located in the staged metadata, see lib.lib.PlanetScene."""
+    def __init__(self, scene_path, shelved_parent, **kwargs):
+        self.scene_path = scene_path
+        self.scene_name = scene_path.stem
+        self.item_id = scene
+        self.shelveable = True
+        self.metadata_json = scene_path.parent / '{}_metadata.json'.format(
+            scene)
+        self.shelved_dir = shelved_parent / scene
+        self.shelved_location = self.shelved_dir / scene_path.name
+        self.md5 = hashlib.md5(scene_data).hexdigest()
+
+
+@pytest.fixture
+def order(tmp_path, monkeypatch):
+    data = {'{}/{}/{}'.format(key_prefix, oid, k): d
+            for k, d in objects.items()}
+    config = {'cache_dir': str(tmp_path / 'cache')}
+    monkeypatch.setattr(lib, 'get_config',
+                        lambda param, default=None: config.get(param,
+                                                               default))
+    monkeypatch.setattr(shelve_direct, 'master_manifest', 'manifest.json')
+    monkeypatch.setattr(shelve_direct, 'get_inventory',
+                        lambda bucket, prefix: Inventory(data))
+    monkeypatch.setattr(
+        shelve_direct, 'create_scene_manifests',
+        lambda manifest, overwrite: [manifest.parent / k for k in objects
+                                     if k.endswith('.tif')])
+    monkeypatch.setattr(shelve_direct, 'PlanetScene', Scene)
+    return Bucket(data)
+
+
+def test_no_sidecars(order, tmp_path):
+    shelved = tmp_path / 'shelved'
+    assert shelve_order_direct(oid, order, key_prefix,
+                               shelved_parent=shelved, index=False)
+    shelved_files = sorted([p.name for p in shelved.rglob('*')
+                            if p.is_file()])
+    assert shelved_files == sorted([k.split('/')[-1] for k in objects
+                                    if k.startswith('PSScene')])
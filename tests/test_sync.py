@@ -0,0 +1,71 @@
+import pandas as pd
+import pytest
+
+from lib import sync
+from lib.sync import SyncState, sync_scenes
+
+footprints = pd.DataFrame({'id': ['a', 'b'],
+                           'published': ['2021-01-01T00:00:00Z',
+                                         '2021-02-01T00:00:00Z'],
+                           'updated': ['2021-01-02T00:00:00Z',
+                                       '2021-02-02T00:00:00Z']})
+
+
+def search_request(max_cc):
+    return {'name': 'aoi_sync', 'item_types': ['PSScene'],
+            'filter': {'type': 'RangeFilter', 'field_name': 'cloud_cover',
+                       'config': {'lte': max_cc}}}
+
+
+def test_state_per_search(tmp_path):
+    state = SyncState('aoi', search_request(0.2), state_dir=tmp_path)
+    state.update(footprints)
+    state.save(new_count=2)
+    assert state.high_water_marks == {'published': '2021-02-01T00:00:00Z',
+                                      'updated': '2021-02-02T00:00:00Z'}
+
+    resumed = SyncState('aoi', search_request(0.2), state_dir=tmp_path)
+    assert resumed.high_water_marks == state.high_water_marks
+    for name, sr in [('aoi', search_request(0.5)),
+                     ('other', search_request(0.2))]:
+        other = SyncState(name, sr, state_dir=tmp_path)
+        assert other.path != state.path
+        assert other.high_water_marks == {'published': None,
+                                          'updated': None}
+
+
+class Postgres:
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        pass
+
+    def upsert_records(self, records, table, dryrun=False):
+        return list(records['id'])
+
+
+@pytest.fixture
+def fetched(tmp_path, monkeypatch):
+    fetched = []
+
+    def fetch_search_request(sr, overwrite_saved=False):
+        fetched.append(sr)
+        return footprints, None
+    monkeypatch.setattr(sync, 'get_cache_dir', lambda subdir: tmp_path)
+    monkeypatch.setattr(sync, 'fetch_search_request', fetch_search_request)
+    monkeypatch.setattr(sync, 'Postgres', Postgres)
+    return fetched
+
+
+def test_syncs_with_different_filters(fetched):
+    for max_cc in (0.2, 0.5, 0.2):
+        sync_scenes('aoi', item_types=['PSScene'],
+                    attrib_args={'max_cc': max_cc})
+    first, second, third = fetched
+    # Each filter starts from all matching items, only a rerun of the
+    # same sync is limited to items since its high-water marks
+    assert first['filter']['type'] == 'RangeFilter'
+    assert second['filter']['type'] == 'RangeFilter'
+    assert second['filter']['config'] == {'lte': 0.5}
+    assert third['filter']['type'] == 'AndFilter'
@@ -0,0 +1,96 @@
+import pytest
+
+from lib import transport
+from lib.transport import CircuitBreaker, RateLimiter, RetryBudget
+
+
+class FakeClock:
+    """Stands in for time.monotonic and time.sleep, sleeping advancing
+    the clock, so that waits are checked without sleeping."""
+    def __init__(self):
+        self.now = 100.0
+        self.sleeps = []
+
+    def monotonic(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.sleeps.append(seconds)
+        self.now += seconds
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = FakeClock()
+    monkeypatch.setattr(transport.time, 'monotonic', clock.monotonic)
+    monkeypatch.setattr(transport.time, 'sleep', clock.sleep)
+    return clock
+
+
+def test_rate_limiter_burst(clock):
+    limiter = RateLimiter(5)
+    for _ in range(5):
+        limiter.acquire()
+    assert clock.sleeps == []
+    limiter.acquire()
+    assert clock.sleeps == [pytest.approx(0.2)]
+
+
+def test_rate_limiter_refill(clock):
+    limiter = RateLimiter(2, burst=2)
+    limiter.acquire(2)
+    clock.now += 1
+    limiter.acquire(2)
+    assert clock.sleeps == []
+    # Larger than the burst, waits for the tokens owed
+    limiter.acquire(4)
+    assert clock.sleeps == [pytest.approx(2)]
+
+
+def test_retry_budget():
+    budget = RetryBudget(ratio=0.5, minimum=2)
+    assert budget.withdraw()
+    assert budget.withdraw()
+    assert not budget.withdraw()
+    budget.deposit()
+    assert not budget.withdraw()
+    budget.deposit()
+    assert budget.withdraw()
+
+
+def test_retry_budget_capped():
+    budget = RetryBudget(ratio=0.5, minimum=2)
+    for _ in range(10000):
+        budget.deposit()
+    assert budget.balance == 2 + 0.5 * 1000
+
+
+def test_circuit_breaker(clock):
+    breaker = CircuitBreaker(threshold=3, reset=30)
+    for _ in range(2):
+        breaker.record_failure()
+    assert breaker.allow()
+    breaker.record_failure()
+    assert not breaker.allow()
+
+    # One trial request after reset, others held back
+    clock.now += 30
+    assert breaker.allow()
+    assert not breaker.allow()
+    # Trial failed, open for another reset
+    breaker.record_failure()
+    clock.now += 29
+    assert not breaker.allow()
+    clock.now += 1
+    assert breaker.allow()
+    breaker.record_success()
+    assert breaker.allow()
+    assert breaker.allow()
+
+
+def test_circuit_breaker_success_resets(clock):
+    breaker = CircuitBreaker(threshold=2, reset=30)
+    breaker.record_failure()
+    breaker.record_success()
+    breaker.record_failure()
+    assert breaker.allow()